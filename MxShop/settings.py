@@ -182,14 +182,20 @@ REST_FRAMEWORK = {
         # 'rest_framework_jwt.authentication.JSONWebTokenAuthentication',  # json web token方式获取用户
     ),
     # 限速类（设置在settings是全局，可单独设置在viewset中）
+    # 滑动窗口限流，计数保存在共享的缓存（redis）中，所有进程共用
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.AnonRateThrottle', # 未登录（通过ip判断）
-        'rest_framework.throttling.UserRateThrottle' # 已登录（通过token判断）
+        'utils.throttling.AnonSlidingWindowThrottle', # 未登录（通过ip判断）
+        'utils.throttling.UserSlidingWindowThrottle' # 已登录（通过token判断）
     ),
     # 限制速率（day，hour，minute）
+    # goods、suggest、sms、login为各接口单独的速率（view中设置throttle_scope，使用ScopedSlidingWindowThrottle）
     'DEFAULT_THROTTLE_RATES': {
         'anon': '2/minute',
-        'user': '5/minute'
+        'user': '5/minute',
+        'goods': '60/minute',
+        'suggest': '120/minute',
+        'sms': '5/hour',
+        'login': '10/minute'
     }
 }
 
@@ -213,22 +219,73 @@ APIKEY = '93af765b45a8d5cd804c6c83e1150fcc'
 alipay_private_key = os.path.join(BASE_DIR,'apps/trade/keys/private_2048.txt')
 alipay_pub_key = os.path.join(BASE_DIR,'apps/trade/keys/alipay_key_2048.txt')
 
+# 支付宝支付url缓存时间（秒），url中的时间戳超过该时间后重新签名生成
+ALIPAY_URL_TIMEOUT = 60 * 10
+
+# 支付宝异步通知是否放入队列由后台线程处理（True时验签并保存通知后即返回success，处理失败的通知由后台线程重试）
+ALIPAY_NOTIFY_ASYNC = False
+
 # rest_framework_extensions缓存时间设置（秒）
 REST_FRAMEWORK_EXTENSIONS = {
     # 'DEFAULT_CACHE_RESPONSE_TIMEOUT': 60 * 15
     'DEFAULT_CACHE_RESPONSE_TIMEOUT': 60
 }
 
-# 配置缓存系统为redis缓存（django默认使用内存做缓存）
-# CACHES = {
-#     "default": {
-#         "BACKEND": "django_redis.cache.RedisCache",
-#         "LOCATION": "redis://127.0.0.1:6379/1",
-#         "OPTIONS": {
-#             "CLIENT_CLASS": "django_redis.client.DefaultClient",
-#         }
-#     }
-# }
+# 接口缓存过期后，重新计算期间其它请求仍返回旧数据的时间（秒）
+API_CACHE_STALE_TIMEOUT = 30
+# 重新计算缓存时加锁的最长时间（秒），没有旧数据的请求最多等待这么久
+API_CACHE_LOCK_TIMEOUT = 10
+
+# 首页、轮播图、分类快照的缓存时间（秒），数据修改时通过signal自动失效
+SNAPSHOT_CACHE_TIMEOUT = 60 * 60 * 24
+# 网站地址，快照中的图片等绝对地址使用该域名生成（不使用请求中的Host）
+SITE_URL = 'http://123.206.229.93:8000/'
+
+# 商品点击数定时批量写入的间隔（秒），以及缓冲商品数达到多少时提前写入
+CLICK_COUNTER_FLUSH_INTERVAL = 10
+CLICK_COUNTER_MAX_PENDING = 1000
+
+# 游标分页时返回的总数的缓存时间（秒）
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+
+# 商品列表是否使用内存列存储进行过滤排序（需要安装numpy），以及列存储整体重新加载的间隔（秒）
+GOODS_COLUMN_FILTER = False
+GOODS_COLUMN_FILTER_MAX_AGE = 60 * 5
+
+# 商品列表分面统计的价格区间分界（元），如 (20, 50) 表示 0-20、20-50、50以上 三个区间
+GOODS_PRICE_FACET_BOUNDARIES = (20, 50, 100, 200)
+
+# 搜索联想前缀树的重建间隔（秒）
+SUGGEST_REBUILD_INTERVAL = 60 * 5
+
+# 购物车预留库存的过期时间（分钟），超时未修改的购物车记录由release_expired_carts命令清除并归还库存
+# 为None时不过期
+CART_RESERVATION_TIMEOUT = None
+
+# 配置缓存系统为redis缓存（django默认使用内存做缓存，每个进程各有一份，无法共享和统一失效）
+# 接口缓存、快照、版本号都保存在redis中，所有进程共享
+# 本地没有redis时可以安装fakeredis，在OPTIONS中加入 "REDIS_CLIENT_CLASS": "fakeredis.FakeStrictRedis"
+CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/1",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    }
+}
+# redis不可用时缓存读取返回None（当作未命中），写入、计数被忽略，接口退化为直接查询数据库，而不是返回500
+# 忽略的异常记录到django_redis.cache logger
+DJANGO_REDIS_IGNORE_EXCEPTIONS = True
+DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+# 运行测试（manage.py test）时使用进程内的LocMemCache，不需要redis服务
+# 否则redis不可用时缓存读写被静默忽略，快照、限流等测试会以断言失败的形式出错
+if len(sys.argv) > 1 and sys.argv[1] == 'test':
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
 
 # 第三方登录
 SOCIAL_AUTH_WEIBO_KEY = '3366751802'
@@ -19,7 +19,6 @@ from django.views.static import serve
 from rest_framework.documentation import include_docs_urls
 from rest_framework import routers
 from rest_framework.authtoken import views
-from rest_framework_jwt.views import obtain_jwt_token
 
 import xadmin
 
@@ -44,6 +43,7 @@ router.register(r'shopcarts', tarde_views.ShoppingCartViewset, base_name='shopca
 router.register(r'orders', tarde_views.OrderViewset, base_name='orders')
 router.register(r'banners', good_views.BannerViewset, base_name='banners')
 router.register(r'indexgoods', good_views.IndexGoodsViewset, base_name='indexgoods')
+router.register(r'hotsearchs', good_views.HotSearchsViewset, base_name='hotsearchs')
 
 from trade.views import AlipayView
 from django.views.generic import TemplateView
@@ -74,10 +74,13 @@ urlpatterns = [
     #         'rest_framework_jwt.authentication.JSONWebTokenAuthentication'
     #     )
     # }
-    url(r'^login/$', obtain_jwt_token), # 加$，避免与第三方登录url产生冲突
+    url(r'^login/$', users_views.LoginView.as_view()), # 加$，避免与第三方登录url产生冲突（LoginView即obtain_jwt_token，另外加了限流）
 
     url(r'^', include(router.urls)),
 
+    # 搜索联想
+    url(r'^suggest/$', good_views.SuggestView.as_view(), name='suggest'),
+
     url(r'^alipay/return/', AlipayView.as_view(), name='alipay'),
 
     url(r'^index/',TemplateView.as_view(template_name='index.html'),name='index'),
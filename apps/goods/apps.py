@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class GoodsConfig(AppConfig):
     name = 'goods'
-    verbose_name = '商品'
\ No newline at end of file
+    verbose_name = '商品'
+
+    def ready(self):
+        # 注册信号
+        import goods.signals
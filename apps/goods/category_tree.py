@@ -0,0 +1,38 @@
+from django.conf import settings
+
+from .models import GoodsCategory
+from .serializers import CategorySerializer
+from .snapshot import get_snapshot_version,make_snapshot
+from utils.cache import get_or_compute
+
+CATEGORY_TREE_KEY = 'goods:category_tree:{version}'
+
+
+def load_category_tree():
+    """
+    一次查询加载全部类别，在内存中组装每个类别的sub_cat，返回一级类别列表
+    sub_cat按prefetch_related的方式放入_prefetched_objects_cache，CategorySerializer序列化时不再逐层查询
+    """
+    categories = list(GoodsCategory.objects.order_by('id'))
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_category_id, []).append(category)
+    for category in categories:
+        sub_cat = category.sub_cat.all()
+        sub_cat._result_cache = children.get(category.id, [])
+        sub_cat._prefetch_done = True
+        category._prefetched_objects_cache = {'sub_cat': sub_cat}
+    return [category for category in categories if category.category_type == 1]
+
+
+def get_category_tree():
+    """
+    返回类别树快照 (一级类别列表的快照, {一级类别id: 该类别的快照})，快照为 (ETag, json bytes)
+    按categories快照版本号缓存，类别修改时由signals更新版本号
+    """
+    def build():
+        data = CategorySerializer(load_category_tree(), many=True).data
+        return make_snapshot(data), {item['id']: make_snapshot(item) for item in data}
+
+    key = CATEGORY_TREE_KEY.format(version=get_snapshot_version('categories'))
+    return get_or_compute(key, build, settings.SNAPSHOT_CACHE_TIMEOUT, lock_timeout=settings.API_CACHE_LOCK_TIMEOUT)
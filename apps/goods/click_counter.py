@@ -0,0 +1,88 @@
+import os
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections,transaction
+from django.db.models import F
+
+from .models import Goods
+
+logger = logging.getLogger(__name__)
+
+
+class ClickCounter(object):
+    """
+    商品点击数计数器
+    点击数先在进程内缓冲，由后台线程定时合并写入数据库：
+    相同增量的商品合并成一条 UPDATE ... SET click_num = click_num + n WHERE id IN (...)
+    """
+    def __init__(self, flush_interval=10, max_pending=1000):
+        self.flush_interval = flush_interval  # 定时写入间隔（秒）
+        self.max_pending = max_pending  # 缓冲的商品数超过该值时提前写入
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None  # 记录启动线程的进程，fork出的子进程需要重新启动线程
+
+    def incr(self, goods_id, count=1):
+        with self._lock:
+            self._pending[goods_id] += count
+            pending = len(self._pending)
+        self._ensure_started()
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        将缓冲的点击数写入数据库
+        :return: 更新的商品数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        if not pending:
+            return 0
+
+        groups = defaultdict(list)
+        for goods_id, count in pending.items():
+            groups[count].append(goods_id)
+        try:
+            # 所有分组在一个事务中写入，失败时全部回滚，放回缓冲的点击数不会重复计入
+            with transaction.atomic():
+                for count, goods_ids in groups.items():
+                    Goods.objects.filter(id__in=goods_ids).update(click_num=F('click_num') + count)
+        except Exception:
+            # 写入失败时放回缓冲，下一次再写
+            logger.exception('click counter flush failed')
+            with self._lock:
+                for goods_id, count in pending.items():
+                    self._pending[goods_id] += count
+            return 0
+        return len(pending)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='click-counter-flush')
+            thread.daemon = True
+            thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+
+click_counter = ClickCounter(flush_interval=settings.CLICK_COUNTER_FLUSH_INTERVAL,
+                             max_pending=settings.CLICK_COUNTER_MAX_PENDING)
+
+# 进程退出时写入剩余的点击数
+atexit.register(click_counter.flush)
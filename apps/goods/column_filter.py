@@ -0,0 +1,297 @@
+import time
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework import filters
+from rest_framework.response import Response
+
+from .models import Goods,GoodsCategory,GoodsCategoryPath
+from utils.cache import get_model_versions
+from utils.eager_loading import setup_eager_loading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class GoodsColumnStore(object):
+    """
+    商品列存储：把商品的价格、热销/新品标记、类别和排序字段保存为紧凑的NumPy数组，
+    过滤和排序用向量化运算在内存中完成，只有当前页的商品才查询数据库
+
+    商品保存/删除时通过signal增量更新（见goods/signals.py），只更新当前进程的列存储，并同步记录的版本号；
+    其它进程中的修改通过共享的model版本号（utils.cache）感知，每次查询前比较，版本号变化时在后台重新加载
+    销量等通过F()批量更新的字段不会触发signal，也不更新版本号，因此数据超过max_age秒后同样在后台整体重新加载
+    """
+    # 可以在内存中处理的过滤字段及其对应的列
+    filter_columns = {
+        'pricemin': ('shop_price', 'gte'),
+        'pricemax': ('shop_price', 'lte'),
+        'is_hot': ('is_hot', 'exact'),
+        'is_new': ('is_new', 'exact'),
+    }
+    # 可以在内存中处理的排序字段
+    ordering_columns = ('sold_num', 'shop_price')
+    # 列存储依赖的model，版本号由goods/signals.py在事务提交后更新
+    version_models = (Goods, GoodsCategory)
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self.loaded_at = None
+        self.version = None
+        self.categories = None
+        self._lock = threading.Lock()
+        # 加载数据时持有，同一时间只有一个线程在加载
+        self._load_lock = threading.Lock()
+        self._reload_thread = None
+
+    @property
+    def available(self):
+        return np is not None
+
+    def get_version(self):
+        return get_model_versions(self.version_models)
+
+    def load(self):
+        # 先读取版本号再加载数据，加载过程中的修改会使版本号变化，下次查询时再次加载
+        version = self.get_version()
+        rows = list(Goods.objects.order_by('id').values_list(
+            'id', 'category_id', 'shop_price', 'is_hot', 'is_new', 'sold_num'))
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), 6)
+        ids = data[:, 0].astype(np.int64)
+        columns = {
+            'category': data[:, 1].astype(np.int64),
+            'shop_price': data[:, 2].copy(),
+            'is_hot': data[:, 3].astype(np.bool_),
+            'is_new': data[:, 4].astype(np.bool_),
+            'sold_num': data[:, 5].astype(np.int64),
+        }
+        with self._lock:
+            self.ids, self.columns = ids, columns
+            self.active = np.ones(len(rows), dtype=np.bool_)
+            self.id_sorted = True
+            self.categories = None
+            self.version = version
+            self.loaded_at = time.time()
+
+    def ensure_loaded(self):
+        if self.loaded_at is None:
+            with self._load_lock:
+                if self.loaded_at is None:
+                    self.load()
+        elif self.version != self.get_version() or time.time() - self.loaded_at > self.max_age:
+            # 其它进程修改了商品、类别，或数据过期：在后台重新加载，加载完成前继续使用旧数据
+            self.start_reload()
+
+    def start_reload(self):
+        # 拿不到锁说明已经有线程在加载
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            thread = threading.Thread(target=self._reload, name='goods-column-store')
+            thread.daemon = True
+            thread.start()
+        except Exception:
+            self._load_lock.release()
+            raise
+        self._reload_thread = thread
+
+    def _reload(self):
+        close_old_connections()
+        try:
+            self.load()
+        finally:
+            self._load_lock.release()
+            close_old_connections()
+
+    def advance_version(self, model):
+        """
+        当前进程已经增量应用了model的修改，共享版本号只比记录的版本号多1（只有这一次修改）时直接记录，不需要重新加载；
+        其它进程同时也有修改时版本号不止多1，仍由ensure_loaded在后台重新加载
+        signals.py中更新版本号的on_commit回调先于列存储的回调注册，执行到这里时版本号已经更新
+        """
+        if self.loaded_at is None:
+            return
+        versions = self.get_version()
+        index = self.version_models.index(model)
+        with self._lock:
+            if self.version is None or None in versions:
+                return
+            expected = list(self.version)
+            expected[index] += 1
+            if list(versions) == expected:
+                self.version = versions
+
+    def descendant_categories(self, category_id):
+        """
+        类别及其所有子类别的id（由类别闭包表加载，类别修改时清空）
+        """
+        categories = self.categories
+        if categories is None:
+            categories = {}
+            for ancestor_id, descendant_id in GoodsCategoryPath.objects.values_list('ancestor_id', 'descendant_id'):
+                categories.setdefault(ancestor_id, []).append(descendant_id)
+            categories = {key: np.array(value, dtype=np.int64) for key, value in categories.items()}
+            self.categories = categories
+        return categories.get(category_id, np.array([], dtype=np.int64))
+
+    def invalidate_categories(self):
+        self.categories = None
+        self.advance_version(GoodsCategory)
+
+    def update(self, goods):
+        """
+        商品保存后增量更新对应的行，新商品追加到末尾
+        """
+        if self.loaded_at is None:
+            return
+        values = {
+            'category': goods.category_id,
+            'shop_price': goods.shop_price,
+            'is_hot': goods.is_hot,
+            'is_new': goods.is_new,
+            'sold_num': goods.sold_num,
+        }
+        with self._lock:
+            position = self.position(goods.id)
+            if position is None:
+                if len(self.ids) and goods.id < self.ids[-1]:
+                    self.id_sorted = False
+                self.ids = np.append(self.ids, goods.id)
+                self.active = np.append(self.active, True)
+                for name, value in values.items():
+                    self.columns[name] = np.append(self.columns[name], np.array(value, dtype=self.columns[name].dtype))
+            else:
+                for name, value in values.items():
+                    self.columns[name][position] = value
+                self.active[position] = True
+        self.advance_version(Goods)
+
+    def position(self, goods_id):
+        positions = np.flatnonzero(self.ids == goods_id)
+        return positions[0] if len(positions) else None
+
+    def remove(self, goods_id):
+        if self.loaded_at is None:
+            return
+        with self._lock:
+            position = self.position(goods_id)
+            if position is not None:
+                self.active[position] = False
+        self.advance_version(Goods)
+
+    def query(self, filters_data, ordering=None):
+        """
+        :param filters_data: GoodsListFilter校验后的过滤条件
+        :param ordering: 排序字段，如'-sold_num'
+        :return: 按顺序排列的商品id数组
+        """
+        self.ensure_loaded()
+        with self._lock:
+            ids, columns = self.ids, self.columns
+            mask = self.active.copy()
+            for name, value in filters_data.items():
+                if value is None:
+                    continue
+                if name == 'top_category':
+                    mask &= np.isin(columns['category'], self.descendant_categories(int(value)))
+                    continue
+                column, lookup = self.filter_columns[name]
+                if lookup == 'gte':
+                    mask &= columns[column] >= float(value)
+                elif lookup == 'lte':
+                    mask &= columns[column] <= float(value)
+                else:
+                    mask &= columns[column] == value
+
+            rows = np.flatnonzero(mask)
+            if ordering:
+                key = columns[ordering.lstrip('-')][rows]
+                if ordering.startswith('-'):
+                    key = -key
+                # 排序值相同时按id排序，保证分页稳定
+                rows = rows[np.lexsort((ids[rows], key))]
+            elif not self.id_sorted:
+                rows = rows[np.argsort(ids[rows], kind='mergesort')]
+            return ids[rows]
+
+
+class ColumnQueryResult(object):
+    """
+    列存储的查询结果，供分页器使用：count()直接返回数量，切片时才查询当前页的商品
+    """
+    def __init__(self, ids, queryset, serializer_class):
+        self.ids = ids
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, item):
+        ids = self.ids[item].tolist()
+        if not isinstance(item, slice):
+            ids = [ids]
+        queryset = setup_eager_loading(self.queryset.filter(id__in=ids), self.serializer_class)
+        goods = {obj.id: obj for obj in queryset}
+        result = [goods[goods_id] for goods_id in ids if goods_id in goods]
+        return result if isinstance(item, slice) else result[0]
+
+
+class ColumnFilterMixin(object):
+    """
+    商品列表的过滤、排序条件都能由列存储处理时，在内存中完成过滤排序，只查询当前页的商品
+    其它情况（搜索、按名称过滤、游标分页等）仍由filter_backends生成SQL查询
+    需要安装NumPy，并在settings中设置GOODS_COLUMN_FILTER = True
+    """
+    column_store = None
+    # 不影响过滤结果的其它查询参数（如facets），带有这些参数时也可以使用列存储
+    column_filter_ignored_params = ()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.column_filter_queryset(request)
+        if queryset is None:
+            return super(ColumnFilterMixin, self).list(request, *args, **kwargs)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset[:], many=True)
+        return Response(serializer.data)
+
+    def column_filter_queryset(self, request):
+        store = self.column_store
+        if not settings.GOODS_COLUMN_FILTER or store is None or not store.available:
+            return None
+
+        # 只处理列存储支持的查询参数
+        filter_names = set(store.filter_columns) | {'top_category'}
+        allowed = filter_names | {filters.OrderingFilter.ordering_param, 'format'} | set(self.column_filter_ignored_params)
+        paginator = self.paginator
+        if paginator is not None:
+            allowed |= {paginator.page_query_param, paginator.page_size_query_param}
+        if not set(request.query_params) <= allowed:
+            return None
+
+        queryset = self.get_queryset()
+        filterset = self.filter_class(request.query_params, queryset=queryset, request=request)
+        if not filterset.form.is_valid():
+            return None
+        filters_data = {name: value for name, value in filterset.form.cleaned_data.items()
+                        if name in filter_names and value not in (None, '')}
+
+        ordering = filters.OrderingFilter().get_ordering(request, queryset, self) or []
+        if len(ordering) > 1 or (ordering and ordering[0].lstrip('-') not in store.ordering_columns):
+            return None
+
+        ids = store.query(filters_data, ordering[0] if ordering else None)
+        return ColumnQueryResult(ids, queryset, self.get_serializer_class())
+
+
+goods_column_store = GoodsColumnStore(max_age=settings.GOODS_COLUMN_FILTER_MAX_AGE)
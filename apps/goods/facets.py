@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, When, Value, IntegerField, Count
+
+from .models import Goods,GoodsCategoryPath
+from .snapshot import get_snapshot_version
+
+FACET_CATEGORIES_KEY = 'goods:facet:categories:{version}'
+
+
+def price_buckets():
+    """
+    根据GOODS_PRICE_FACET_BOUNDARIES生成价格区间 [(min, max)]，最后一个区间没有上限
+    """
+    boundaries = list(settings.GOODS_PRICE_FACET_BOUNDARIES)
+    return list(zip([0] + boundaries, boundaries + [None]))
+
+
+def category_ancestors():
+    """
+    每个类别对应的一级、二级类别 {类别id: {1: (id, name), 2: (id, name)}}
+    类别修改时categories快照版本号会变化，缓存随之失效
+    """
+    key = FACET_CATEGORIES_KEY.format(version=get_snapshot_version('categories'))
+    ancestors = cache.get(key)
+    if ancestors is None:
+        ancestors = {}
+        paths = GoodsCategoryPath.objects.filter(ancestor__category_type__in=(1, 2)).values_list(
+            'descendant_id', 'ancestor_id', 'ancestor__category_type', 'ancestor__name')
+        for descendant_id, ancestor_id, category_type, name in paths:
+            ancestors.setdefault(descendant_id, {})[category_type] = (ancestor_id, name)
+        cache.set(key, ancestors, settings.SNAPSHOT_CACHE_TIMEOUT)
+    return ancestors
+
+
+def goods_facets(queryset):
+    """
+    统计当前过滤条件下各一级类别、二级类别、价格区间、热销、新品的商品数
+    一次GROUP BY查询得到 (类别, 价格区间, 是否热销, 是否新品) 的组合计数，再在内存中汇总
+    """
+    # 搜索时queryset带有聚合的相关度，先取出商品id作为子查询，避免与分组统计互相干扰
+    if queryset.query.annotations:
+        queryset = Goods.objects.filter(id__in=queryset.order_by().values('id'))
+
+    buckets = price_buckets()
+    whens = [When(shop_price__lt=high, then=Value(i)) for i, (low, high) in enumerate(buckets) if high is not None]
+    rows = queryset.order_by().annotate(
+        price_bucket=Case(*whens, default=Value(len(buckets) - 1), output_field=IntegerField())
+    ).values_list('category_id', 'price_bucket', 'is_hot', 'is_new').annotate(count=Count('id'))
+
+    ancestors = category_ancestors()
+    categories = {1: {}, 2: {}}
+    price_counts = [0] * len(buckets)
+    hot_counts, new_counts = {True: 0, False: 0}, {True: 0, False: 0}
+    for category_id, bucket, is_hot, is_new, count in rows:
+        for category_type, (ancestor_id, name) in ancestors.get(category_id, {}).items():
+            facet = categories[category_type].setdefault(ancestor_id, {'id': ancestor_id, 'name': name, 'count': 0})
+            facet['count'] += count
+        price_counts[bucket] += count
+        hot_counts[bool(is_hot)] += count
+        new_counts[bool(is_new)] += count
+
+    def sort_categories(facets):
+        return sorted(facets.values(), key=lambda facet: (-facet['count'], facet['id']))
+
+    return {
+        'top_category': sort_categories(categories[1]),
+        'second_category': sort_categories(categories[2]),
+        'price': [{'min': low, 'max': high, 'count': count} for (low, high), count in zip(buckets, price_counts)],
+        'is_hot': [{'value': value, 'count': hot_counts[value]} for value in (True, False)],
+        'is_new': [{'value': value, 'count': new_counts[value]} for value in (True, False)],
+    }
+
+
+class FacetMixin(object):
+    """
+    请求带有facets参数时（?facets=1），在分页结果中增加facets字段，返回当前过滤条件下的分面统计
+    """
+    facets_query_param = 'facets'
+
+    facet_queryset = None
+
+    def filter_queryset(self, queryset):
+        queryset = super(FacetMixin, self).filter_queryset(queryset)
+        # 记录list()过滤后的queryset，统计分面时直接复用，不再重复执行过滤（搜索的关联、聚合）
+        self.facet_queryset = queryset
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        self.facet_queryset = None
+        response = super(FacetMixin, self).list(request, *args, **kwargs)
+        if request.query_params.get(self.facets_query_param) and isinstance(response.data, dict):
+            queryset = self.facet_queryset
+            if queryset is None:
+                # 由列存储处理的请求没有调用filter_queryset
+                queryset = self.filter_queryset(self.get_queryset())
+            response.data['facets'] = goods_facets(queryset)
+        return response
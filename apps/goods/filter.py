@@ -1,5 +1,4 @@
 from django_filters import rest_framework as filters
-from django.db.models import Q
 
 from .models import Goods
 
@@ -23,7 +22,8 @@ class GoodsListFilter(filters.FilterSet):
     # 参数（固定）：self, queryset(数据集合), name(参数名), value(传过来的值)
     # 返回：过滤后的queryset
     def top_category_filter(self, queryset, name, value):
-        return queryset.filter(Q(category_id=value)|Q(category__parent_category_id=value)|Q(category__parent_category__parent_category_id=value))
+        # 通过类别闭包表一次等值查询即可获得该类别及其所有子类别下的商品
+        return queryset.filter(category__ancestor_paths__ancestor_id=value)
 
     class Meta:
         model = Goods  # 绑定model
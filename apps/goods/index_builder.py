@@ -0,0 +1,59 @@
+from django.db.models import F
+
+from .models import Goods,IndexAd
+from .serializers import GoodsSerializer,IndexGoodsSerializer
+
+
+class IndexGoodsBuilder(object):
+    """
+    首页商品数据构建
+    一次性批量取出所有导航类别的子类别、品牌、广告商品和商品，在内存中分组，
+    查询数固定（与导航类别数量无关），返回与IndexGoodsSerializer相同结构的数据
+    """
+    def __init__(self, request):
+        self.request = request
+        self.context = {'request': request, 'index_builder': self}
+        self._goods_data = {}  # goods_id -> 序列化后的商品数据（每个商品只序列化一次）
+        self._goods_ids = {}   # 类别id -> 商品id列表
+        self._ad_goods_ids = {}  # 类别id -> 广告商品id
+
+    def load(self, categories):
+        # 子类别（二级、三级）和品牌通过prefetch各用一次查询
+        categories = list(categories.prefetch_related('sub_cat__sub_cat', 'brands'))
+        category_ids = [category.id for category in categories]
+
+        # 广告商品：每个类别取第一条
+        ads = IndexAd.objects.filter(category_id__in=category_ids).order_by('id').values_list('category_id', 'goods_id')
+        for category_id, goods_id in ads:
+            self._ad_goods_ids.setdefault(category_id, goods_id)
+
+        # 类别及其所有子类别下的商品：通过闭包表一次查出，tab_id标明所属的导航类别
+        rows = (Goods.objects.filter(category__ancestor_paths__ancestor_id__in=category_ids)
+                .annotate(tab_id=F('category__ancestor_paths__ancestor_id'))
+                .values_list('tab_id', 'id').order_by('id'))
+        for tab_id, goods_id in rows:
+            self._goods_ids.setdefault(tab_id, []).append(goods_id)
+
+        # 所有涉及的商品一次取出并序列化
+        goods_ids = set(self._ad_goods_ids.values())
+        for ids in self._goods_ids.values():
+            goods_ids.update(ids)
+        goods = Goods.objects.filter(id__in=goods_ids).select_related('category').prefetch_related('images')
+        for goods_json in GoodsSerializer(goods, many=True, context={'request': self.request}).data:
+            self._goods_data[goods_json['id']] = goods_json
+        return categories
+
+    def goods_data(self, category_id):
+        return [self._goods_data[goods_id] for goods_id in self._goods_ids.get(category_id, [])]
+
+    def ad_goods_data(self, category_id):
+        goods_id = self._ad_goods_ids.get(category_id)
+        return self._goods_data.get(goods_id, {})
+
+    def build(self, categories):
+        """
+        :param categories: 导航类别的queryset
+        :return: 首页数据（list）
+        """
+        categories = self.load(categories)
+        return IndexGoodsSerializer(categories, many=True, context=self.context).data
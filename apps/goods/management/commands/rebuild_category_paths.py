@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from goods.models import GoodsCategoryPath
+
+
+class Command(BaseCommand):
+    """
+    根据现有类别数据重建类别闭包表
+    python manage.py rebuild_category_paths
+    """
+    help = '重建类别闭包表（GoodsCategoryPath）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', type=int, default=None, help='只重建该类别及其子类别')
+
+    def handle(self, *args, **options):
+        count = GoodsCategoryPath.objects.rebuild(category_id=options['category'])
+        self.stdout.write(self.style.SUCCESS('已写入{}条闭包记录'.format(count)))
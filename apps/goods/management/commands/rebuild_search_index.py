@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from goods.search import rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    根据现有商品数据重建搜索索引
+    python manage.py rebuild_search_index
+    """
+    help = '重建商品搜索索引（GoodsSearchToken）'
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS('已索引{}个商品'.format(count)))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0005_indexad'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodsCategoryPath',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField(default=0, verbose_name='层级距离')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_paths', to='goods.GoodsCategory', verbose_name='祖先类别')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_paths', to='goods.GoodsCategory', verbose_name='后代类别')),
+            ],
+            options={
+                'verbose_name': '类别闭包',
+                'verbose_name_plural': '类别闭包',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='goodscategorypath',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 14:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0006_goodscategorypath'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodsSearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=50, verbose_name='词')),
+                ('weight', models.IntegerField(default=0, verbose_name='权重')),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='goods.Goods', verbose_name='商品')),
+            ],
+            options={
+                'verbose_name': '商品搜索索引',
+                'verbose_name_plural': '商品搜索索引',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='goodssearchtoken',
+            unique_together=set([('token', 'goods')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 15:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0007_goodssearchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotSearchWords',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('keywords', models.CharField(default='', max_length=20, verbose_name='热搜词')),
+                ('index', models.IntegerField(default=0, verbose_name='排序')),
+                ('add_time', models.DateTimeField(auto_now_add=True, verbose_name='添加时间')),
+            ],
+            options={
+                'verbose_name': '热搜词',
+                'verbose_name_plural': '热搜词',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 16:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0008_hotsearchwords'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='goods',
+            name='shop_price',
+            field=models.FloatField(db_index=True, default=0, verbose_name='本店价格'),
+        ),
+        migrations.AlterField(
+            model_name='goods',
+            name='sold_num',
+            field=models.IntegerField(db_index=True, default=0, verbose_name='销售量'),
+        ),
+    ]
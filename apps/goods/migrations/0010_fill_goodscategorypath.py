@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def fill_category_paths(apps, schema_editor):
+    """
+    根据已有的类别数据填充类别闭包表（与GoodsCategoryPath.objects.rebuild()相同，迁移中不能使用自定义manager）
+    """
+    GoodsCategory = apps.get_model('goods', 'GoodsCategory')
+    GoodsCategoryPath = apps.get_model('goods', 'GoodsCategoryPath')
+    db_alias = schema_editor.connection.alias
+
+    parents = dict(GoodsCategory.objects.using(db_alias).values_list('id', 'parent_category_id'))
+    paths = []
+    for cat_id in parents:
+        ancestor_id, depth = cat_id, 0
+        while ancestor_id is not None and depth <= len(parents):
+            paths.append(GoodsCategoryPath(ancestor_id=ancestor_id, descendant_id=cat_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+
+    GoodsCategoryPath.objects.using(db_alias).all().delete()
+    GoodsCategoryPath.objects.using(db_alias).bulk_create(paths, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0009_goods_ordering_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
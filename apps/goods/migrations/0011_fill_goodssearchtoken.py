@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from goods.search import goods_tokens
+
+
+def fill_search_tokens(apps, schema_editor):
+    """
+    为已有的商品建立搜索索引（与goods.search.rebuild_index()相同，迁移中使用历史版本的model）
+    GoodsSearchFilter替换了SearchFilter，索引为空时搜索不到任何商品
+    """
+    Goods = apps.get_model('goods', 'Goods')
+    GoodsSearchToken = apps.get_model('goods', 'GoodsSearchToken')
+    db_alias = schema_editor.connection.alias
+
+    GoodsSearchToken.objects.using(db_alias).all().delete()
+    goods_list = Goods.objects.using(db_alias).only('id', 'name', 'goods_brief', 'goods_desc').order_by('id')
+    tokens = []
+    for goods in goods_list.iterator():
+        tokens.extend(GoodsSearchToken(token=token, goods_id=goods.id, weight=weight)
+                      for token, weight in goods_tokens(goods).items())
+        if len(tokens) >= 500:
+            GoodsSearchToken.objects.using(db_alias).bulk_create(tokens)
+            tokens = []
+    GoodsSearchToken.objects.using(db_alias).bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0010_fill_goodscategorypath'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_tokens, migrations.RunPython.noop),
+    ]
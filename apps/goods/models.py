@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 from DjangoUeditor.models import UEditorField
 
@@ -31,6 +31,64 @@ class GoodsCategory(models.Model):
         return self.name
 
 
+class GoodsCategoryPathManager(models.Manager):
+    def rebuild(self, category_id=None):
+        """
+        重建类别闭包表
+        :param category_id: 只重建该类别及其子类别，为None时重建全部
+        :return: 写入的记录数
+        """
+        # 类别数据量小（约600条），一次取出后在内存中计算祖先关系
+        parents = dict(GoodsCategory.objects.values_list('id', 'parent_category_id'))
+        if category_id is None:
+            targets = set(parents)
+        else:
+            children = {}
+            for cat_id, parent_id in parents.items():
+                children.setdefault(parent_id, []).append(cat_id)
+            targets = set()
+            stack = [category_id] if category_id in parents else []
+            while stack:
+                cat_id = stack.pop()
+                targets.add(cat_id)
+                stack.extend(children.get(cat_id, []))
+
+        paths = []
+        for cat_id in targets:
+            ancestor_id, depth = cat_id, 0
+            # 自身也作为一条depth=0的记录，这样按任意级别类别过滤都只需一次等值查询
+            while ancestor_id is not None and depth <= len(parents):
+                paths.append(self.model(ancestor_id=ancestor_id, descendant_id=cat_id, depth=depth))
+                ancestor_id, depth = parents.get(ancestor_id), depth + 1
+
+        with transaction.atomic():
+            if category_id is None:
+                self.all().delete()
+            else:
+                self.filter(descendant_id__in=targets).delete()
+            self.bulk_create(paths)
+        return len(paths)
+
+
+class GoodsCategoryPath(models.Model):
+    """
+    类别闭包表（祖先-后代关系）
+    """
+    ancestor = models.ForeignKey(GoodsCategory,verbose_name='祖先类别',related_name='descendant_paths')
+    descendant = models.ForeignKey(GoodsCategory,verbose_name='后代类别',related_name='ancestor_paths')
+    depth = models.IntegerField('层级距离',default=0)
+
+    objects = GoodsCategoryPathManager()
+
+    class Meta:
+        verbose_name = '类别闭包'
+        verbose_name_plural = verbose_name
+        unique_together = ('ancestor','descendant')
+
+    def __str__(self):
+        return '{}->{}'.format(self.ancestor_id,self.descendant_id)
+
+
 class GoodsCategoryBrand(models.Model):
     """
     品牌名
@@ -57,11 +115,11 @@ class Goods(models.Model):
     goods_sn = models.CharField('商品唯一货号',max_length=50,default="")
     name  = models.CharField('商品名',max_length=300)
     click_num = models.IntegerField('点击数',default=0)
-    sold_num = models.IntegerField('销售量',default=0)
+    sold_num = models.IntegerField('销售量',default=0,db_index=True)
     fav_num = models.IntegerField('收藏数',default=0)
     goods_num = models.IntegerField('库存数',default=0)
     market_price = models.FloatField('市场价格',default=0)
-    shop_price = models.FloatField('本店价格',default=0)
+    shop_price = models.FloatField('本店价格',default=0,db_index=True)
     goods_brief = models.TextField('商品简短描述',)
     goods_desc = UEditorField(verbose_name='内容', imagePath='goods/images/',width=1000,height=300,
                               filePath='goods/files/',default='')
@@ -79,6 +137,23 @@ class Goods(models.Model):
         return self.name
 
 
+class GoodsSearchToken(models.Model):
+    """
+    商品搜索倒排索引（由goods.search维护）
+    """
+    token = models.CharField('词',max_length=50,db_index=True)
+    goods = models.ForeignKey(Goods,verbose_name='商品',related_name='search_tokens')
+    weight = models.IntegerField('权重',default=0)
+
+    class Meta:
+        verbose_name = '商品搜索索引'
+        verbose_name_plural = verbose_name
+        unique_together = ('token','goods')
+
+    def __str__(self):
+        return self.token
+
+
 class GoodsImage(models.Model):
     """
     商品轮播图
@@ -121,4 +196,20 @@ class IndexAd(models.Model):
         verbose_name_plural = verbose_name
 
     def __str__(self):
-        return self.goods.name
\ No newline at end of file
+        return self.goods.name
+
+
+class HotSearchWords(models.Model):
+    """
+    热搜词
+    """
+    keywords = models.CharField('热搜词',default='',max_length=20)
+    index = models.IntegerField('排序',default=0)
+    add_time = models.DateTimeField('添加时间',auto_now_add=True)
+
+    class Meta:
+        verbose_name = '热搜词'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.keywords
@@ -0,0 +1,121 @@
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils.html import strip_tags
+from rest_framework import filters
+
+from .models import Goods,GoodsSearchToken
+
+# 中文（CJK统一汉字）连续片段，以及英文、数字组成的词
+TOKEN_RE = re.compile(r'[\u4e00-\u9fff]+|[a-z0-9]+')
+TOKEN_MAX_LENGTH = 50
+
+# 各字段的权重，商品名命中的排序最靠前
+FIELD_WEIGHTS = (
+    ('name', 10),
+    ('goods_brief', 3),
+    ('goods_desc', 1),
+)
+
+
+def is_cjk(text):
+    return '\u4e00' <= text[0] <= '\u9fff'
+
+
+def tokenize(text, for_query=False):
+    """
+    分词：中文按二元组（bigram）切分，英文、数字按词切分
+    建索引时中文额外保留单字，这样单字查询也能命中；查询时只有单字片段才使用单字
+    """
+    tokens = []
+    for part in TOKEN_RE.findall(text.lower()):
+        if not is_cjk(part):
+            tokens.append(part[:TOKEN_MAX_LENGTH])
+            continue
+        if len(part) == 1 or not for_query:
+            tokens.extend(part)
+        tokens.extend(part[i:i + 2] for i in range(len(part) - 1))
+    return tokens
+
+
+def goods_tokens(goods):
+    """
+    :return: {token: weight}
+    """
+    weights = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        text = getattr(goods, field) or ''
+        if field == 'goods_desc':
+            # 商品详情是UEditor的html，只索引其中的文字
+            text = strip_tags(text)
+        for token in tokenize(text):
+            weights[token] += weight
+    return weights
+
+
+def index_goods(goods):
+    """
+    重建单个商品的索引（商品保存时调用）
+    """
+    tokens = goods_tokens(goods)
+    with transaction.atomic():
+        GoodsSearchToken.objects.filter(goods_id=goods.id).delete()
+        GoodsSearchToken.objects.bulk_create(
+            GoodsSearchToken(token=token, goods_id=goods.id, weight=weight) for token, weight in tokens.items()
+        )
+
+
+def rebuild_index(batch_size=500):
+    """
+    重建全部商品的索引
+    :return: 索引的商品数
+    """
+    count = 0
+    with transaction.atomic():
+        GoodsSearchToken.objects.all().delete()
+        goods_list = Goods.objects.only('id', 'name', 'goods_brief', 'goods_desc').order_by('id')
+        tokens = []
+        for goods in goods_list.iterator():
+            count += 1
+            tokens.extend(GoodsSearchToken(token=token, goods_id=goods.id, weight=weight)
+                          for token, weight in goods_tokens(goods).items())
+            if len(tokens) >= batch_size:
+                GoodsSearchToken.objects.bulk_create(tokens)
+                tokens = []
+        GoodsSearchToken.objects.bulk_create(tokens)
+    return count
+
+
+def search_queryset(queryset, text):
+    """
+    在queryset中搜索text：必须命中所有词，按命中词的权重之和从高到低排序
+    """
+    tokens = set(tokenize(text, for_query=True))
+    if not tokens:
+        return queryset
+    return (queryset.filter(search_tokens__token__in=tokens)
+            .annotate(search_score=Sum('search_tokens__weight'),
+                      search_matched=Count('search_tokens__token', distinct=True))
+            .filter(search_matched=len(tokens))
+            .order_by('-search_score', 'id'))
+
+
+def search_goods_ids(text, limit=100):
+    """
+    :return: 按相关度排序的商品id列表
+    """
+    return list(search_queryset(Goods.objects.all(), text).values_list('id', flat=True)[:limit])
+
+
+class GoodsSearchFilter(filters.SearchFilter):
+    """
+    基于倒排索引的搜索后端，替代SearchFilter对多个文本字段的LIKE '%词%'全表扫描
+    参数名与SearchFilter相同（?search=），未传ordering时按相关度排序
+    """
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+        return search_queryset(queryset, text)
@@ -1,7 +1,7 @@
 from rest_framework import serializers
-from django.db.models import Q
 
-from .models import Goods,GoodsCategory,GoodsImage,Banner,IndexAd,GoodsCategoryBrand
+from .models import Goods,GoodsCategory,GoodsImage,Banner,IndexAd,GoodsCategoryBrand,HotSearchWords
+from utils.eager_loading import setup_eager_loading
 
 
 # **********Serializer的作用是将数据库中的数据转换成json格式*******
@@ -84,6 +84,10 @@ class IndexGoodsSerializer(serializers.ModelSerializer):
     # 动态生成ad_goods字段
     # 因为只要返回IndexAd的goods数据，category数据不需要返回，所以使用get方法获取当前id对应的goods数据
     def get_ad_goods(self, obj):
+        # 由IndexGoodsBuilder批量构建时直接使用预先加载的数据
+        builder = self.context.get('index_builder')
+        if builder is not None:
+            return builder.ad_goods_data(obj.id)
         goods_json = {}
         ad_goods = IndexAd.objects.filter(category_id=obj.id)
         if ad_goods:
@@ -93,7 +97,12 @@ class IndexGoodsSerializer(serializers.ModelSerializer):
 
     # 动态生成goods字段
     def get_goods(self, obj):
-        goods = Goods.objects.filter(Q(category_id=obj.id)|Q(category__parent_category_id=obj.id)|Q(category__parent_category__parent_category_id=obj.id))
+        builder = self.context.get('index_builder')
+        if builder is not None:
+            return builder.goods_data(obj.id)
+        # 通过类别闭包表获取该类别及其所有子类别下的商品
+        goods = Goods.objects.filter(category__ancestor_paths__ancestor_id=obj.id)
+        goods = setup_eager_loading(goods, GoodsSerializer)
         # context={'request':self.context['request']} 会自动将域名加到image的地址前面
         # 只有在serializer中调用serializer才需要传入这个参数
         serializer = GoodsSerializer(goods, many=True, context={'request':self.context['request']})
@@ -101,4 +110,10 @@ class IndexGoodsSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = GoodsCategory
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class HotSearchWordsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HotSearchWords
+        fields = "__all__"
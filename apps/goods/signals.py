@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models.signals import post_save,post_delete
+from django.dispatch import receiver
+
+from .models import Goods,GoodsCategory,GoodsCategoryPath,GoodsImage,GoodsCategoryBrand,Banner,IndexAd
+from .snapshot import bump_snapshot_version
+from .search import index_goods
+from .column_filter import goods_column_store
+from utils.cache import bump_model_version
+
+
+# 类别新增或修改父类别时，同步维护闭包表
+# 删除类别时闭包记录随外键级联删除，无需处理
+@receiver(post_save, sender=GoodsCategory)
+def sync_category_path(sender, instance=None, created=False, **kwargs):
+    if not created:
+        parent_ids = list(GoodsCategoryPath.objects.filter(descendant=instance, depth=1)
+                          .values_list('ancestor_id', flat=True))
+        # 父类别未变化，闭包关系不变
+        if parent_ids == ([instance.parent_category_id] if instance.parent_category_id else []):
+            return
+    GoodsCategoryPath.objects.rebuild(category_id=instance.id)
+
+
+# 首页快照依赖的model，数据变化时更新对应快照的版本号
+SNAPSHOT_DEPENDENCIES = {
+    'indexgoods': (Goods, GoodsImage, GoodsCategory, GoodsCategoryBrand, IndexAd),
+    'banners': (Banner,),
+    'categories': (GoodsCategory,),
+}
+# 计数字段：只修改这些字段时不刷新快照和搜索索引（点击数、销量等变化频繁，允许快照中略有滞后）
+COUNTER_FIELDS = {'click_num', 'sold_num', 'fav_num', 'goods_num'}
+
+
+# 版本号在事务提交后再更新：提交前更新的话，并发的请求会用旧数据生成新版本号的快照，并缓存SNAPSHOT_CACHE_TIMEOUT
+# （不在事务中时on_commit立即执行）
+def invalidate_snapshot(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= COUNTER_FIELDS:
+        return
+    for name, models in SNAPSHOT_DEPENDENCIES.items():
+        if sender in models:
+            transaction.on_commit(lambda name=name: bump_snapshot_version(name))
+
+
+for model in {model for models in SNAPSHOT_DEPENDENCIES.values() for model in models}:
+    post_save.connect(invalidate_snapshot, sender=model, dispatch_uid='snapshot_save_{}'.format(model.__name__))
+    post_delete.connect(invalidate_snapshot, sender=model, dispatch_uid='snapshot_delete_{}'.format(model.__name__))
+
+
+# 商品列表接口缓存依赖的model，数据变化时更新model版本号，缓存key随之变化
+GOODS_CACHE_MODELS = (Goods, GoodsCategory, GoodsImage)
+
+
+def invalidate_api_cache(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= COUNTER_FIELDS:
+        return
+    transaction.on_commit(lambda: bump_model_version(sender))
+
+
+for model in GOODS_CACHE_MODELS:
+    post_save.connect(invalidate_api_cache, sender=model, dispatch_uid='api_cache_save_{}'.format(model.__name__))
+    post_delete.connect(invalidate_api_cache, sender=model, dispatch_uid='api_cache_delete_{}'.format(model.__name__))
+
+
+# 商品保存时更新搜索索引（只修改计数字段时不需要）
+@receiver(post_save, sender=Goods)
+def update_search_index(sender, instance=None, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= COUNTER_FIELDS:
+        return
+    index_goods(instance)
+
+
+# 商品保存、删除时增量更新列存储（销量等计数字段也是排序字段，同样需要更新）
+# 同样在事务提交后执行，回滚的修改不会出现在列存储中
+# 这些receiver在invalidate_api_cache之后注册，执行时model版本号已经更新，列存储据此记录新的版本号，不必重新加载
+@receiver(post_save, sender=Goods)
+def update_column_store(sender, instance=None, **kwargs):
+    transaction.on_commit(lambda: goods_column_store.update(instance))
+
+
+@receiver(post_delete, sender=Goods)
+def remove_from_column_store(sender, instance=None, **kwargs):
+    # delete()完成后instance.id会被置为None，先取出id
+    transaction.on_commit(lambda goods_id=instance.id: goods_column_store.remove(goods_id))
+
+
+# 类别变化后重新加载类别与子类别的对应关系
+@receiver(post_save, sender=GoodsCategory)
+@receiver(post_delete, sender=GoodsCategory)
+def invalidate_column_store_categories(sender, **kwargs):
+    transaction.on_commit(goods_column_store.invalidate_categories)
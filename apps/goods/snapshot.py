@@ -0,0 +1,116 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from utils.cache import get_cache_version,bump_cache_version,get_or_compute
+
+SNAPSHOT_VERSION_KEY = 'goods:snapshot:version:{name}'
+SNAPSHOT_KEY = 'goods:snapshot:{name}:{version}'
+
+
+def get_snapshot_version(name):
+    """
+    获取快照当前版本号
+    """
+    return get_cache_version(SNAPSHOT_VERSION_KEY.format(name=name))
+
+
+def bump_snapshot_version(name):
+    """
+    快照版本号+1，旧版本的快照不会再被读取，等待过期即可
+    """
+    return bump_cache_version(SNAPSHOT_VERSION_KEY.format(name=name))
+
+
+def use_snapshot(request):
+    """
+    只有json格式、无查询参数的请求使用快照（可浏览api等其他格式走原来的流程）
+    """
+    if request.accepted_renderer.format != 'json':
+        return False
+    return not [key for key in request.query_params if key != 'format']
+
+
+class SiteRequest(object):
+    """
+    生成快照时使用的request代理：绝对地址以settings.SITE_URL为域名，快照内容与请求的Host无关
+    """
+    def __init__(self, request):
+        self._request = request
+
+    def build_absolute_uri(self, location=None):
+        if location is None:
+            location = self._request.get_full_path()
+        return urljoin(settings.SITE_URL, location)
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+
+def snapshot_response(func):
+    """
+    list方法的装饰器，将返回的json渲染成bytes按版本号缓存，并支持ETag/If-None-Match
+    快照名称取自view的snapshot_name，数据变化时由signals更新版本号，下一次请求重新生成快照
+    """
+    @wraps(func)
+    def inner(view, request, *args, **kwargs):
+        if not use_snapshot(request):
+            return func(view, request, *args, **kwargs)
+
+        name = view.snapshot_name
+        key = SNAPSHOT_KEY.format(name=name, version=get_snapshot_version(name))
+
+        def compute():
+            # 图片地址是带域名的绝对地址，统一使用SITE_URL生成，
+            # 不能按请求的Host区分快照（Host由客户端任意指定，会产生大量无用的缓存）
+            site_request = SiteRequest(request)
+            view.request = site_request
+            try:
+                return make_snapshot(func(view, site_request, *args, **kwargs).data)
+            finally:
+                view.request = request
+
+        # 版本号变化后同一时间只有一个请求重新生成快照，其它请求等待
+        snapshot = get_or_compute(key, compute, settings.SNAPSHOT_CACHE_TIMEOUT,
+                                  lock_timeout=settings.API_CACHE_LOCK_TIMEOUT)
+
+        return snapshot_http_response(request, snapshot)
+    return inner
+
+
+def make_snapshot(data):
+    """
+    将数据渲染成json bytes，返回 (ETag, bytes)
+    """
+    content = JSONRenderer().render(data)
+    return quote_etag(hashlib.md5(content).hexdigest()), content
+
+
+def snapshot_http_response(request, snapshot):
+    """
+    直接返回快照的bytes，If-None-Match与ETag一致时返回304
+    """
+    etag, content = snapshot
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+class SnapshotResponseMixin(object):
+    """
+    ViewSet混入类，list结果使用快照（需设置snapshot_name）
+    """
+    snapshot_name = None
+
+    @snapshot_response
+    def list(self, request, *args, **kwargs):
+        return super(SnapshotResponseMixin, self).list(request, *args, **kwargs)
@@ -0,0 +1,151 @@
+import time
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Goods,HotSearchWords
+
+logger = logging.getLogger(__name__)
+
+# 热搜词的基础权重，保证热搜词排在商品名前面
+HOT_WORDS_WEIGHT = 10 ** 9
+
+
+class _TrieNode(object):
+    __slots__ = ('children', 'words')
+
+    def __init__(self, words):
+        # 边的第一个字符 -> (边上的字符串, 子节点)
+        self.children = {}
+        # 以该节点为前缀的权重最高的top_k个词（按权重从高到低）
+        self.words = words
+
+
+class PrefixTrie(object):
+    """
+    压缩前缀树（radix tree），没有分支的连续字符合并为一条边，节点数与词的数量相关，与词的总长度无关
+    每个节点保存以该节点为前缀的权重最高的top_k个词，
+    查询时只需沿前缀走到对应节点（前缀停在边的中间时取边的终点），复杂度与前缀长度相关，与词的数量无关
+    """
+    def __init__(self, items, top_k=10):
+        """
+        :param items: [(词, 权重)]，重复的词取最大权重
+        """
+        self.top_k = top_k
+        self.size = 0
+        self.node_count = 1
+        self.root = _TrieNode([])
+
+        weights = {}
+        for word, weight in items:
+            word = word.strip()
+            if word and weight > weights.get(word, -1):
+                weights[word] = weight
+        # 按权重从高到低插入，每个节点的候选词列表天然有序，满top_k个后不再追加
+        for word, weight in sorted(weights.items(), key=lambda item: (-item[1], item[0])):
+            self._insert(word)
+        self.size = len(weights)
+
+    def _insert(self, word):
+        key = word.lower()
+        node, i = self.root, 0
+        while i < len(key):
+            edge = node.children.get(key[i])
+            if edge is None:
+                node.children[key[i]] = (key[i:], _TrieNode([word]))
+                self.node_count += 1
+                return
+            label, child = edge
+            n = 1
+            while n < len(label) and i + n < len(key) and label[n] == key[i + n]:
+                n += 1
+            if n < len(label):
+                # 在边的中间分叉（或词在边的中间结束），拆分为两条边
+                # 新节点下的词与原子节点相同，候选词列表直接复制
+                middle = _TrieNode(list(child.words))
+                middle.children[label[n]] = (label[n:], child)
+                node.children[key[i]] = (label[:n], middle)
+                self.node_count += 1
+                child = middle
+            node, i = child, i + n
+            if len(node.words) < self.top_k:
+                node.words.append(word)
+
+    def search(self, prefix, limit=10):
+        prefix = prefix.lower()
+        node, i = self.root, 0
+        while i < len(prefix):
+            edge = node.children.get(prefix[i])
+            if edge is None:
+                return []
+            label, child = edge
+            rest = prefix[i:]
+            if rest.startswith(label):
+                node, i = child, i + len(label)
+            elif label.startswith(rest):
+                # 前缀停在边的中间，边上没有分支，候选词与边的终点相同
+                return child.words[:limit]
+            else:
+                return []
+        return node.words[:limit]
+
+
+class SuggestionService(object):
+    """
+    搜索联想服务
+    由热搜词和商品名（按销量、点击数加权）构建前缀树，查询时只读内存；
+    后台线程每隔SUGGEST_REBUILD_INTERVAL秒重建一次
+    """
+    def __init__(self, rebuild_interval=300, top_k=10):
+        self.rebuild_interval = rebuild_interval
+        self.top_k = top_k
+        self.trie = None
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._started = False
+
+    def load_items(self):
+        for keywords, index in HotSearchWords.objects.values_list('keywords', 'index'):
+            yield keywords, HOT_WORDS_WEIGHT + index
+        for name, sold_num, click_num in Goods.objects.values_list('name', 'sold_num', 'click_num').iterator():
+            yield name, sold_num * 10 + click_num
+
+    def rebuild(self):
+        trie = PrefixTrie(self.load_items(), top_k=self.top_k)
+        # 直接替换引用，查询线程读到的总是完整的前缀树
+        self.trie, self.built_at = trie, time.time()
+        return trie
+
+    def suggest(self, prefix, limit=10):
+        trie = self.trie
+        if trie is None:
+            # 第一次查询时同步构建，之后由后台线程定时重建
+            with self._lock:
+                if self.trie is None:
+                    self.rebuild()
+                    self._start()
+            trie = self.trie
+        return trie.search(prefix, limit)
+
+    def _start(self):
+        if self._started:
+            return
+        self._started = True
+        thread = threading.Thread(target=self._run, name='suggest-rebuild')
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.rebuild_interval)
+            close_old_connections()
+            try:
+                self.rebuild()
+            except Exception:
+                # 重建失败时继续使用旧的前缀树
+                logger.exception('suggest rebuild failed')
+
+
+suggestion_service = SuggestionService(rebuild_interval=settings.SUGGEST_REBUILD_INTERVAL)
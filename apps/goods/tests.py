@@ -1,3 +1,719 @@
-from django.test import TestCase
+import random
+import threading
+from unittest import mock,skipIf
 
-# Create your tests here.
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection,transaction,DatabaseError
+from django.db.models import QuerySet
+from django.test import TransactionTestCase,override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase,APIRequestFactory
+from xadmin.plugins.aggregation import AggregationPlugin
+from xadmin.plugins.export import ExportPlugin
+from xadmin.views.list import ResultRow
+
+from .models import Goods,GoodsCategory,GoodsImage,GoodsCategoryBrand,IndexAd,Banner
+from .serializers import IndexGoodsSerializer
+from .snapshot import SNAPSHOT_KEY,get_snapshot_version
+from .click_counter import ClickCounter,click_counter
+from .column_filter import GoodsColumnStore,np
+from .index_builder import IndexGoodsBuilder
+from .suggest import PrefixTrie,suggestion_service
+from .search import tokenize
+from .views import GoodsListViewSet
+from utils.cache import bump_model_version,get_model_versions,get_or_compute
+
+
+def create_category_tree(name='生鲜'):
+    """
+    创建一组一、二、三级类别，返回 (一级, 二级, 三级)
+    """
+    top = GoodsCategory.objects.create(name=name, code=name, category_type=1, is_tab=True)
+    second = GoodsCategory.objects.create(name=name + '2', code=name + '2', category_type=2, parent_category=top)
+    third = GoodsCategory.objects.create(name=name + '3', code=name + '3', category_type=3, parent_category=second)
+    return top, second, third
+
+
+def create_goods(category, count, images=2, **kwargs):
+    """
+    在category下创建count个商品，每个商品带images张轮播图
+    """
+    kwargs.setdefault('goods_num', 100)
+    goods_list = []
+    for i in range(count):
+        goods = Goods.objects.create(category=category, name='{}商品{}'.format(category.name, i),
+                                     goods_brief='', shop_price=10 + i, **kwargs)
+        GoodsImage.objects.bulk_create([GoodsImage(goods=goods, image='goods/images/{}_{}.jpg'.format(goods.id, j))
+                                        for j in range(images)])
+        goods_list.append(goods)
+    return goods_list
+
+
+class GoodsQueryCountTest(APITestCase):
+    """
+    商品列表、详情的查询次数不随商品数、图片数增加（N+1回归测试）
+    """
+    def setUp(self):
+        # 清空接口缓存和限流计数
+        cache.clear()
+        _, _, self.category = create_category_tree()
+
+    def test_list(self):
+        create_goods(self.category, 1)
+        # COUNT + 当前页商品（select_related类别） + prefetch图片
+        with self.assertNumQueries(3):
+            response = self.client.get('/goods/')
+        self.assertEqual(response.data['count'], 1)
+
+        create_goods(self.category, 11, images=3)
+        cache.clear()
+        with self.assertNumQueries(3):
+            response = self.client.get('/goods/')
+        self.assertEqual(len(response.data['results']), 12)
+        self.assertTrue(all(item['category']['id'] == self.category.id for item in response.data['results']))
+
+    def test_list_cached(self):
+        create_goods(self.category, 3)
+        self.client.get('/goods/')
+        with self.assertNumQueries(0):
+            self.client.get('/goods/')
+
+    def test_retrieve(self):
+        goods = create_goods(self.category, 1, images=4)[0]
+        # 点击数不写入全局的缓冲（进程退出时才写入，那时测试数据库已经删除）
+        with mock.patch.object(click_counter, 'incr') as incr, self.assertNumQueries(2):
+            response = self.client.get('/goods/{}/'.format(goods.id))
+        self.assertEqual(len(response.data['images']), 4)
+        incr.assert_called_once_with(goods.id)
+
+
+@mock.patch.object(ClickCounter, '_ensure_started', lambda self: None)
+class ClickCounterTest(APITestCase):
+    """
+    点击数按增量分组批量写入，写入失败时整体回滚并放回缓冲，缓冲的商品数达到max_pending时提前唤醒写入线程
+    """
+    def setUp(self):
+        _, _, category = create_category_tree()
+        self.goods = create_goods(category, 3, images=0)
+        self.counter = ClickCounter(max_pending=3)
+
+    def click_nums(self):
+        return [Goods.objects.get(id=goods.id).click_num for goods in self.goods]
+
+    def test_flush_grouped_by_count(self):
+        for goods, clicks in zip(self.goods, (2, 2, 1)):
+            for _ in range(clicks):
+                self.counter.incr(goods.id)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.counter.flush(), 3)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(self.click_nums(), [2, 2, 1])
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_flush_failure_rebuffered(self):
+        self.counter.incr(self.goods[0].id, 2)
+        self.counter.incr(self.goods[1].id, 1)
+        update = QuerySet.update
+        calls = []
+
+        def fail_second_group(queryset, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise DatabaseError('write failed')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', fail_second_group), \
+                self.assertLogs('goods.click_counter', 'ERROR'):
+            self.assertEqual(self.counter.flush(), 0)
+        # 已写入的分组随事务回滚，不会在下一次写入时重复计入
+        self.assertEqual(self.click_nums(), [0, 0, 0])
+        self.assertEqual(self.counter.flush(), 2)
+        self.assertEqual(self.click_nums(), [2, 1, 0])
+
+    def test_wakeup_on_max_pending(self):
+        self.counter.incr(self.goods[0].id)
+        self.counter.incr(self.goods[0].id)
+        self.counter.incr(self.goods[1].id)
+        self.assertFalse(self.counter._wakeup.is_set())
+        self.counter.incr(self.goods[2].id)
+        self.assertTrue(self.counter._wakeup.is_set())
+
+
+@mock.patch.object(GoodsListViewSet, 'throttle_classes', ())
+class GoodsCursorPaginationTest(APITestCase):
+    """
+    游标分页：翻页不执行COUNT/OFFSET，排序字段有重复值时也不重复、不遗漏；不带cursor时仍为页码分页
+    """
+    def setUp(self):
+        cache.clear()
+        _, _, category = create_category_tree()
+        # 每4个商品销量相同
+        for i, goods in enumerate(create_goods(category, 30, images=0)):
+            Goods.objects.filter(id=goods.id).update(sold_num=i // 4)
+        self.expected = list(Goods.objects.order_by('-sold_num', '-id').values_list('id', flat=True))
+
+    def get_page(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, [query['sql'].upper() for query in queries]
+
+    def test_walk_forward_and_back(self):
+        data, _ = self.get_page('/goods/', {'ordering': '-sold_num', 'cursor': '', 'page_size': 7})
+        self.assertEqual(data['count'], 30)
+        self.assertIsNone(data['previous'])
+        pages = [[item['id'] for item in data['results']]]
+        while data['next']:
+            data, queries = self.get_page(data['next'])
+            # 总数已缓存，只查询当前页
+            self.assertFalse([sql for sql in queries if 'COUNT(' in sql or 'OFFSET' in sql])
+            pages.append([item['id'] for item in data['results']])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(page) for page in pages], [7, 7, 7, 7, 2])
+
+        # 从最后一页向前翻，得到相同的分页
+        back = [pages[-1]]
+        while data['previous']:
+            data, _ = self.get_page(data['previous'])
+            back.insert(0, [item['id'] for item in data['results']])
+        self.assertEqual(back, pages)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/goods/', {'ordering': '-sold_num', 'cursor': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_mode(self):
+        data, queries = self.get_page('/goods/', {'ordering': '-sold_num', 'page': 2, 'page_size': 7})
+        self.assertEqual(data['count'], 30)
+        self.assertEqual([item['id'] for item in data['results']], self.expected[7:14])
+        self.assertIn('page=3', data['next'])
+        self.assertTrue([sql for sql in queries if 'COUNT(' in sql])
+
+
+@skipIf(np is None, 'NumPy is not installed')
+class GoodsColumnStoreTest(TransactionTestCase):
+    """
+    当前进程的修改增量更新列存储，不重新加载；其它进程修改商品（版本号变化）后在后台重新加载
+    """
+    def setUp(self):
+        cache.clear()
+        _, _, self.category = create_category_tree()
+        self.goods = create_goods(self.category, 5, images=0)
+        self.store = GoodsColumnStore()
+        patcher = mock.patch('goods.signals.goods_column_store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cheapest(self):
+        return self.store.query({}, 'shop_price')[0]
+
+    def wait_reload(self):
+        self.store._reload_thread.join()
+
+    def test_reload_on_version_change(self):
+        self.assertEqual(self.cheapest(), self.goods[0].id)
+        with self.assertNumQueries(0):
+            self.store.query({'pricemin': 12})
+
+        # 模拟其它进程修改商品：当前进程没有收到signal，只有版本号变化
+        Goods.objects.filter(id=self.goods[4].id).update(shop_price=1)
+        bump_model_version(Goods)
+        # 在后台线程中重新加载，请求中不加载整张表
+        with self.assertNumQueries(0):
+            self.cheapest()
+        self.wait_reload()
+        self.assertEqual(self.cheapest(), self.goods[4].id)
+        self.assertEqual(self.store.version, self.store.get_version())
+
+    def test_local_changes_applied_incrementally(self):
+        self.cheapest()
+        goods = self.goods[4]
+        with mock.patch.object(self.store, 'start_reload') as start_reload:
+            goods.shop_price = 1
+            goods.save()
+            self.assertEqual(self.cheapest(), goods.id)
+            goods.delete()
+            self.assertEqual(self.cheapest(), self.goods[0].id)
+
+            top = GoodsCategory.objects.get(category_type=1)
+            self.assertEqual(len(self.store.query({'top_category': top.id})), 4)
+            self.category.parent_category = None
+            self.category.save()
+            self.assertEqual(len(self.store.query({'top_category': top.id})), 0)
+        start_reload.assert_not_called()
+
+    def test_single_reload_thread(self):
+        self.cheapest()
+        loaded = threading.Event()
+        with mock.patch.object(self.store, 'load', side_effect=lambda: loaded.wait(5)) as load:
+            self.store.start_reload()
+            self.store.start_reload()
+            loaded.set()
+            self.wait_reload()
+        self.assertEqual(load.call_count, 1)
+
+
+class CategoryQueryCountTest(APITestCase):
+    """
+    类别树一次查询加载，之后从快照返回
+    """
+    def setUp(self):
+        cache.clear()
+
+    def test_list(self):
+        for name in ('生鲜', '酒水', '粮油'):
+            create_category_tree(name)
+        with self.assertNumQueries(1):
+            response = self.client.get('/categories/', HTTP_ACCEPT='application/json')
+        self.assertEqual(len(response.json()), 3)
+        with self.assertNumQueries(0):
+            self.client.get('/categories/', HTTP_ACCEPT='application/json')
+
+
+class IndexGoodsTest(APITestCase):
+    """
+    首页商品：IndexGoodsBuilder的查询次数固定，结果与逐个类别序列化（IndexGoodsSerializer）一致
+    """
+    def setUp(self):
+        cache.clear()
+
+    def create_tabs(self, names):
+        for name in names:
+            top, second, third = create_category_tree(name)
+            create_goods(second, 2)
+            goods = create_goods(third, 3)
+            GoodsCategoryBrand.objects.create(category=top, name=name + '品牌', image='brands/{}.jpg'.format(name))
+            IndexAd.objects.create(category=top, goods=goods[0])
+
+    def serializer_data(self):
+        request = APIRequestFactory().get('/indexgoods/')
+        categories = GoodsCategory.objects.filter(is_tab=True)
+        return IndexGoodsSerializer(categories, many=True, context={'request': Request(request)}).data
+
+    def builder_data(self):
+        request = APIRequestFactory().get('/indexgoods/')
+        categories = GoodsCategory.objects.filter(is_tab=True)
+        return IndexGoodsBuilder(Request(request)).build(categories)
+
+    def test_query_count(self):
+        # 导航类别、二级类别、三级类别、品牌、广告、商品id、商品、商品图片
+        for names in (('生鲜',), ('酒水', '粮油', '奶类', '蔬菜')):
+            self.create_tabs(names)
+            cache.clear()
+            with self.assertNumQueries(8):
+                response = self.client.get('/indexgoods/', HTTP_ACCEPT='application/json')
+            self.assertEqual(len(response.json()), GoodsCategory.objects.filter(is_tab=True).count())
+        # 之后的请求直接返回快照
+        with self.assertNumQueries(0):
+            self.client.get('/indexgoods/', HTTP_ACCEPT='application/json')
+
+    def test_fewer_queries_than_serializer(self):
+        self.create_tabs(('生鲜', '酒水', '粮油'))
+        with CaptureQueriesContext(connection) as serializer_queries:
+            expected = JSONRenderer().render(self.serializer_data())
+        with CaptureQueriesContext(connection) as builder_queries:
+            data = JSONRenderer().render(self.builder_data())
+        self.assertEqual(data, expected)
+        self.assertLess(len(builder_queries), len(serializer_queries))
+
+
+class SnapshotTest(TransactionTestCase):
+    """
+    快照版本号在事务提交后更新；快照内容和缓存key与请求的Host无关
+    """
+    def setUp(self):
+        cache.clear()
+
+    def test_version_bumped_on_commit(self):
+        version = get_snapshot_version('categories')
+        with transaction.atomic():
+            create_category_tree()
+            # 提交前其它请求仍使用旧版本号，不会用旧数据生成新版本号的快照
+            self.assertEqual(get_snapshot_version('categories'), version)
+        self.assertNotEqual(get_snapshot_version('categories'), version)
+
+    def test_version_kept_on_rollback(self):
+        version = get_snapshot_version('categories')
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                create_category_tree()
+                raise ValueError
+        self.assertEqual(get_snapshot_version('categories'), version)
+
+    def test_host_independent(self):
+        _, _, category = create_category_tree()
+        goods = create_goods(category, 1)[0]
+        Banner.objects.create(goods=goods, image='banner/1.jpg')
+        first = self.client.get('/banners/', HTTP_ACCEPT='application/json', HTTP_HOST='a.example.com')
+        with self.assertNumQueries(0):
+            second = self.client.get('/banners/', HTTP_ACCEPT='application/json', HTTP_HOST='b.example.com')
+        self.assertEqual(first.content, second.content)
+        self.assertTrue(first.json()[0]['image'].startswith(settings.SITE_URL))
+        self.assertIsNotNone(cache.get(SNAPSHOT_KEY.format(name='banners', version=get_snapshot_version('banners'))))
+
+
+@mock.patch.object(GoodsListViewSet, 'throttle_classes', ())
+class GoodsSearchTest(APITestCase):
+    """
+    商品搜索索引：中文二元组+单字、英文数字按词分词，必须命中所有词，按字段权重排序
+    """
+    def setUp(self):
+        cache.clear()
+        _, _, self.category = create_category_tree()
+
+    def create(self, name, goods_brief=''):
+        return Goods.objects.create(category=self.category, name=name, goods_brief=goods_brief, shop_price=10)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('新鲜水果 Apple-200g'),
+                         ['新', '鲜', '水', '果', '新鲜', '鲜水', '水果', 'apple', '200g'])
+        # 查询时只使用二元组，单字片段使用单字
+        self.assertEqual(tokenize('新鲜水果 Apple', for_query=True), ['新鲜', '鲜水', '水果', 'apple'])
+        self.assertEqual(tokenize('果 a', for_query=True), ['果', 'a'])
+
+    def test_index_on_save(self):
+        goods = self.create('苹果')
+        self.assertEqual(set(goods.search_tokens.values_list('token', flat=True)), {'苹', '果', '苹果'})
+        goods.name = '香蕉'
+        goods.save()
+        self.assertEqual(set(goods.search_tokens.values_list('token', flat=True)), {'香', '蕉', '香蕉'})
+
+        # 只修改计数字段时不重建索引
+        with mock.patch('goods.signals.index_goods') as index_goods:
+            goods.sold_num = 10
+            goods.save(update_fields=['sold_num'])
+            index_goods.assert_not_called()
+            goods.save()
+            index_goods.assert_called_once_with(goods)
+
+    def test_search(self):
+        in_brief = self.create('果汁饮料', goods_brief='新鲜苹果汁')
+        in_name = self.create('苹果汁')
+        self.create('苹果')
+        self.create('橙汁')
+        response = self.client.get('/goods/', {'search': '苹果汁'})
+        # 必须命中所有词（苹果、果汁），商品名中命中的排在前面
+        self.assertEqual([item['id'] for item in response.data['results']], [in_name.id, in_brief.id])
+        response = self.client.get('/goods/', {'search': '汁'})
+        self.assertEqual(response.data['count'], 3)
+
+
+class GoodsFacetTest(APITestCase):
+    """
+    分面统计与按同样条件过滤的商品列表数量一致，搜索时也能统计，facets参数是列表缓存key的一部分
+    """
+    def setUp(self):
+        cache.clear()
+        self.fruit = create_category_tree('水果')
+        self.meat = create_category_tree('肉类')
+        for category, prices in ((self.fruit[2], (10, 30, 30, 60, 150)), (self.fruit[1], (300,)),
+                                 (self.meat[2], (10, 60, 250))):
+            for i, price in enumerate(prices):
+                Goods.objects.create(category=category, name='{}苹果{}'.format(category.name, i), goods_brief='',
+                                     shop_price=price, is_hot=i % 2 == 0, is_new=i % 3 == 0)
+        throttle = mock.patch.object(GoodsListViewSet, 'throttle_classes', ())
+        throttle.start()
+        self.addCleanup(throttle.stop)
+
+    def count(self, **params):
+        return self.client.get('/goods/', params).data['count']
+
+    def assert_facets_match_list(self, **params):
+        facets = self.client.get('/goods/', dict(params, facets=1)).data['facets']
+        for facet in facets['top_category']:
+            self.assertEqual(facet['count'], self.count(top_category=facet['id'], **params))
+        for facet in facets['price']:
+            # 价格区间不包含上限，测试数据中没有边界上的价格
+            if facet['max'] is None:
+                price_params = {'pricemin': max(facet['min'], params.get('pricemin', 0))}
+            else:
+                price_params = {'pricemin': max(facet['min'], params.get('pricemin', 0)),
+                                'pricemax': min(facet['max'], params.get('pricemax', facet['max']))}
+            self.assertEqual(facet['count'], self.count(**dict(params, **price_params)))
+        for name in ('is_hot', 'is_new'):
+            for facet in facets[name]:
+                # 已按该字段过滤时，另一个取值的商品数为0
+                expected = self.count(**dict(params, **{name: facet['value']}))
+                if name in params and params[name] != facet['value']:
+                    expected = 0
+                self.assertEqual(facet['count'], expected)
+        return facets
+
+    def test_counts_match_list(self):
+        facets = self.assert_facets_match_list()
+        self.assertEqual([(facet['id'], facet['count']) for facet in facets['top_category']],
+                         [(self.fruit[0].id, 6), (self.meat[0].id, 3)])
+        self.assertEqual([(facet['id'], facet['count']) for facet in facets['second_category']],
+                         [(self.fruit[1].id, 6), (self.meat[1].id, 3)])
+        self.assertEqual([facet['count'] for facet in facets['price']], [2, 2, 2, 1, 2])
+
+        facets = self.assert_facets_match_list(is_hot=True)
+        self.assertEqual(sum(facet['count'] for facet in facets['price']), self.count(is_hot=True))
+
+    def test_search(self):
+        response = self.client.get('/goods/', {'search': '水果', 'facets': 1})
+        facets = response.data['facets']
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual([(facet['id'], facet['count']) for facet in facets['top_category']], [(self.fruit[0].id, 6)])
+        self.assertEqual(sum(facet['count'] for facet in facets['price']), 6)
+        self.assert_facets_match_list(search='苹果', pricemax=100)
+
+    def test_filtered_queryset_reused(self):
+        # 分面统计复用list()过滤后的queryset，过滤（搜索）只执行一次
+        with mock.patch.object(GoodsListViewSet, 'filter_queryset', autospec=True,
+                               side_effect=GoodsListViewSet.filter_queryset) as filter_queryset:
+            response = self.client.get('/goods/', {'search': '苹果', 'facets': 1})
+        self.assertEqual(filter_queryset.call_count, 1)
+        self.assertEqual(sum(facet['count'] for facet in response.data['facets']['price']), 9)
+
+    def test_cache_key(self):
+        self.assertNotIn('facets', self.client.get('/goods/').data)
+        # 带facets参数的请求不会命中不带facets的缓存，反之亦然
+        self.assertIn('facets', self.client.get('/goods/', {'facets': 1}).data)
+        self.assertNotIn('facets', self.client.get('/goods/').data)
+        with self.assertNumQueries(0):
+            self.assertIn('facets', self.client.get('/goods/', {'facets': 1}).data)
+
+
+class PrefixTrieTest(APITestCase):
+    """
+    压缩前缀树的查询结果与逐个词比较前缀、按权重取top_k的结果一致
+    """
+    def brute_force(self, items, prefix, limit):
+        weights = {}
+        for word, weight in items:
+            weights[word] = max(weight, weights.get(word, -1))
+        words = sorted(weights.items(), key=lambda item: (-item[1], item[0]))
+        return [word for word, _ in words if word.lower().startswith(prefix.lower())][:limit]
+
+    def test_search(self):
+        rand = random.Random(0)
+        items = [(''.join(rand.choice('abcd') for _ in range(rand.randint(1, 8))), rand.randint(0, 100))
+                 for _ in range(500)]
+        items += [('Apple', 50), ('apple pie', 60), ('牛奶', 70), ('牛肉', 80), ('牛肉干', 90)]
+        trie = PrefixTrie(items, top_k=5)
+        prefixes = {word[:i] for word, _ in items for i in range(1, len(word) + 1)} | {'x', 'abcdx', '牛奶x'}
+        for prefix in prefixes:
+            self.assertEqual(trie.search(prefix, 5), self.brute_force(items, prefix, 5), prefix)
+        # 没有分支的字符合并为一条边，节点数少于字符数
+        self.assertLess(trie.node_count, sum(len(word) for word in {word for word, _ in items}))
+
+    def test_prefix_ends_mid_edge(self):
+        trie = PrefixTrie([('banana', 1), ('bandana', 2)])
+        self.assertEqual(trie.search('ba'), ['bandana', 'banana'])
+        self.assertEqual(trie.search('banan'), ['banana'])
+        self.assertEqual(trie.search('bananas'), [])
+
+    def test_view_limit_clamped(self):
+        suggestion_service.trie = PrefixTrie([('牛奶{}'.format(i), i) for i in range(20)],
+                                             top_k=suggestion_service.top_k)
+        self.addCleanup(setattr, suggestion_service, 'trie', None)
+        cache.clear()
+        response = self.client.get('/suggest/', {'q': '牛', 'limit': -3})
+        self.assertEqual(response.data, ['牛奶19'])
+        response = self.client.get('/suggest/', {'q': '牛', 'limit': 100})
+        self.assertEqual(len(response.data), suggestion_service.top_k)
+
+
+class GetOrComputeTest(APITestCase):
+    """
+    get_or_compute的锁只由拿到锁的请求删除
+    """
+    def setUp(self):
+        cache.clear()
+
+    def test_keep_lock_taken_by_other_worker(self):
+        def compute():
+            # 计算超过lock_timeout，锁过期后被其它请求拿到
+            cache.delete('key:lock')
+            self.assertTrue(cache.add('key:lock', 'other', 10))
+            return 1
+
+        self.assertEqual(get_or_compute('key', compute, 60), 1)
+        self.assertEqual(cache.get('key:lock'), 'other')
+
+    def test_release_own_lock(self):
+        self.assertEqual(get_or_compute('key', lambda: 1, 60), 1)
+        self.assertIsNone(cache.get('key:lock'))
+        self.assertEqual(get_or_compute('key', lambda: 2, 60), 1)
+
+
+def export_values_by_result_item(plugin):
+    """
+    逐个单元格经过result_item、_format_value生成导出数据（values_list优化之前的实现），作为对照
+    """
+    for obj in plugin._iter_result_objects():
+        row = ResultRow()
+        row['is_display_first'] = False
+        row['object'] = obj
+        items = [plugin.admin_view.result_item(obj, field_name, row) for field_name in plugin.admin_view.list_display]
+        yield [plugin._format_value(item) for item in items if getattr(item, 'export', False)]
+
+
+class AdminExportTest(TransactionTestCase):
+    """
+    后台导出：只有字段列时用一次values_list查询读取，结果与逐个单元格生成的相同
+    """
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        for name in ('生鲜', '酒水'):
+            _, _, category = create_category_tree(name)
+            create_goods(category, 3, images=0, is_hot=True)
+            create_goods(category, 2, images=0, goods_desc='<p>"a", b</p>')
+
+    def export(self, url, export_type):
+        response = self.client.get(url, {'_do_': 'export', 'export_type': export_type, 'all': 'on',
+                                         'export_csv_header': 'on'})
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def test_same_as_result_item(self):
+        for url in ('/xadmin/goods/goods/', '/xadmin/goods/goodscategory/'):
+            for export_type in ('csv', 'json', 'xml'):
+                data = self.export(url, export_type)
+                with mock.patch.object(ExportPlugin, '_iter_values', export_values_by_result_item):
+                    self.assertEqual(data, self.export(url, export_type), (url, export_type))
+
+    def test_attname_column(self):
+        # 外键的attname列（category_id）与外键列一样导出关联对象的文本
+        with mock.patch('goods.adminx.GoodsAdmin.list_display', ['name', 'category_id', 'shop_price'], create=True):
+            for export_type in ('csv', 'json'):
+                data = self.export('/xadmin/goods/goods/', export_type)
+                with mock.patch.object(ExportPlugin, '_iter_values', export_values_by_result_item):
+                    self.assertEqual(data, self.export('/xadmin/goods/goods/', export_type), export_type)
+                self.assertIn('生鲜3'.encode('utf8'), data)
+
+    def test_query_count(self):
+        def count_queries(url):
+            with CaptureQueriesContext(connection) as queries:
+                self.export(url, 'csv')
+            return len(queries)
+
+        for url in ('/xadmin/goods/goods/', '/xadmin/goods/goodscategory/'):
+            before = count_queries(url)
+            for name in ('粮油', '奶类', '蔬菜'):
+                _, _, category = create_category_tree(name)
+                create_goods(category, 5, images=0)
+            self.assertEqual(count_queries(url), before, url)
+
+
+    def test_keyset_chunks(self):
+        Goods.objects.filter(id__in=Goods.objects.values('id')[:4]).update(click_num=5)
+
+        def export_by_result_item(url, params):
+            with mock.patch.object(ExportPlugin, '_iter_values', export_values_by_result_item):
+                return self.export(url + '?' + params, 'csv')
+
+        url = '/xadmin/goods/goods/'
+        # 按排序条件逐块读取（有重复值的列后面还有主键），结果与一次读取全部主键相同
+        with mock.patch.object(ExportPlugin, 'export_chunk_size', 3):
+            for params in ('', 'o=name', 'o=-click_num', 'o=click_num.-shop_price', 'o=category'):
+                with CaptureQueriesContext(connection) as queries:
+                    data = export_by_result_item(url, params)
+                # 只读取排序列的查询都带LIMIT，不会一次读取全部商品的主键（列表页本身的查询读取完整的行）
+                keys = [q['sql'] for q in queries if q['sql'].startswith('SELECT "goods_goods"."id"') and
+                        'ORDER BY' in q['sql'] and '"goods_goods"."goods_desc"' not in q['sql']]
+                self.assertTrue(keys and all('LIMIT 3' in sql for sql in keys), params)
+                with mock.patch.object(ExportPlugin, '_get_keyset_ordering', return_value=None):
+                    self.assertEqual(data, export_by_result_item(url, params), params)
+                self.assertEqual(data.count(b'\r\n'), Goods.objects.count(), params)
+
+
+
+class AdminAggregationTest(APITestCase):
+    """
+    后台列表的合计行：同一过滤条件下只执行一次aggregate查询，翻页时使用缓存
+    """
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        _, _, category = create_category_tree('生鲜')
+        create_goods(category, 5, images=0)
+        _, _, category = create_category_tree('酒水')
+        create_goods(category, 3, images=0)
+        # 插件的选项在生成url时已从GoodsAdmin复制，GoodsAdmin没有aggregate_fields，使用插件的默认值
+        for patcher in (mock.patch.object(AggregationPlugin, 'aggregate_fields', {'shop_price': 'sum'}),
+                        mock.patch('goods.adminx.GoodsAdmin.list_per_page', 3, create=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def aggregate_queries(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/xadmin/goods/goods/', params or {})
+        self.assertEqual(response.status_code, 200)
+        aggregate_row = response.context_data['results'][-1]
+        self.assertEqual(aggregate_row.css_class, 'info aggregate')
+        total = [cell.text for cell in aggregate_row.cells if cell.field_name == 'shop_price'][0]
+        return total, len([q for q in queries if 'SUM("goods_goods"."shop_price")' in q['sql']])
+
+    def test_cached_per_filter(self):
+        # 生鲜：10+11+12+13+14，酒水：10+11+12
+        self.assertEqual(self.aggregate_queries(), ('93.0', 1))
+        self.assertEqual(self.aggregate_queries({'p': 1}), ('93.0', 0))
+        self.assertEqual(self.aggregate_queries({'p': 2}), ('93.0', 0))
+        # 搜索、过滤条件不同时分别缓存
+        self.assertEqual(self.aggregate_queries({'_q_': '酒水'}), ('33.0', 1))
+        self.assertEqual(self.aggregate_queries({'_q_': '酒水', 'p': 0}), ('33.0', 0))
+        self.assertEqual(self.aggregate_queries({'_p_shop_price__gte': 12}), ('51.0', 1))
+        self.assertEqual(self.aggregate_queries({'p': 1}), ('93.0', 0))
+
+    def test_cache_disabled(self):
+        with mock.patch.object(AggregationPlugin, 'aggregate_cache_timeout', 0):
+            self.assertEqual(self.aggregate_queries(), ('93.0', 1))
+            self.assertEqual(self.aggregate_queries({'p': 1}), ('93.0', 1))
+
+    def test_not_queried_by_export(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/xadmin/goods/goods/', {'_do_': 'export', 'export_type': 'csv', 'all': 'on'})
+            b''.join(response.streaming_content)
+        self.assertFalse([q for q in queries if 'SUM("goods_goods"."shop_price")' in q['sql']])
+
+# 没有redis服务监听的地址
+UNAVAILABLE_REDIS_CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:1/1",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SOCKET_CONNECT_TIMEOUT": 0.1,
+        }
+    }
+}
+
+
+@override_settings(CACHES=UNAVAILABLE_REDIS_CACHES)
+class CacheUnavailableTest(APITestCase):
+    """
+    redis不可用时接口直接查询数据库，修改数据时更新版本号失败也不影响保存
+    """
+    def setUp(self):
+        _, _, self.category = create_category_tree()
+        create_goods(self.category, 3)
+
+    def test_read(self):
+        with self.assertLogs('django_redis.cache', 'ERROR'):
+            for params in ({}, {'ordering': '-sold_num', 'cursor': ''}):
+                response = self.client.get('/goods/', params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['count'], 3)
+            self.assertEqual(self.client.get('/categories/', HTTP_ACCEPT='application/json').status_code, 200)
+            self.assertEqual(self.client.get('/banners/', HTTP_ACCEPT='application/json').status_code, 200)
+
+    def test_bump_version(self):
+        with self.assertLogs('django_redis.cache', 'ERROR'):
+            bump_model_version(Goods)
+            self.assertEqual(get_model_versions((Goods,)), [None])
+        # 未忽略异常的缓存后端
+        with mock.patch.object(cache, 'incr', side_effect=redis.ConnectionError), \
+                self.assertLogs('utils.cache', 'ERROR'):
+            self.assertIsNone(bump_model_version(Goods))
@@ -2,21 +2,32 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import mixins
 from rest_framework import generics
-from rest_framework.pagination import PageNumberPagination
 from rest_framework import viewsets
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from rest_framework.authentication import TokenAuthentication
-from rest_framework_extensions.cache.mixins import CacheResponseMixin
-from rest_framework.throttling import AnonRateThrottle,UserRateThrottle
 
-from .serializers import GoodsSerializer,CategorySerializer,BannerSerializer,IndexGoodsSerializer
-from .models import Goods,GoodsCategory,Banner
+from .serializers import GoodsSerializer,CategorySerializer,BannerSerializer,IndexGoodsSerializer,HotSearchWordsSerializer
+from .models import Goods,GoodsCategory,Banner,HotSearchWords
+from .signals import GOODS_CACHE_MODELS
 from .filter import GoodsListFilter
+from .index_builder import IndexGoodsBuilder
+from .snapshot import SnapshotResponseMixin,snapshot_response,snapshot_http_response,use_snapshot
+from .category_tree import get_category_tree
+from .click_counter import click_counter
+from .search import GoodsSearchFilter
+from .suggest import suggestion_service
+from .column_filter import ColumnFilterMixin,goods_column_store
+from .facets import FacetMixin
+from utils.eager_loading import EagerLoadingMixin
+from utils.pagination import KeysetPageNumberPagination
+from utils.throttling import ScopedSlidingWindowThrottle
+from utils.cache import APIListKeyConstructor,ModelVersionKeyBit,StampedeCacheResponseMixin
 
 
 # 继承PageNumberPagination对象即可自定义分页器
-class GoodsPagination(PageNumberPagination):
+# KeysetPageNumberPagination继承PageNumberPagination，另外支持游标分页（?cursor=），按sold_num、shop_price、id排序时可用
+class GoodsPagination(KeysetPageNumberPagination):
     # 默认每页数据量
     page_size = 12
     # 最大每页数据量
@@ -25,6 +36,15 @@ class GoodsPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     # 页码参数名称（即：http://localhost/?gotopage=2  跳转到第2页）
     page_query_param = 'page'
+    # 游标参数名称（即：http://localhost/?cursor= 获取第一页，之后使用返回的next、previous翻页）
+    cursor_query_param = 'cursor'
+
+
+# CacheResponseMixin的list缓存key包含全部查询参数、登录用户以及商品相关model的版本号
+# 商品、类别、商品图片修改时由signals更新版本号，缓存立即失效，不必等待过期
+# （retrieve在GoodsListViewSet中重载以统计点击数，不使用缓存）
+class GoodsListKeyConstructor(APIListKeyConstructor):
+    model_version = ModelVersionKeyBit(GOODS_CACHE_MODELS)
 
 
 # 继承APIView，也是rest-framework最简单的View
@@ -62,30 +82,41 @@ class GoodsPagination(PageNumberPagination):
 # ViewSet>GenericAPIView>APIView>View
 # --------
 # CacheResponseMixin会对retrieve和list请求返回的数据进行缓存，缓存时间可在settings中设置，放在第一个继承
-class GoodsListViewSet(CacheResponseMixin, mixins.ListModelMixin,mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+# StampedeCacheResponseMixin与CacheResponseMixin用法相同，另外带有防击穿（同一时间只有一个请求重新计算）和过期后返回旧值
+# EagerLoadingMixin会根据serializer的嵌套结构自动select_related/prefetch_related，避免N+1查询
+# FacetMixin在请求带有facets参数时返回当前过滤条件下的分面统计（类别、价格区间、热销、新品）
+# ColumnFilterMixin在开启GOODS_COLUMN_FILTER时使用内存列存储过滤排序，只查询当前页的商品
+class GoodsListViewSet(StampedeCacheResponseMixin, FacetMixin, ColumnFilterMixin, EagerLoadingMixin, mixins.ListModelMixin,mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     """
     商品列表，分页，搜索，获取，排序
     """
     # 限速类别（settings中也可以设置，这样设置是局部，settings设置是全局）
-    throttle_classes = (AnonRateThrottle,UserRateThrottle)
+    # 按throttle_scope单独限流，速率为settings中THROTTLE_RATES['goods']
+    throttle_classes = (ScopedSlidingWindowThrottle,)
+    throttle_scope = 'goods'
 
     queryset = Goods.objects.all() # List的queryset数据
     serializer_class = GoodsSerializer  # 对应的serializer
     pagination_class = GoodsPagination  # 对应的分页器
+    list_cache_key_func = GoodsListKeyConstructor()  # CacheResponseMixin的缓存key
+    column_store = goods_column_store  # ColumnFilterMixin使用的列存储
+    column_filter_ignored_params = (FacetMixin.facets_query_param,)
 
     # **** 在setting中设置TokenAuthentication的话会进行全局认证，所以只在需要登陆的view中设置TokenAuthentication
     # authentication_classes = (TokenAuthentication,)
 
     # DjangoFilterBackend： django-filter提供的Backend，可针对某一字段进行过滤（可设置价格区间）
     # SearchFilter: django-rest-framework提供的Backend，可进行多字段搜索
+    # GoodsSearchFilter: 继承SearchFilter，使用商品搜索倒排索引进行搜索并按相关度排序（goods/search.py）
     # OrderingFilter: django-rest-framework提供的Backend，可根据某个字段排序
-    filter_backends = (DjangoFilterBackend,filters.SearchFilter,filters.OrderingFilter)  #设置过滤器后端，可设置多个
+    filter_backends = (DjangoFilterBackend,GoodsSearchFilter,filters.OrderingFilter)  #设置过滤器后端，可设置多个
 
     # filter_fields = ('name', 'shop_price')  # DjangoFilterBackend对应的过滤字段（过滤条件单一，都是=）
     filter_class = GoodsListFilter  # DjangoFilterBackend对应的Filter类（可自定义过滤条件，即__后面的字段）
 
     search_fields = ['name','goods_brief','goods_desc'] # SearchFilter对应的搜索字段，可在前面加上（^=$@）
                                                         # ^ 以关键词开头，= 完全匹配关键词
+                                                        # 使用GoodsSearchFilter后，索引的字段及权重见goods/search.py
 
     ordering_fields = ['sold_num','shop_price']  # OrderingFilter对应的排序字段
 
@@ -98,10 +129,10 @@ class GoodsListViewSet(CacheResponseMixin, mixins.ListModelMixin,mixins.Retrieve
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
 
-        # 重载retrieve方法，加入下面两行代码
-        # 实现当用户访问商品时点击数+1
+        # 重载retrieve方法，实现当用户访问商品时点击数+1
+        # 点击数由click_counter缓冲后定时批量写入数据库，请求中不直接写库
+        click_counter.incr(instance.id)
         instance.click_num += 1
-        instance.save()
 
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
@@ -113,6 +144,7 @@ class GoodsListViewSet(CacheResponseMixin, mixins.ListModelMixin,mixins.Retrieve
 #    example.com/goods/22  获取id为22的食物
 #                         （继承RetrieveModelMixin,即使不继承ListModelMixin也能访问，
 #                           只要设置了router.register(r'goods',CategoryViewSet)）
+# 类别树由get_category_tree一次查询全部类别后在内存中组装，序列化后的json按版本号缓存，分类修改时自动失效
 class CategoryViewSet(mixins.ListModelMixin,mixins.RetrieveModelMixin,viewsets.GenericViewSet):
     """
     list:
@@ -121,12 +153,32 @@ class CategoryViewSet(mixins.ListModelMixin,mixins.RetrieveModelMixin,viewsets.G
     queryset = GoodsCategory.objects.filter(category_type=1) # 获取一级分类
     serializer_class = CategorySerializer  # 二级分类和三级分类由Serializer进行序列化
 
+    def list(self, request, *args, **kwargs):
+        if not use_snapshot(request):
+            return super(CategoryViewSet, self).list(request, *args, **kwargs)
+        categories, _ = get_category_tree()
+        return snapshot_http_response(request, categories)
 
-class BannerViewset(mixins.ListModelMixin,viewsets.GenericViewSet):
+    def retrieve(self, request, *args, **kwargs):
+        if not use_snapshot(request):
+            return super(CategoryViewSet, self).retrieve(request, *args, **kwargs)
+        _, items = get_category_tree()
+        try:
+            category = items.get(int(kwargs[self.lookup_field]))
+        except ValueError:
+            category = None
+        if category is None:
+            # 不存在或不是一级类别，按原来的流程返回404
+            return super(CategoryViewSet, self).retrieve(request, *args, **kwargs)
+        return snapshot_http_response(request, category)
+
+
+class BannerViewset(SnapshotResponseMixin, mixins.ListModelMixin,viewsets.GenericViewSet):
     """
     获取轮播图列表
     """
     queryset = Banner.objects.all().order_by('index')
+    snapshot_name = 'banners'
     serializer_class = BannerSerializer
 
 
@@ -135,4 +187,39 @@ class IndexGoodsViewset(mixins.ListModelMixin,viewsets.GenericViewSet):
     获取首页商品
     """
     serializer_class = IndexGoodsSerializer
-    queryset = GoodsCategory.objects.filter(is_tab=True)
\ No newline at end of file
+    queryset = GoodsCategory.objects.filter(is_tab=True)
+    snapshot_name = 'indexgoods'
+
+    # 使用IndexGoodsBuilder批量加载数据，避免每个类别各自查询商品、广告、子类别和品牌
+    # 结果以快照形式缓存，商品、类别、品牌、广告修改时自动失效
+    @snapshot_response
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(IndexGoodsBuilder(request).build(queryset))
+
+
+class HotSearchsViewset(mixins.ListModelMixin,viewsets.GenericViewSet):
+    """
+    获取热搜词列表
+    """
+    queryset = HotSearchWords.objects.all().order_by("-index")
+    serializer_class = HotSearchWordsSerializer
+
+
+class SuggestView(APIView):
+    """
+    搜索联想，根据输入的前缀返回热搜词和商品名
+    """
+    # 输入时每个按键都会请求，单独使用较宽松的速率（THROTTLE_RATES['suggest']）
+    throttle_classes = (ScopedSlidingWindowThrottle,)
+    throttle_scope = 'suggest'
+
+    def get(self, request):
+        prefix = request.query_params.get('q', '').strip()
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), suggestion_service.top_k))
+        except ValueError:
+            limit = suggestion_service.top_k
+        if not prefix:
+            return Response([])
+        return Response(suggestion_service.suggest(prefix, limit))
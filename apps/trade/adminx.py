@@ -2,7 +2,7 @@
 __author__ = 'bobby'
 
 import xadmin
-from .models import ShoppingCart, OrderInfo, OrderGoods
+from .models import ShoppingCart, OrderInfo, OrderGoods, AlipayNotify
 
 
 class ShoppingCartAdmin(object):
@@ -12,6 +12,8 @@ class ShoppingCartAdmin(object):
 class OrderInfoAdmin(object):
     list_display = ["user", "order_sn",  "trade_no", "pay_status", "post_script", "order_mount",
                     "order_mount", "pay_time", "add_time"]
+    # 订单表数据量大，最多统计10000条，超过时只显示上一页/下一页
+    list_count_limit = 10000
 
     class OrderGoodsInline(object):
         model = OrderGoods
@@ -24,3 +26,14 @@ class OrderInfoAdmin(object):
 
 xadmin.site.register(ShoppingCart, ShoppingCartAdmin)
 xadmin.site.register(OrderInfo, OrderInfoAdmin)
+
+
+class AlipayNotifyAdmin(object):
+    list_display = ["order_sn", "trade_no", "trade_status", "processed", "attempts", "add_time"]
+    list_filter = ["processed", "trade_status"]
+    # 通知表数据量大，交易状态的可选值（DISTINCT查询）在打开筛选菜单时才加载，并缓存到有新通知保存为止
+    filter_choices_cache = ["trade_status"]
+    filter_choices_lazy = ["trade_status"]
+
+
+xadmin.site.register(AlipayNotify, AlipayNotifyAdmin)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from trade.notify import notify_queue
+
+
+class Command(BaseCommand):
+    """
+    处理保存的未处理支付宝通知（ALIPAY_NOTIFY_ASYNC时使用，可配置为定时任务执行）
+    python manage.py process_alipay_notify
+    """
+    help = '处理未处理的支付宝异步通知'
+
+    def handle(self, *args, **options):
+        count = notify_queue.retry_pending()
+        self.stdout.write(self.style.SUCCESS('已处理{}条支付宝通知'.format(count)))
@@ -0,0 +1,38 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from trade.models import ShoppingCart
+from trade.stock import release_stock_bulk
+
+
+class Command(BaseCommand):
+    """
+    清除长时间未修改的购物车记录，并归还其预留的库存（可配置为定时任务执行）
+    python manage.py release_expired_carts
+    """
+    help = '清除过期的购物车记录并归还库存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=settings.CART_RESERVATION_TIMEOUT,
+                            help='购物车记录超过多少分钟未修改即过期，默认为settings.CART_RESERVATION_TIMEOUT')
+
+    def handle(self, *args, **options):
+        if not options['minutes']:
+            self.stdout.write('未设置购物车过期时间，不做处理')
+            return
+
+        deadline = datetime.datetime.now() - datetime.timedelta(minutes=options['minutes'])
+        with transaction.atomic():
+            # 锁住过期记录，避免与下单（清空购物车）同时处理导致库存重复归还
+            carts = list(ShoppingCart.objects.select_for_update().filter(update_time__lt=deadline)
+                         .values_list('id', 'goods_id', 'nums'))
+            goods_nums = {}
+            for cart_id, goods_id, nums in carts:
+                goods_nums[goods_id] = goods_nums.get(goods_id, 0) + nums
+            ShoppingCart.objects.filter(id__in=[cart[0] for cart in carts]).delete()
+            release_stock_bulk(goods_nums)
+
+        self.stdout.write(self.style.SUCCESS('已清除{}条过期购物车记录'.format(len(carts))))
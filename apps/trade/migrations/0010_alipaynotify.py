@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 22:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0009_shoppingcart_update_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlipayNotify',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_sn', models.CharField(max_length=30, verbose_name='订单号')),
+                ('trade_no', models.CharField(max_length=100, verbose_name='交易号')),
+                ('trade_status', models.CharField(max_length=20, verbose_name='交易状态')),
+                ('processed', models.BooleanField(db_index=True, default=False, verbose_name='是否已处理')),
+                ('attempts', models.IntegerField(default=0, verbose_name='处理次数')),
+                ('add_time', models.DateTimeField(auto_now_add=True, verbose_name='添加时间')),
+            ],
+            options={
+                'verbose_name': '支付宝通知',
+                'verbose_name_plural': '支付宝通知',
+            },
+        ),
+    ]
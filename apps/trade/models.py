@@ -16,6 +16,8 @@ class ShoppingCart(models.Model):
     goods = models.ForeignKey(Goods,verbose_name='商品')
     nums = models.IntegerField('商品数量',default=0)
     add_time = models.DateTimeField('添加时间',auto_now_add=True)
+    # 最后修改时间，超过CART_RESERVATION_TIMEOUT未修改的购物车记录会被清除并归还库存
+    update_time = models.DateTimeField('修改时间',auto_now=True)
 
     class Meta:
         verbose_name = '购物车'
@@ -84,3 +86,22 @@ class OrderGoods(models.Model):
 
     def __str__(self):
         return self.order.order_sn
+
+
+class AlipayNotify(models.Model):
+    """
+    支付宝异步通知（ALIPAY_NOTIFY_ASYNC时先保存通知再向支付宝返回success，由后台线程处理，处理失败时重试）
+    """
+    order_sn = models.CharField('订单号',max_length=30)
+    trade_no = models.CharField('交易号',max_length=100)
+    trade_status = models.CharField('交易状态',max_length=20)
+    processed = models.BooleanField('是否已处理',default=False,db_index=True)
+    attempts = models.IntegerField('处理次数',default=0)
+    add_time = models.DateTimeField('添加时间',auto_now_add=True)
+
+    class Meta:
+        verbose_name = '支付宝通知'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return '{}({})'.format(self.order_sn,self.trade_status)
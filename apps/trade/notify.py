@@ -0,0 +1,147 @@
+import atexit
+import logging
+import threading
+from queue import Queue, Empty
+from datetime import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import F, Sum
+
+from goods.models import Goods
+from .models import OrderInfo, OrderGoods, AlipayNotify
+
+logger = logging.getLogger(__name__)
+
+# 支付成功的订单状态，订单第一次进入这些状态时才累加销量
+PAID_STATUS = ('TRADE_SUCCESS', 'TRADE_FINISHED')
+
+
+def process_alipay_notify(order_sn, trade_no, trade_status):
+    """
+    处理支付宝异步通知（幂等）
+    支付宝会重复发送通知，通知的到达顺序也不确定：
+    订单支付成功后不再改变状态（迟到的WAIT_BUYER_PAY、TRADE_CLOSED等通知直接忽略），
+    因此销量只会在订单第一次支付成功时累加一次
+    :return: 是否更新了订单
+    """
+    with transaction.atomic():
+        # 锁住订单，同一订单的重复通知串行处理
+        order = OrderInfo.objects.select_for_update().filter(order_sn=order_sn).first()
+        if order is None:
+            return False
+        if order.pay_status in PAID_STATUS:
+            return False
+        if order.trade_no == trade_no and order.pay_status == trade_status:
+            return False
+
+        if trade_status in PAID_STATUS:
+            # 按商品汇总数量，相同数量的商品合并为一条 UPDATE ... SET sold_num = sold_num + n
+            goods_nums = (OrderGoods.objects.filter(order_id=order.id)
+                          .values_list('goods_id').annotate(nums=Sum('goods_num')))
+            groups = defaultdict(list)
+            for goods_id, nums in goods_nums:
+                groups[nums].append(goods_id)
+            for nums, goods_ids in groups.items():
+                Goods.objects.filter(id__in=goods_ids).update(sold_num=F('sold_num') + nums)
+
+        OrderInfo.objects.filter(id=order.id).update(trade_no=trade_no, pay_time=datetime.now(),
+                                                     pay_status=trade_status)
+    return True
+
+
+class NotifyQueue(object):
+    """
+    支付宝通知队列
+    通知验签后先保存到AlipayNotify表再返回success（保存失败时不返回success，支付宝会重新发送），
+    由后台线程依次处理，应对通知集中到达的情况
+    处理失败的通知（以及进程退出前没有处理完的通知）留在表中，每隔retry_interval秒重试，
+    最多处理max_attempts次；也可以用 python manage.py process_alipay_notify 处理
+    """
+    retry_interval = 60
+    max_attempts = 10
+
+    def __init__(self):
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def put(self, notify_id):
+        self._ensure_started()
+        self._queue.put(notify_id)
+
+    def drain(self):
+        """
+        处理队列中剩余的通知（进程退出时调用）
+        """
+        while not self._queue.empty():
+            self.process(self._queue.get())
+
+    def process(self, notify_id):
+        """
+        处理一条保存的通知，处理完成与订单的更新在同一个事务中标记，失败时留待重试
+        :return: 是否处理成功
+        """
+        try:
+            with transaction.atomic():
+                notify = AlipayNotify.objects.select_for_update().filter(id=notify_id, processed=False).first()
+                if notify is None:
+                    return True
+                process_alipay_notify(notify.order_sn, notify.trade_no, notify.trade_status)
+                AlipayNotify.objects.filter(id=notify_id).update(processed=True, attempts=F('attempts') + 1)
+            return True
+        except Exception:
+            # 已经向支付宝返回了success，支付宝不会再发送这条通知，由retry_pending重试
+            logger.exception('alipay notify failed: %s', notify_id)
+            AlipayNotify.objects.filter(id=notify_id).update(attempts=F('attempts') + 1)
+            return False
+
+    def retry_pending(self):
+        """
+        重试未处理的通知
+        :return: 处理成功的通知数
+        """
+        notify_ids = (AlipayNotify.objects.filter(processed=False, attempts__lt=self.max_attempts)
+                      .order_by('id').values_list('id', flat=True))
+        return sum(1 for notify_id in list(notify_ids) if self.process(notify_id))
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            thread = threading.Thread(target=self._run, name='alipay-notify')
+            thread.daemon = True
+            thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                notify_id = self._queue.get(timeout=self.retry_interval)
+            except Empty:
+                close_old_connections()
+                try:
+                    self.retry_pending()
+                except Exception:
+                    logger.exception('alipay notify retry failed')
+                continue
+            close_old_connections()
+            self.process(notify_id)
+
+
+notify_queue = NotifyQueue()
+atexit.register(notify_queue.drain)
+
+
+def handle_alipay_notify(order_sn, trade_no, trade_status):
+    """
+    根据settings.ALIPAY_NOTIFY_ASYNC同步处理或保存后放入队列
+    """
+    if settings.ALIPAY_NOTIFY_ASYNC:
+        notify = AlipayNotify.objects.create(order_sn=order_sn, trade_no=trade_no, trade_status=trade_status)
+        notify_queue.put(notify.id)
+    else:
+        process_alipay_notify(order_sn, trade_no, trade_status)
@@ -1,11 +1,53 @@
 import time
+from datetime import datetime
 
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction,IntegrityError
+from django.db.models import F
 from rest_framework import serializers
 
 from .models import Goods,ShoppingCart,OrderInfo,OrderGoods
 from goods.serializers import GoodsSerializer
 from MxShop.settings import alipay_private_key,alipay_pub_key
-from utils.alipay import AliPay
+from utils.alipay import get_alipay_client
+
+
+# 可以支付的订单状态，其他状态不生成支付url
+PAYABLE_STATUS = ('paying', 'WAIT_BUYER_PAY')
+
+
+def get_order_alipay_url(order):
+    """
+    生成订单的支付宝支付url
+    签名后的url在ALIPAY_URL_TIMEOUT内缓存复用（url中带有时间戳，超时后重新生成）
+    :return: 支付url，订单不可支付时返回None
+    """
+    if order.pay_status not in PAYABLE_STATUS:
+        return None
+
+    cache_key = 'alipay_url:{}:{}'.format(order.order_sn, order.order_mount)
+    re_url = cache.get(cache_key)
+    if re_url is None:
+        alipay = get_alipay_client(
+            appid="2016082100304253",
+            app_notify_url="http://123.206.229.93:8000/alipay/return/",
+            app_private_key_path=alipay_private_key,
+            alipay_public_key_path=alipay_pub_key,  # 支付宝的公钥，验证支付宝回传消息使用，不是你自己的公钥,
+            debug=True,  # 默认False,
+            return_url="http://123.206.229.93:8000/alipay/return/"  # 支付宝付款完成后返回的url
+        )
+
+        # 生成支付url
+        url = alipay.direct_pay(
+            subject=order.order_sn,
+            out_trade_no=order.order_sn,
+            total_amount=order.order_mount,
+            # return_url="http://123.206.229.93:8000/" # 返回链接
+        )
+        re_url = "https://openapi.alipaydev.com/gateway.do?{data}".format(data=url)
+        cache.set(cache_key, re_url, settings.ALIPAY_URL_TIMEOUT)
+    return re_url
 
 
 class ShopCartDetailSetializer(serializers.ModelSerializer):
@@ -47,17 +89,21 @@ class ShopCartSerializer(serializers.Serializer):
         nums = validated_data['nums']  # validated_data是验证后的字典
         goods = validated_data['goods']
 
-        # 是否存在记录
-        existed = ShoppingCart.objects.filter(user=user,goods=goods)
-        if existed:
-            existed = existed[0]
-            existed.nums += nums # 存在，数量增加（或减少）
-            existed.save()
-        else:
-            # 不存在，创建记录
-            existed = ShoppingCart.objects.create(**validated_data)
+        # 存在记录时数量增加：UPDATE ... SET nums = nums + n 原子累加，并发添加同一商品时数量不会丢失
+        if not self.add_nums(user, goods, nums):
+            try:
+                # 不存在，创建记录
+                with transaction.atomic():
+                    return ShoppingCart.objects.create(**validated_data)
+            except IntegrityError:
+                # 并发请求已经创建了记录（unique_together），改为累加数量
+                self.add_nums(user, goods, nums)
+
+        return ShoppingCart.objects.get(user=user,goods=goods)
 
-        return existed
+    def add_nums(self, user, goods, nums):
+        return ShoppingCart.objects.filter(user=user,goods=goods).update(nums=F('nums') + nums,
+                                                                          update_time=datetime.now())
 
     # Serializer并不像ModelSerializer实现了update，所以要手动重载
     # update方法主要是实现了model记录的更新，并返回该记录
@@ -100,24 +146,7 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         :param obj:
         :return:
         """
-        alipay = AliPay(
-            appid="2016082100304253",
-            app_notify_url="http://123.206.229.93:8000/alipay/return/",
-            app_private_key_path=alipay_private_key,
-            alipay_public_key_path=alipay_pub_key,  # 支付宝的公钥，验证支付宝回传消息使用，不是你自己的公钥,
-            debug=True,  # 默认False,
-            return_url="http://123.206.229.93:8000/alipay/return/"  # 支付宝付款完成后返回的url
-        )
-
-        # 生成支付url
-        url = alipay.direct_pay(
-            subject=obj.order_sn,
-            out_trade_no=obj.order_sn,
-            total_amount=obj.order_mount,
-            # return_url="http://123.206.229.93:8000/" # 返回链接
-        )
-        re_url = "https://openapi.alipaydev.com/gateway.do?{data}".format(data=url)
-        return re_url
+        return get_order_alipay_url(obj)
 
     class Meta:
         model = OrderInfo
@@ -138,6 +167,8 @@ class OrderSerializer(serializers.ModelSerializer):
     trade_no = serializers.CharField(read_only=True)
     order_sn = serializers.CharField(read_only=True)
     pay_time = serializers.DateTimeField(read_only=True)
+    # 订单金额由服务端根据购物车计算
+    order_mount = serializers.FloatField(read_only=True)
 
     # Serializer中的SerializerMethodField是用method动态生成的字段，它不在model中，一般read_only，直接返回
     alipay_url = serializers.SerializerMethodField(read_only=True)
@@ -149,24 +180,14 @@ class OrderSerializer(serializers.ModelSerializer):
         :param obj:
         :return:
         """
-        alipay = AliPay(
-            appid="2016082100304253",
-            app_notify_url="http://123.206.229.93:8000/alipay/return/",
-            app_private_key_path=alipay_private_key,
-            alipay_public_key_path=alipay_pub_key,  # 支付宝的公钥，验证支付宝回传消息使用，不是你自己的公钥,
-            debug=True,  # 默认False,
-            return_url="http://123.206.229.93:8000/alipay/return/"  # 支付宝付款完成后返回的url
-        )
-
-        # 生成支付url
-        url = alipay.direct_pay(
-            subject=obj.order_sn,
-            out_trade_no=obj.order_sn,
-            total_amount=obj.order_mount,
-            # return_url="http://123.206.229.93:8000/" # 返回链接
-        )
-        re_url = "https://openapi.alipaydev.com/gateway.do?{data}".format(data=url)
-        return re_url
+        # list时默认不生成（每个订单都要做一次RSA签名），可通过 ?alipay_url=1 开启，
+        # 或者使用 orders/<id>/alipay_url/ 单独获取
+        # 参数按布尔值解析（?alipay_url=0、false不会开启）
+        view = self.context.get('view')
+        if view is not None and view.action == 'list' and \
+                self.context['request'].query_params.get('alipay_url') not in serializers.BooleanField.TRUE_VALUES:
+            return None
+        return get_order_alipay_url(obj)
 
     def generate_order_sn(self):
         """
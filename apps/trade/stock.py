@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+from django.db.models import F
+from rest_framework import serializers
+
+from goods.models import Goods
+
+
+def reserve_stock(goods_id, nums):
+    """
+    预留库存（条件原子扣减）：UPDATE ... SET goods_num = goods_num - n WHERE id = ? AND goods_num >= n
+    并发时由数据库保证不会超卖，库存不足时抛出ValidationError
+    """
+    if nums <= 0:
+        return
+    updated = Goods.objects.filter(id=goods_id, goods_num__gte=nums).update(goods_num=F('goods_num') - nums)
+    if not updated:
+        raise serializers.ValidationError({'nums': '商品库存不足'})
+
+
+def release_stock(goods_id, nums):
+    """
+    归还库存
+    """
+    if nums <= 0:
+        return
+    Goods.objects.filter(id=goods_id).update(goods_num=F('goods_num') + nums)
+
+
+def adjust_stock(goods_id, delta):
+    """
+    按购物车数量的变化调整库存（delta>0 预留，delta<0 归还）
+    """
+    if delta > 0:
+        reserve_stock(goods_id, delta)
+    elif delta < 0:
+        release_stock(goods_id, -delta)
+
+
+def release_stock_bulk(goods_nums):
+    """
+    批量归还库存，归还数量相同的商品合并为一条UPDATE
+    :param goods_nums: {goods_id: nums}
+    """
+    groups = defaultdict(list)
+    for goods_id, nums in goods_nums.items():
+        if nums > 0:
+            groups[nums].append(goods_id)
+    for nums, goods_ids in groups.items():
+        Goods.objects.filter(id__in=goods_ids).update(goods_num=F('goods_num') + nums)
@@ -1,3 +1,541 @@
-from django.test import TestCase
+import calendar
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from Crypto.PublicKey import RSA
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import TransactionTestCase,skipUnlessDBFeature,override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase,APIClient
+from xadmin.plugins.filters import FilterPlugin
+from xadmin.views.list import LimitedCountPaginator
+
+from goods.models import Goods
+from utils import alipay as alipay_module
+from utils.alipay import load_key,get_alipay_client
+from goods.tests import create_category_tree,create_goods
+from .models import ShoppingCart,OrderInfo,OrderGoods,AlipayNotify
+from .notify import process_alipay_notify,handle_alipay_notify,notify_queue
+from .views import ShoppingCartViewset,OrderViewset
+from .adminx import OrderInfoAdmin
+
+User = get_user_model()
+
+
+class TradeTestMixin(object):
+    def setUp(self):
+        # 清空缓存和限流计数
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client.force_authenticate(self.user)
+        _, _, self.category = create_category_tree()
+
+    def create_order(self, goods_list, pay_status='paying'):
+        order = OrderInfo.objects.create(user=self.user, order_sn='sn{}'.format(OrderInfo.objects.count()),
+                                         pay_status=pay_status, signer_mobile='13800000000')
+        OrderGoods.objects.bulk_create([OrderGoods(order=order, goods=goods, goods_num=1) for goods in goods_list])
+        return order
+
+
+class CartQueryCountTest(TradeTestMixin, APITestCase):
+    """
+    购物车列表的查询次数不随商品数增加（N+1回归测试）
+    """
+    def test_list(self):
+        for count in (1, 10):
+            ShoppingCart.objects.all().delete()
+            for goods in create_goods(self.category, count):
+                ShoppingCart.objects.create(user=self.user, goods=goods, nums=1)
+            # 购物车（select_related商品、类别） + prefetch商品图片
+            with self.assertNumQueries(2):
+                response = self.client.get('/shopcarts/')
+            self.assertEqual(len(response.data), count)
+            self.assertEqual(len(response.data[0]['goods']['images']), 2)
+
+
+class OrderQueryCountTest(TradeTestMixin, APITestCase):
+    """
+    订单列表、详情的查询次数不随订单数、商品数增加（N+1回归测试）
+    """
+    def test_list(self):
+        for count in (1, 10):
+            for _ in range(count):
+                self.create_order(create_goods(self.category, 2))
+            with self.assertNumQueries(1):
+                response = self.client.get('/orders/')
+            self.assertEqual(len(response.data), OrderInfo.objects.count())
+        # list默认不生成支付url
+        self.assertIsNone(response.data[0]['alipay_url'])
+
+    def test_list_alipay_url_flag(self):
+        self.create_order(create_goods(self.category, 1))
+        for value, enabled in (('1', True), ('true', True), ('0', False), ('false', False), ('', False)):
+            cache.clear()
+            response = self.client.get('/orders/', {'alipay_url': value})
+            self.assertEqual(response.data[0]['alipay_url'] is not None, enabled, value)
+
+    def test_retrieve(self):
+        for count in (1, 10):
+            order = self.create_order(create_goods(self.category, count))
+            # 订单 + prefetch订单商品、商品、类别、商品图片各一次
+            with self.assertNumQueries(5):
+                response = self.client.get('/orders/{}/'.format(order.id))
+            self.assertEqual(len(response.data['goods']), count)
+            self.assertEqual(len(response.data['goods'][0]['goods']['images']), 2)
+
+
+class CheckoutTest(TradeTestMixin, APITestCase):
+    """
+    下单的查询次数与购物车商品数无关（1、20、200条），订单金额由服务端计算
+    """
+    def setUp(self):
+        super(CheckoutTest, self).setUp()
+        patcher = mock.patch.object(OrderViewset, 'throttle_classes', ())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checkout(self, lines):
+        goods_list = create_goods(self.category, lines, images=0)
+        ShoppingCart.objects.bulk_create([ShoppingCart(user=self.user, goods=goods, nums=i % 3 + 1)
+                                          for i, goods in enumerate(goods_list)])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/orders/', {'signer_mobile': '13800000000', 'order_mount': 0.01})
+        self.assertEqual(response.status_code, 201)
+
+        order = OrderInfo.objects.get(id=response.data['id'])
+        expected = round(sum((i % 3 + 1) * goods.shop_price for i, goods in enumerate(goods_list)), 2)
+        self.assertEqual(order.order_mount, expected)
+        self.assertEqual(order.goods.count(), lines)
+        self.assertFalse(ShoppingCart.objects.filter(user=self.user).exists())
+        return [query['sql'] for query in queries]
+
+    def test_constant_queries(self):
+        counts = [len(self.checkout(lines)) for lines in (1, 20, 200)]
+        self.assertEqual(counts, [counts[0]] * 3)
+
+    def test_lock_only_cart_rows(self):
+        # 锁购物车的查询不能join商品表，否则FOR UPDATE会连同商品行一起锁住
+        cart_queries = [sql for sql in self.checkout(3) if sql.startswith('SELECT') and 'trade_shoppingcart' in sql]
+        self.assertTrue(cart_queries)
+        self.assertTrue(all('JOIN' not in sql for sql in cart_queries))
+
+    def test_empty_cart(self):
+        response = self.client.post('/orders/', {'signer_mobile': '13800000000'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OrderInfo.objects.exists())
+
+
+class AlipayNotifyTest(TradeTestMixin, APITestCase):
+    """
+    支付宝通知：乱序、重复的通知不会重复累加销量；异步处理失败的通知会被重试
+    """
+    def setUp(self):
+        super(AlipayNotifyTest, self).setUp()
+        self.goods = create_goods(self.category, 1)[0]
+        self.order = self.create_order([self.goods])
+        OrderGoods.objects.filter(order=self.order).update(goods_num=2)
+
+    def assertOrder(self, pay_status, sold_num):
+        self.assertEqual(OrderInfo.objects.get(id=self.order.id).pay_status, pay_status)
+        self.assertEqual(Goods.objects.get(id=self.goods.id).sold_num, sold_num)
+
+    def test_duplicate_notify(self):
+        self.assertTrue(process_alipay_notify(self.order.order_sn, 'trade1', 'TRADE_SUCCESS'))
+        self.assertFalse(process_alipay_notify(self.order.order_sn, 'trade1', 'TRADE_SUCCESS'))
+        self.assertOrder('TRADE_SUCCESS', 2)
+
+    def test_late_notify_after_paid(self):
+        process_alipay_notify(self.order.order_sn, 'trade1', 'TRADE_SUCCESS')
+        # 迟到的未支付、关闭通知不能把已支付的订单改回去，之后重复的成功通知也不会再累加销量
+        for status in ('WAIT_BUYER_PAY', 'TRADE_CLOSED', 'TRADE_SUCCESS', 'TRADE_FINISHED'):
+            self.assertFalse(process_alipay_notify(self.order.order_sn, 'trade1', status))
+        self.assertOrder('TRADE_SUCCESS', 2)
+
+    def test_wait_then_paid(self):
+        process_alipay_notify(self.order.order_sn, 'trade1', 'WAIT_BUYER_PAY')
+        self.assertOrder('WAIT_BUYER_PAY', 0)
+        process_alipay_notify(self.order.order_sn, 'trade1', 'TRADE_SUCCESS')
+        self.assertOrder('TRADE_SUCCESS', 2)
+
+    @override_settings(ALIPAY_NOTIFY_ASYNC=True)
+    def test_async_notify_saved_and_retried(self):
+        with mock.patch.object(notify_queue, 'put') as put:
+            handle_alipay_notify(self.order.order_sn, 'trade1', 'TRADE_SUCCESS')
+        notify = AlipayNotify.objects.get()
+        put.assert_called_once_with(notify.id)
+
+        # 处理失败时通知保留在表中
+        with mock.patch('trade.notify.process_alipay_notify', side_effect=RuntimeError), \
+                self.assertLogs('trade.notify', 'ERROR'):
+            self.assertFalse(notify_queue.process(notify.id))
+        notify.refresh_from_db()
+        self.assertFalse(notify.processed)
+        self.assertEqual(notify.attempts, 1)
+        self.assertOrder('paying', 0)
+
+        # 重试成功后标记为已处理，再次重试不会重复处理
+        self.assertEqual(notify_queue.retry_pending(), 1)
+        notify.refresh_from_db()
+        self.assertTrue(notify.processed)
+        self.assertOrder('TRADE_SUCCESS', 2)
+        self.assertEqual(notify_queue.retry_pending(), 0)
+        self.assertOrder('TRADE_SUCCESS', 2)
+
+
+class CartStockTest(TradeTestMixin, APITestCase):
+    """
+    购物车增删改时预留的库存与购物车数量保持一致
+    """
+    def setUp(self):
+        super(CartStockTest, self).setUp()
+        # 测试中不限流
+        patcher = mock.patch.object(ShoppingCartViewset, 'throttle_classes', ())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.goods = create_goods(self.category, 1, goods_num=10)[0]
+        self.url = '/shopcarts/{}/'.format(self.goods.id)
+
+    def assertStock(self, goods_num, nums):
+        self.assertEqual(Goods.objects.get(id=self.goods.id).goods_num, goods_num)
+        self.assertEqual(sum(ShoppingCart.objects.values_list('nums', flat=True)), nums)
+
+    def test_add_update_delete(self):
+        self.client.post('/shopcarts/', {'goods': self.goods.id, 'nums': 2})
+        self.assertStock(8, 2)
+        self.client.post('/shopcarts/', {'goods': self.goods.id, 'nums': 3})
+        self.assertStock(5, 5)
+        self.client.put(self.url, {'goods': self.goods.id, 'nums': 1})
+        self.assertStock(9, 1)
+        # 库存不足
+        response = self.client.post('/shopcarts/', {'goods': self.goods.id, 'nums': 20})
+        self.assertEqual(response.status_code, 400)
+        self.assertStock(9, 1)
+        self.client.delete(self.url)
+        self.assertStock(10, 0)
+
+    def test_update_after_concurrent_add(self):
+        self.client.post('/shopcarts/', {'goods': self.goods.id, 'nums': 1})
+        stale = ShoppingCart.objects.get(goods=self.goods)
+        # get_object读出记录之后，另一个请求把数量加到了5
+        self.client.post('/shopcarts/', {'goods': self.goods.id, 'nums': 4})
+        with mock.patch.object(ShoppingCartViewset, 'get_object', return_value=stale):
+            self.client.put(self.url, {'goods': self.goods.id, 'nums': 2})
+        self.assertStock(8, 2)
+        with mock.patch.object(ShoppingCartViewset, 'get_object', return_value=stale):
+            self.client.delete(self.url)
+        self.assertStock(10, 0)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CartConcurrencyTest(TransactionTestCase):
+    """
+    多个线程同时添加、修改、删除同一商品的购物车：库存不会超卖，
+    最终库存 = 初始库存 - 所有购物车中该商品的数量
+    需要支持SELECT ... FOR UPDATE的数据库（MySQL），SQLite上跳过
+    """
+    threads = 20
+    rounds = 10
+    stock = 50
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(ShoppingCartViewset, 'throttle_classes', ())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        _, _, category = create_category_tree()
+        self.goods = create_goods(category, 1, goods_num=self.stock)[0]
+        # 用户数少于线程数，同一条购物车记录会被多个线程同时修改
+        self.users = [User.objects.create_user(username='buyer{}'.format(i), password='password') for i in range(4)]
+
+    def worker(self, index, barrier, errors):
+        client = APIClient()
+        client.force_authenticate(self.users[index % len(self.users)])
+        url = '/shopcarts/{}/'.format(self.goods.id)
+        rand = random.Random(index)
+        try:
+            barrier.wait()
+            for _ in range(self.rounds):
+                action = rand.random()
+                if action < 0.6:
+                    response = client.post('/shopcarts/', {'goods': self.goods.id, 'nums': rand.randint(1, 3)})
+                elif action < 0.9:
+                    response = client.put(url, {'goods': self.goods.id, 'nums': rand.randint(1, 5)})
+                else:
+                    response = client.delete(url)
+                # 库存不足返回400，记录已被删除返回404
+                if response.status_code not in (200, 201, 204, 400, 404):
+                    errors.append(response.status_code)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_concurrent_cart(self):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+        threads = [threading.Thread(target=self.worker, args=(i, barrier, errors)) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        goods_num = Goods.objects.get(id=self.goods.id).goods_num
+        reserved = sum(ShoppingCart.objects.filter(goods=self.goods).values_list('nums', flat=True))
+        self.assertGreaterEqual(goods_num, 0)
+        self.assertEqual(goods_num + reserved, self.stock)
+
+
+class AlipayKeyTest(APITestCase):
+    """
+    密钥按修改时间缓存，KEY_CHECK_INTERVAL内不访问文件系统；验证失败时立即检查公钥文件是否更换
+    """
+    @classmethod
+    def setUpClass(cls):
+        super(AlipayKeyTest, cls).setUpClass()
+        cls.rsa_keys = [RSA.generate(1024) for _ in range(2)]
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.private_path = self.write_key('private.txt', self.rsa_keys[0], mtime=1000)
+        self.public_path = self.write_key('public.txt', self.rsa_keys[0].publickey(), mtime=1000)
+        self.addCleanup(alipay_module._keys.clear)
+        self.addCleanup(alipay_module._clients.clear)
+
+    def write_key(self, name, key, mtime):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as fp:
+            fp.write(key.exportKey())
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_mtime_checked_once_per_interval(self):
+        with mock.patch('os.path.getmtime', wraps=os.path.getmtime) as getmtime, \
+                mock.patch('time.time', return_value=5000):
+            key = load_key(self.private_path)
+            self.assertIs(load_key(self.private_path), key)
+            self.assertEqual(getmtime.call_count, 1)
+
+            # 文件修改后，超过检查间隔才重新加载
+            self.write_key('private.txt', self.rsa_keys[1], mtime=2000)
+            self.assertIs(load_key(self.private_path), key)
+        with mock.patch('time.time', return_value=5000 + alipay_module.KEY_CHECK_INTERVAL):
+            new_key = load_key(self.private_path)
+        self.assertEqual(new_key, self.rsa_keys[1])
+        # 修改时间不变时不重新解析
+        with mock.patch('time.time', return_value=6000), mock.patch.object(RSA, 'importKey') as import_key:
+            self.assertIs(load_key(self.private_path), new_key)
+        import_key.assert_not_called()
+
+    def test_verify_reloads_rotated_public_key(self):
+        client = get_alipay_client('appid', 'http://notify/', self.private_path, self.public_path, 'http://return/')
+        data = {'out_trade_no': '1', 'trade_no': '2'}
+        signature = client.sign('out_trade_no=1&trade_no=2'.encode('utf-8'))
+        self.assertTrue(client.verify(dict(data), signature))
+
+        # 支付宝更换了密钥，缓存的公钥还未到检查时间
+        self.write_key('public.txt', self.rsa_keys[1].publickey(), mtime=2000)
+        signer = get_alipay_client('appid', 'http://notify/', self.write_key('private2.txt', self.rsa_keys[1], 1000),
+                                   self.public_path, 'http://return/')
+        signature = signer.sign('out_trade_no=1&trade_no=2'.encode('utf-8'))
+        self.assertFalse(client.verify(dict(data), 'x' + signature[1:]))
+        self.assertTrue(client.verify(dict(data), signature))
+
+    def test_client_registry(self):
+        args = ('appid', 'http://notify/', self.private_path, self.public_path, 'http://return/')
+        client = get_alipay_client(*args)
+        self.assertIs(get_alipay_client(*args), client)
+        self.assertIsNot(get_alipay_client(*args, debug=True), client)
+        self.assertIsNot(get_alipay_client('appid2', *args[1:]), client)
+
+
+class RecordingPaginator(Paginator):
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingPaginator, self).__init__(*args, **kwargs)
+        self.instances.append(self)
+
+
+class OrderAdminPaginatorTest(TradeTestMixin, APITestCase):
+    """
+    后台订单列表设置了list_count_limit，自定义的paginator_class仍然生效
+    """
+    def setUp(self):
+        super(OrderAdminPaginatorTest, self).setUp()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        for i in range(3):
+            self.create_order([])
+
+    def test_custom_paginator_class(self):
+        del RecordingPaginator.instances[:]
+        with mock.patch.object(OrderInfoAdmin, 'paginator_class', RecordingPaginator, create=True):
+            response = self.client.get('/xadmin/trade/orderinfo/')
+        self.assertEqual(response.status_code, 200)
+        paginator = RecordingPaginator.instances[-1]
+        self.assertIsInstance(paginator, LimitedCountPaginator)
+        self.assertEqual((paginator.count, paginator.count_exact, paginator.count_limit), (3, True, 10000))
+
+    def test_default_paginator_class(self):
+        response = self.client.get('/xadmin/trade/orderinfo/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(type(response.context_data['cl'].paginator), LimitedCountPaginator)
+
+
+def chart_time(*args):
+    # 图表数据中的时间是毫秒时间戳
+    return calendar.timegm(datetime.datetime(*args).timetuple()) * 1000
+
+
+class OrderChartTest(TradeTestMixin, APITestCase):
+    """
+    后台图表的聚合：按日、周、月分组求和，avg按(sum, count)合并点，distinct查询按主键重新过滤，结果缓存
+    """
+    def setUp(self):
+        super(OrderChartTest, self).setUp()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        # 2018-01-01和2018-01-08是星期一
+        self.orders = []
+        for day, amount in (((2018, 1, 1, 9), 10), ((2018, 1, 1, 18), 20), ((2018, 1, 3, 12), 30),
+                            ((2018, 1, 8, 12), 40), ((2018, 2, 5, 12), 100)):
+            order = self.create_order([])
+            OrderInfo.objects.filter(pk=order.pk).update(add_time=datetime.datetime(*day), order_mount=amount)
+            self.orders.append(order)
+
+    def chart(self, params=None, **chart):
+        chart = dict({'title': 'amount', 'x-field': 'add_time', 'y-field': 'order_mount'}, **chart)
+        with mock.patch.object(OrderInfoAdmin, 'data_charts', {'amount': chart}, create=True):
+            response = self.client.get('/xadmin/trade/orderinfo/chart/amount/', params or {})
+        self.assertEqual(response.status_code, 200)
+        return [[tuple(point) for point in series['data']] for series in json.loads(response.content.decode('utf8'))['data']]
+
+    def test_day_and_month_sum(self):
+        self.assertEqual(self.chart(bucket='day', aggregate='sum'),
+                         [[(chart_time(2018, 1, 1), 30), (chart_time(2018, 1, 3), 30),
+                           (chart_time(2018, 1, 8), 40), (chart_time(2018, 2, 5), 100)]])
+        self.assertEqual(self.chart(bucket='month', aggregate=('sum', 'count'), **{'y-field': ('order_mount', 'id')}),
+                         [[(chart_time(2018, 1, 1), 100), (chart_time(2018, 2, 1), 100)],
+                          [(chart_time(2018, 1, 1), 4), (chart_time(2018, 2, 1), 1)]])
+
+    def test_week_bucket(self):
+        # Django 1.11没有TruncWeek，按天分组后合并到所在周的星期一
+        self.assertEqual(self.chart(bucket='week', aggregate='sum'),
+                         [[(chart_time(2018, 1, 1), 60), (chart_time(2018, 1, 8), 40), (chart_time(2018, 2, 5), 100)]])
+
+    def test_avg_downsampled(self):
+        self.assertEqual(self.chart(bucket='day', aggregate='avg'),
+                         [[(chart_time(2018, 1, 1), 15), (chart_time(2018, 1, 3), 30),
+                           (chart_time(2018, 1, 8), 40), (chart_time(2018, 2, 5), 100)]])
+        # 合并相邻的点时按(sum, count)计算，而不是平均值的平均值
+        self.assertEqual(self.chart(bucket='day', aggregate='avg', **{'max-points': 2}),
+                         [[(chart_time(2018, 1, 1), 20), (chart_time(2018, 1, 8), 70)]])
+
+    def test_distinct_refiltered(self):
+        OrderGoods.objects.bulk_create([OrderGoods(order=self.orders[0], goods=goods, goods_num=1)
+                                        for goods in create_goods(self.category, 2, images=0)])
+        # 按订单商品搜索时关联查询使用distinct，一个订单有两个匹配的商品也只计算一次
+        # 插件的选项在生成url时已从OrderInfoAdmin复制，OrderInfoAdmin没有search_fields，使用FilterPlugin的默认值
+        with mock.patch.object(FilterPlugin, 'search_fields', ['goods__goods__name']):
+            self.assertEqual(self.chart({'_q_': '商品'}, bucket='day', aggregate='sum'),
+                             [[(chart_time(2018, 1, 1), 10)]])
+
+    def test_cache(self):
+        def group_by_queries():
+            with CaptureQueriesContext(connection) as queries:
+                data = self.chart(bucket='day', aggregate='sum')
+            return data, [q['sql'] for q in queries if 'GROUP BY' in q['sql']]
+
+        data, queries = group_by_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(group_by_queries(), (data, []))
+        # 过滤条件不同时分别缓存
+        with mock.patch.object(FilterPlugin, 'search_fields', ['order_sn']):
+            self.assertEqual(self.chart({'_q_': self.orders[2].order_sn}, bucket='day', aggregate='sum'),
+                             [[(chart_time(2018, 1, 3), 30)]])
+
+
+class AlipayNotifyFilterTest(TransactionTestCase):
+    """
+    后台支付宝通知列表的交易状态筛选：可选值延迟加载、缓存，新通知保存后失效，最多列出filter_choices_limit个
+    """
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        for status in ('TRADE_SUCCESS', 'TRADE_SUCCESS', 'TRADE_CLOSED', 'WAIT_BUYER_PAY'):
+            self.create_notify(status)
+
+    def create_notify(self, status):
+        return AlipayNotify.objects.create(order_sn='sn', trade_no='no', trade_status=status)
+
+    def get(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/xadmin/trade/alipaynotify/', params or {})
+        choices_queries = [q['sql'] for q in queries if 'DISTINCT "trade_alipaynotify"."trade_status"' in q['sql']]
+        return response, choices_queries
+
+    def get_choices(self):
+        response, queries = self.get({'_filter_choices': 'trade_status'})
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode('utf8'), len(queries)
+
+    def test_lazy_choices_cached(self):
+        # 列表页不查询可选值
+        response, queries = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+        self.assertIn('data-choices-url', response.content.decode('utf8'))
+
+        content, count = self.get_choices()
+        self.assertEqual(count, 1)
+        for status in ('TRADE_SUCCESS', 'TRADE_CLOSED', 'WAIT_BUYER_PAY'):
+            self.assertIn(status, content)
+        self.assertEqual(self.get_choices(), (content, 0))
+
+        # 保存通知后缓存失效
+        self.create_notify('TRADE_FINISHED')
+        content, count = self.get_choices()
+        self.assertEqual(count, 1)
+        self.assertIn('TRADE_FINISHED', content)
+        self.assertEqual(self.get_choices(), (content, 0))
+
+    def test_cached_on_list_page(self):
+        with mock.patch('trade.adminx.AlipayNotifyAdmin.filter_choices_lazy', False):
+            self.assertEqual(len(self.get()[1]), 1)
+            self.assertEqual(self.get()[1], [])
+            self.create_notify('TRADE_FINISHED')
+            self.assertEqual(len(self.get()[1]), 1)
+
+    def test_limit(self):
+        with mock.patch('trade.adminx.AlipayNotifyAdmin.filter_choices_lazy', False), \
+                mock.patch('trade.adminx.AlipayNotifyAdmin.filter_choices_limit', 2, create=True):
+            response, queries = self.get()
+        # 多读取一个值判断是否截断，不再执行count()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('LIMIT 3', queries[0])
+        spec = [spec for spec in response.context_data['cl'].filter_specs if spec.field_path == 'trade_status'][0]
+        self.assertEqual(len(spec.lookup_choices), 2)
+        self.assertTrue(spec.choices_truncated)
+
+        with mock.patch('trade.adminx.AlipayNotifyAdmin.filter_choices_lazy', False), \
+                mock.patch('trade.adminx.AlipayNotifyAdmin.filter_choices_limit', 3, create=True):
+            response, queries = self.get()
+        spec = [spec for spec in response.context_data['cl'].filter_specs if spec.field_path == 'trade_status'][0]
+        self.assertEqual(len(spec.lookup_choices), 3)
+        self.assertFalse(spec.choices_truncated)
+
+    def test_unknown_filter(self):
+        response, queries = self.get({'_filter_choices': 'order_sn'})
+        self.assertEqual(response.status_code, 404)
@@ -1,18 +1,26 @@
 import time
 
 from rest_framework import viewsets,mixins
+from rest_framework import serializers
+from rest_framework.decorators import detail_route
+from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_jwt.authentication import JSONWebTokenAuthentication
 from rest_framework.authentication import SessionAuthentication
-from django.shortcuts import redirect
+from django.shortcuts import redirect,get_object_or_404
+from django.db import transaction
 
+from goods.models import Goods
 from utils.permissions import IsOwnerOrReadOnly
-from utils.alipay import AliPay
-from .serializers import ShopCartSerializer,ShopCartDetailSetializer,OrderSerializer,OrderDetailSerializer
+from utils.alipay import get_alipay_client
+from utils.eager_loading import EagerLoadingMixin
+from .serializers import ShopCartSerializer,ShopCartDetailSetializer,OrderSerializer,OrderDetailSerializer,get_order_alipay_url
 from .models import ShoppingCart,OrderInfo,OrderGoods
+from .stock import reserve_stock,release_stock,adjust_stock
+from .notify import handle_alipay_notify
 from MxShop.settings import alipay_private_key,alipay_pub_key
 
-class ShoppingCartViewset(viewsets.ModelViewSet):
+class ShoppingCartViewset(EagerLoadingMixin, viewsets.ModelViewSet):
     """
     购物车功能
     list:
@@ -48,33 +56,33 @@ class ShoppingCartViewset(viewsets.ModelViewSet):
         else:
             return ShopCartSerializer
 
-    # 添加购物车时更新库存
+    # 库存通过stock模块以条件原子更新的方式预留/归还，避免并发时超卖
+    # 添加购物车时预留库存（本次添加的数量）
     def perform_create(self, serializer):
-        shop_cart = serializer.save()
-        goods = shop_cart.goods
-        goods.goods_num -= shop_cart.nums
-        goods.save()
+        with transaction.atomic():
+            reserve_stock(serializer.validated_data['goods'].id, serializer.validated_data['nums'])
+            serializer.save()
+
+    # 删除、更新购物车时先锁住购物车记录再读取数量（get_object读出的数量可能已被并发请求修改），
+    # 同一条记录的并发请求串行执行，归还/预留的库存与nums保持一致
+    def lock_cart_nums(self, instance):
+        return get_object_or_404(ShoppingCart.objects.select_for_update(), id=instance.id).nums
 
-    # 删除购物车时更新库存
+    # 删除购物车时归还库存
     def perform_destroy(self, instance):
-        goods = instance.goods
-        goods.goods_num += instance.nums
-        goods.save()
-        instance.delete()
+        with transaction.atomic():
+            release_stock(instance.goods_id, self.lock_cart_nums(instance))
+            instance.delete()
 
-    # 更新购物车时更新库存
+    # 更新购物车时按数量变化预留或归还库存
     def perform_update(self, serializer):
-        # model实例放在serializer.instance
-        existed_record = ShoppingCart.objects.get(id=serializer.instance.id)
-        existed_nums = existed_record.nums
-        saved_record = serializer.save()
-        nums = saved_record.nums-existed_nums
-        goods = saved_record.goods
-        goods.goods_num -= nums
-        goods.save()
+        with transaction.atomic():
+            existed_nums = self.lock_cart_nums(serializer.instance)
+            adjust_stock(serializer.instance.goods_id, serializer.validated_data['nums'] - existed_nums)
+            serializer.save()
 
 
-class OrderViewset(mixins.ListModelMixin,mixins.RetrieveModelMixin,mixins.CreateModelMixin,mixins.DestroyModelMixin, viewsets.GenericViewSet):
+class OrderViewset(EagerLoadingMixin, mixins.ListModelMixin,mixins.RetrieveModelMixin,mixins.CreateModelMixin,mixins.DestroyModelMixin, viewsets.GenericViewSet):
     """
     订单管理
     list:
@@ -107,21 +115,39 @@ class OrderViewset(mixins.ListModelMixin,mixins.RetrieveModelMixin,mixins.Create
     def get_queryset(self):
         return OrderInfo.objects.filter(user=self.request.user)
 
+    # 单独获取订单的支付url：GET orders/<id>/alipay_url/
+    @detail_route(methods=['get'])
+    def alipay_url(self, request, pk=None):
+        order = self.get_object()
+        re_url = get_order_alipay_url(order)
+        if re_url is None:
+            raise serializers.ValidationError('订单状态不可支付')
+        return Response({'alipay_url': re_url})
+
     # 重载保存记录的方法
+    # 在一个事务中完成：读取购物车 -> 保存订单 -> 批量保存订单商品 -> 批量清空购物车
     def perform_create(self, serializer):
-        # 保存订单（perform_create的原操作）
-        order = serializer.save()
-        # 保存订单对应的购物车信息并清空购物车（附加操作）
-        shop_carts = ShoppingCart.objects.filter(user=self.request.user)
-        for shop_cart in shop_carts:
-            order_goods = OrderGoods()
-            order_goods.order = order
-            order_goods.goods = shop_cart.goods
-            order_goods.goods_num = shop_cart.nums
-            # 保存订单物品信息
-            order_goods.save()
-            # 删除购物车中的相应物品
-            shop_cart.delete()
+        with transaction.atomic():
+            # 只锁住当前用户的购物车记录：join商品表的话会连同商品行一起锁住（Django 1.11不支持of=），
+            # 所有下单请求都会排队等待热门商品的行锁，而加购物车时的库存UPDATE也在写这些行
+            shop_carts = list(ShoppingCart.objects.select_for_update().filter(user=self.request.user)
+                              .values_list('id', 'goods_id', 'nums'))
+            if not shop_carts:
+                raise serializers.ValidationError('购物车为空')
+
+            # 订单金额由服务端根据商品价格计算，不使用前端提交的金额（价格单独查询，不加锁）
+            prices = dict(Goods.objects.filter(id__in={goods_id for _, goods_id, _ in shop_carts})
+                          .values_list('id', 'shop_price'))
+            order_mount = round(sum(nums * prices[goods_id] for _, goods_id, nums in shop_carts), 2)
+            # 保存订单（perform_create的原操作）
+            order = serializer.save(order_mount=order_mount)
+
+            # 保存订单对应的购物车信息并清空购物车（附加操作）
+            OrderGoods.objects.bulk_create([
+                OrderGoods(order=order, goods_id=goods_id, goods_num=nums)
+                for _, goods_id, nums in shop_carts
+            ])
+            ShoppingCart.objects.filter(id__in=[cart_id for cart_id, _, _ in shop_carts]).delete()
 
 
 from rest_framework.views import APIView
@@ -145,7 +171,7 @@ class AlipayView(APIView):
         # 将sign从字典中移除
         sign = processed_dict.pop('sign')
 
-        alipay = AliPay(
+        alipay = get_alipay_client(
             appid="2016082100304253",
             app_notify_url="http://123.206.229.93:8000/alipay/return/",
             app_private_key_path=alipay_private_key,
@@ -194,7 +220,7 @@ class AlipayView(APIView):
         # 将sign从字典中移除
         sign = processed_dict.pop('sign')
 
-        alipay = AliPay(
+        alipay = get_alipay_client(
             appid="2016082100304253",
             app_notify_url="http://123.206.229.93:8000/alipay/return/",
             app_private_key_path=alipay_private_key,
@@ -212,17 +238,8 @@ class AlipayView(APIView):
             trade_no = processed_dict.get('trade_no')
             trade_status = processed_dict.get('trade_status')
 
-            existed_orders = OrderInfo.objects.filter(order_sn=order_sn)
-            for existed_order in existed_orders:
-                # 更新销量
-                order_goods = existed_order.goods.all()
-                for order_good in order_goods:
-                    goods = order_good.goods
-                    goods.sold_num += order_good.goods_num
-                    goods.save()
-                existed_order.trade_no = trade_no
-                existed_order.pay_time = datetime.now()
-                existed_order.pay_status = trade_status
-                existed_order.save()
+            # 更新订单状态和销量（幂等，重复通知不会重复累加销量）
+            # 异步处理时先保存通知，保存失败会抛出异常，不会向支付宝返回success
+            handle_alipay_notify(order_sn, trade_no, trade_status)
             # 向支付宝返回success
             return Response('success')
\ No newline at end of file
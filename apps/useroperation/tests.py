@@ -1,3 +1,31 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from goods.tests import create_category_tree,create_goods
+from .models import UserFav
+
+User = get_user_model()
+
+
+class UserFavQueryCountTest(APITestCase):
+    """
+    收藏列表的查询次数不随收藏数增加（N+1回归测试）
+    """
+    def setUp(self):
+        # 清空缓存和限流计数
+        cache.clear()
+        self.user = User.objects.create_user(username='fan', password='password')
+        self.client.force_authenticate(self.user)
+        _, _, self.category = create_category_tree()
+
+    def test_list(self):
+        for count in (1, 10):
+            UserFav.objects.all().delete()
+            UserFav.objects.bulk_create([UserFav(user=self.user, goods=goods)
+                                         for goods in create_goods(self.category, count)])
+            # 收藏（select_related商品、类别） + prefetch商品图片
+            with self.assertNumQueries(2):
+                response = self.client.get('/userfavs/')
+            self.assertEqual(len(response.data), count)
+            self.assertEqual(len(response.data[0]['goods']['images']), 2)
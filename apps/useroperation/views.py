@@ -6,13 +6,14 @@ from rest_framework.authentication import SessionAuthentication
 from .models import UserFav,UserLeavingMessage,UserAddress
 from .serializers import UserFavSerializer,UserFavDetialSerializer,LeavingMessageSerializer,AddressSerializer
 from utils.permissions import IsOwnerOrReadOnly
+from utils.eager_loading import EagerLoadingMixin
 
 
 # CreateModelMixin：POST UserFavSerializer验证通过后自动使用fields的字段创建新记录
 # ListModelMixin: GET 访问url可直接获得所有收藏记录
 # DestroyModelMixin: DELETE url/id 可直接删除相应记录(id由lookup_field指定)
 # RetrieveModelMixin: GET url/id 可查看相应记录(id由lookup_field指定)
-class UserFavViewset(mixins.CreateModelMixin,mixins.DestroyModelMixin,mixins.ListModelMixin,mixins.RetrieveModelMixin,viewsets.GenericViewSet):
+class UserFavViewset(EagerLoadingMixin, mixins.CreateModelMixin,mixins.DestroyModelMixin,mixins.ListModelMixin,mixins.RetrieveModelMixin,viewsets.GenericViewSet):
     """
     用户收藏
     """
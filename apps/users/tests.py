@@ -1,3 +1,81 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from utils.throttling import SlidingWindowRateThrottle,ScopedSlidingWindowThrottle
+
+User = get_user_model()
+
+
+class FixedKeyThrottle(SlidingWindowRateThrottle):
+    rate = '3/minute'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': 'test', 'ident': 'client'}
+
+
+class ScopedView(object):
+    def __init__(self, scope):
+        self.throttle_scope = scope
+
+
+class SlidingWindowThrottleTest(TestCase):
+    """
+    滑动窗口限流：上一个窗口按剩余比例计入，被拒绝的请求不计数，缓存中只有每个窗口的计数
+    """
+    def setUp(self):
+        cache.clear()
+        self.request = Request(APIRequestFactory().get('/'))
+
+    def allow(self, throttle_class, now, request=None, view=None):
+        throttle = throttle_class()
+        with mock.patch.object(throttle, 'timer', return_value=now):
+            allowed = throttle.allow_request(request or self.request, view)
+        return allowed, throttle
+
+    def test_sliding_window(self):
+        start = 600
+        self.assertEqual([self.allow(FixedKeyThrottle, start + i)[0] for i in range(4)], [True, True, True, False])
+        allowed, throttle = self.allow(FixedKeyThrottle, start + 10)
+        self.assertFalse(allowed)
+        # 下一个窗口开始后上一个窗口的3个请求仍全部计入，要等到窗口过去1/3
+        self.assertAlmostEqual(throttle.wait(), 70)
+
+        # 下一个窗口过半：上一个窗口计为1.5个请求，还能再通过1个
+        self.assertEqual([self.allow(FixedKeyThrottle, start + 90 + i)[0] for i in range(2)], [True, False])
+        # 被拒绝的请求不计数
+        self.assertEqual(cache.get('throttle:sw:test:client:{}'.format(start // 60)), 3)
+        self.assertEqual(cache.get('throttle:sw:test:client:{}'.format(start // 60 + 1)), 1)
+
+        # 再过一个窗口的一半：上一个窗口的1个请求计为0.5个，还能通过2个
+        self.assertEqual([self.allow(FixedKeyThrottle, start + 150 + i)[0] for i in range(3)], [True, True, False])
+        # 上一个窗口没有请求时与固定窗口相同
+        self.assertEqual([self.allow(FixedKeyThrottle, start + 300 + i)[0] for i in range(4)],
+                         [True, True, True, False])
+
+    def test_no_history_list(self):
+        self.allow(FixedKeyThrottle, 600)
+        self.allow(FixedKeyThrottle, 601)
+        # 只保存当前窗口的计数，没有SimpleRateThrottle的请求时间列表（throttle_<scope>_<ident>）
+        self.assertEqual(cache.get('throttle:sw:test:client:10'), 2)
+        self.assertIsNone(cache.get('throttle_test_client'))
+
+    @mock.patch.object(ScopedSlidingWindowThrottle, 'THROTTLE_RATES', {'sms': '1/hour', 'login': '2/minute'})
+    def test_scopes_counted_separately(self):
+        user = User.objects.create_user(username='13800000000', password='password')
+        request = APIRequestFactory().post('/')
+        force_authenticate(request, user)
+        request = Request(request)
+        request.user
 
-# Create your tests here.
+        sms, login = ScopedView('sms'), ScopedView('login')
+        self.assertTrue(self.allow(ScopedSlidingWindowThrottle, 600, request, sms)[0])
+        self.assertFalse(self.allow(ScopedSlidingWindowThrottle, 601, request, sms)[0])
+        self.assertEqual([self.allow(ScopedSlidingWindowThrottle, 602 + i, request, login)[0] for i in range(3)],
+                         [True, True, False])
+        # 其它用户不受影响
+        self.assertTrue(self.allow(ScopedSlidingWindowThrottle, 603, self.request, sms)[0])
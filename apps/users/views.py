@@ -12,10 +12,12 @@ from rest_framework_jwt.serializers import jwt_encode_handler, jwt_payload_handl
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_jwt.authentication import JSONWebTokenAuthentication
 from rest_framework.authentication import SessionAuthentication
+from rest_framework_jwt.views import ObtainJSONWebToken
 
 from .serializers import SmsSerializer,UserRegSerializer,UserDetailSerializer
 from MxShop.settings import APIKEY
 from .models import VerifyCode
+from utils.throttling import ScopedSlidingWindowThrottle
 
 # 使用get_user_model来获取User
 User = get_user_model()
@@ -36,6 +38,9 @@ class CustomAuth(ModelBackend): # 需要继承ModelBackend，完成该类编写
 # 创建数据要继承CreateModelMixin
 class SmsVerifyCodeViewset(mixins.CreateModelMixin, viewsets.GenericViewSet):
     serializer_class = SmsSerializer
+    # 发送短信按THROTTLE_RATES['sms']单独限流
+    throttle_classes = (ScopedSlidingWindowThrottle,)
+    throttle_scope = 'sms'
 
     def generate_code(self):
         """
@@ -145,4 +150,12 @@ class UserViewset(mixins.CreateModelMixin,mixins.UpdateModelMixin,mixins.Retriev
 
     # 重置perform_create，返回user
     def perform_create(self, serializer):
-        return serializer.save()
\ No newline at end of file
+        return serializer.save()
+
+
+class LoginView(ObtainJSONWebToken):
+    """
+    jwt登录，按THROTTLE_RATES['login']单独限流
+    """
+    throttle_classes = (ScopedSlidingWindowThrottle,)
+    throttle_scope = 'login'
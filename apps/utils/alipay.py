@@ -9,9 +9,55 @@ from urllib.parse import urlparse, parse_qs
 from urllib.request import urlopen
 from base64 import decodebytes, encodebytes
 
+import os
 import json
+import time
+import threading
 from MxShop.settings import alipay_private_key,alipay_pub_key
 
+# 已解析的RSA密钥缓存 {path: (mtime, key, 检查时间)}，文件修改后自动重新加载
+_keys = {}
+# 两次检查密钥文件修改时间的最小间隔（秒），间隔内直接使用缓存的密钥，签名时不访问文件系统
+KEY_CHECK_INTERVAL = 60
+# 进程内共享的AliPay实例 {(appid, ...): AliPay}
+_clients = {}
+_lock = threading.Lock()
+
+
+def load_key(path, check_interval=KEY_CHECK_INTERVAL):
+    """
+    读取并解析RSA密钥，解析结果按文件修改时间缓存
+    :param check_interval: 距上次检查不超过该秒数时不检查文件修改时间，为0时总是检查
+    """
+    now = time.time()
+    cached = _keys.get(path)
+    if cached is not None and now - cached[2] < check_interval:
+        return cached[1]
+    mtime = os.path.getmtime(path)
+    if cached is not None and cached[0] == mtime:
+        key = cached[1]
+    else:
+        with open(path) as fp:
+            key = RSA.importKey(fp.read())
+    with _lock:
+        _keys[path] = (mtime, key, now)
+    return key
+
+
+def get_alipay_client(appid, app_notify_url, app_private_key_path,
+                      alipay_public_key_path, return_url, debug=False):
+    """
+    获取进程内共享的AliPay实例（参数相同时复用，避免每次请求都重新读取、解析密钥）
+    """
+    client_key = (appid, app_notify_url, app_private_key_path, alipay_public_key_path, return_url, debug)
+    client = _clients.get(client_key)
+    if client is None:
+        with _lock:
+            client = _clients.setdefault(client_key, AliPay(appid, app_notify_url, app_private_key_path,
+                                                            alipay_public_key_path, return_url, debug))
+    return client
+
+
 class AliPay(object):
     """
     支付宝支付接口
@@ -21,14 +67,8 @@ class AliPay(object):
         self.appid = appid
         self.app_notify_url = app_notify_url
         self.app_private_key_path = app_private_key_path
-        self.app_private_key = None
         self.return_url = return_url
-        with open(self.app_private_key_path) as fp:
-            self.app_private_key = RSA.importKey(fp.read())
-
         self.alipay_public_key_path = alipay_public_key_path
-        with open(self.alipay_public_key_path) as fp:
-            self.alipay_public_key = RSA.import_key(fp.read())
 
 
         if debug is True:
@@ -36,6 +76,15 @@ class AliPay(object):
         else:
             self.__gateway = "https://openapi.alipay.com/gateway.do"
 
+    # 密钥在第一次使用时加载
+    @property
+    def app_private_key(self):
+        return load_key(self.app_private_key_path)
+
+    @property
+    def alipay_public_key(self):
+        return load_key(self.alipay_public_key_path)
+
     def direct_pay(self, subject, out_trade_no, total_amount, return_url=None, **kwargs):
         biz_content = {
             "subject": subject,
@@ -103,6 +152,15 @@ class AliPay(object):
     def _verify(self, raw_content, signature):
         # 开始计算签名
         key = self.alipay_public_key
+        if self._verify_with_key(key, raw_content, signature):
+            return True
+        # 验证失败时立即检查公钥文件是否已更换（缓存的公钥可能还未到检查时间）
+        new_key = load_key(self.alipay_public_key_path, check_interval=0)
+        if new_key is not key:
+            return self._verify_with_key(new_key, raw_content, signature)
+        return False
+
+    def _verify_with_key(self, key, raw_content, signature):
         signer = PKCS1_v1_5.new(key)
         digest = SHA256.new()
         digest.update(raw_content.encode("utf8"))
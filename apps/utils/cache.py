@@ -0,0 +1,170 @@
+import math
+import time
+import uuid
+import random
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_extensions.cache.decorators import CacheResponse
+from rest_framework_extensions.cache.mixins import BaseCacheResponseMixin
+from rest_framework_extensions.key_constructor import bits
+from rest_framework_extensions.key_constructor.constructors import KeyConstructor
+
+MODEL_VERSION_KEY = 'api:model_version:{label}'
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_version(key):
+    """
+    获取版本号，不存在时以当前毫秒时间戳初始化（避免缓存被清空后复用旧版本号）
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cache_version(key):
+    """
+    版本号+1，旧版本号下的缓存不会再被读取，等待过期即可
+    由signal在数据保存后调用，缓存不可用时只记录日志，不影响数据的保存
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return get_cache_version(key)
+    except Exception:
+        logger.exception('bump cache version failed: %s', key)
+
+
+def model_version_key(model):
+    return MODEL_VERSION_KEY.format(label=model._meta.label_lower)
+
+
+def get_model_versions(models):
+    """
+    一次读取多个model的版本号
+    """
+    keys = [model_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    return [versions[key] if key in versions else get_cache_version(key) for key in keys]
+
+
+def bump_model_version(model):
+    return bump_cache_version(model_version_key(model))
+
+
+class ModelVersionKeyBit(bits.KeyBitBase):
+    """
+    缓存key中加入相关model的版本号，model数据修改时（由signal）更新版本号，旧的缓存立即失效
+    """
+    def __init__(self, models):
+        super(ModelVersionKeyBit, self).__init__()
+        self.models = models
+
+    def get_data(self, params, view_instance, view_method, request, args, kwargs):
+        return u':'.join(str(version) for version in get_model_versions(self.models))
+
+
+class APIListKeyConstructor(KeyConstructor):
+    """
+    list缓存key：请求方法、格式、语言、全部查询参数、登录用户
+    子类中加入model_version = ModelVersionKeyBit((...))即可在数据修改时失效
+    """
+    unique_method_id = bits.UniqueMethodIdKeyBit()
+    format = bits.FormatKeyBit()
+    language = bits.LanguageKeyBit()
+    query_params = bits.QueryParamsKeyBit()
+    user = bits.UserKeyBit()
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=0, lock_timeout=10, beta=1.0, cacheable=None, cache=cache):
+    """
+    带防击穿的缓存读取，缓存中保存 (值, 过期时间, 计算耗时)：
+    1. 未过期时按概率提前重新计算（越接近过期、计算越慢，概率越大），避免大量请求在同一时刻过期
+    2. 需要重新计算时只有拿到锁的请求执行compute，其它请求在stale_timeout秒内直接返回旧值
+    3. 没有旧值时，其它请求等待拿到锁的请求计算完成，最多等待lock_timeout秒
+    :param cacheable: 判断计算结果是否写入缓存，为None时总是写入
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        if time.time() - delta * beta * math.log(1 - random.random()) < expires:
+            return value
+
+    lock_key = '{}:lock'.format(key)
+    # 锁的值为本次请求的token：compute超过lock_timeout时锁已过期并可能被其它请求拿到，只能删除自己的锁
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, lock_timeout):
+        try:
+            start = time.time()
+            value = compute()
+            if cacheable is None or cacheable(value):
+                now = time.time()
+                cache.set(key, (value, now + timeout, now - start), timeout + stale_timeout)
+            return value
+        finally:
+            # get和delete之间锁恰好过期并被其它请求拿到的窗口很小，此时最多多一个请求重新计算
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    # 其它请求正在重新计算：旧值还在缓存中（未超过stale_timeout）时直接返回
+    if entry is not None:
+        return entry[0]
+    deadline = time.time() + lock_timeout
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        if cache.get(lock_key) is None:
+            break
+    return compute()
+
+
+class StampedeCacheResponse(CacheResponse):
+    """
+    drf-extensions的cache_response，缓存读写改为get_or_compute，同一个key同时只有一个请求重新计算，
+    过期后API_CACHE_STALE_TIMEOUT秒内其它请求返回旧的response
+    """
+    def process_cache_response(self, view_instance, view_method, request, args, kwargs):
+        key = self.calculate_key(
+            view_instance=view_instance,
+            view_method=view_method,
+            request=request,
+            args=args,
+            kwargs=kwargs
+        )
+
+        def compute():
+            response = view_method(view_instance, request, *args, **kwargs)
+            response = view_instance.finalize_response(request, response, *args, **kwargs)
+            response.render()  # 缓存前需要先渲染
+            return response
+
+        response = get_or_compute(
+            key, compute, self.timeout,
+            stale_timeout=settings.API_CACHE_STALE_TIMEOUT,
+            lock_timeout=settings.API_CACHE_LOCK_TIMEOUT,
+            cacheable=lambda response: response.status_code < 400 or self.cache_errors,
+            cache=self.cache
+        )
+        if not hasattr(response, '_closable_objects'):
+            response._closable_objects = []
+        return response
+
+
+class StampedeCacheResponseMixin(BaseCacheResponseMixin):
+    """
+    与CacheResponseMixin相同，缓存list和retrieve的结果，但带有防击穿和过期后返回旧值
+    """
+    @StampedeCacheResponse(key_func='list_cache_key_func')
+    def list(self, request, *args, **kwargs):
+        return super(StampedeCacheResponseMixin, self).list(request, *args, **kwargs)
+
+    @StampedeCacheResponse(key_func='object_cache_key_func')
+    def retrieve(self, request, *args, **kwargs):
+        return super(StampedeCacheResponseMixin, self).retrieve(request, *args, **kwargs)
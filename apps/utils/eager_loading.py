@@ -0,0 +1,81 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.query import QuerySet
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+# 缓存每个serializer类分析得到的 (select_related, prefetch_related) 路径
+_lookups_cache = {}
+
+
+def _is_forward_relation(model, source):
+    """
+    判断source是否为model上的正向外键/一对一字段（可用select_related）
+    """
+    if model is None:
+        return False
+    try:
+        field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return False
+    return field.concrete and (field.many_to_one or field.one_to_one)
+
+
+def _collect_lookups(serializer, prefix, in_prefetch, select, prefetch):
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    for field in serializer.fields.values():
+        # 只写字段、source='*'及跨对象的source（如a.b）不做分析
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+        many = isinstance(field, (ListSerializer, ManyRelatedField))
+        child = field.child if isinstance(field, ListSerializer) else field
+        if not many and not isinstance(child, BaseSerializer):
+            continue
+
+        lookup = prefix + field.source
+        # 反向关联、多对多以及prefetch路径下的所有关联都只能用prefetch_related
+        if many or in_prefetch or not _is_forward_relation(model, field.source):
+            prefetch.append(lookup)
+            child_in_prefetch = True
+        else:
+            select.append(lookup)
+            child_in_prefetch = False
+
+        if isinstance(child, BaseSerializer):
+            _collect_lookups(child, lookup + '__', child_in_prefetch, select, prefetch)
+
+
+def get_eager_loading_lookups(serializer_class):
+    """
+    遍历serializer的嵌套结构，返回需要预加载的关联路径
+    :param serializer_class: Serializer类
+    :return: (select_related路径列表, prefetch_related路径列表)
+    """
+    if serializer_class not in _lookups_cache:
+        select, prefetch = [], []
+        _collect_lookups(serializer_class(), '', False, select, prefetch)
+        _lookups_cache[serializer_class] = (tuple(select), tuple(prefetch))
+    return _lookups_cache[serializer_class]
+
+
+def setup_eager_loading(queryset, serializer_class):
+    """
+    根据serializer的嵌套结构为queryset自动加上select_related/prefetch_related，避免N+1查询
+    """
+    if not isinstance(queryset, QuerySet):
+        return queryset
+    select, prefetch = get_eager_loading_lookups(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class EagerLoadingMixin(object):
+    """
+    ViewSet混入类，list/retrieve时根据当前serializer自动预加载关联数据
+    放在filter_queryset中处理，重写了get_queryset的ViewSet同样生效
+    """
+    def filter_queryset(self, queryset):
+        queryset = super(EagerLoadingMixin, self).filter_queryset(queryset)
+        return setup_eager_loading(queryset, self.get_serializer_class())
@@ -0,0 +1,158 @@
+import json
+import base64
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPageNumberPagination(PageNumberPagination):
+    """
+    在页码分页的基础上增加游标（keyset）分页模式
+    请求中带有cursor参数时（第一页为 ?cursor= ），按 排序字段+id 定位下一页，
+    查询为 WHERE (字段, id) > (上一页最后一条) LIMIT n，不再使用COUNT(*)+OFFSET，翻到多深都一样快
+    不带cursor参数时与PageNumberPagination完全一致
+
+    游标模式返回的count是缓存的总数，PAGINATION_COUNT_CACHE_TIMEOUT秒内可能不是最新值，仅供前端显示
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = '无效的游标'
+    # 支持游标分页的排序字段，为None时使用view的ordering_fields，排序不在其中时退回页码分页
+    cursor_ordering_fields = None
+
+    cursor_mode = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = False
+        if self.cursor_query_param not in request.query_params:
+            return super(KeysetPageNumberPagination, self).paginate_queryset(queryset, request, view)
+
+        ordering = self.get_cursor_ordering(queryset, view)
+        if ordering is None:
+            return super(KeysetPageNumberPagination, self).paginate_queryset(queryset, request, view)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.cursor_mode = True
+        self.request = request
+        self.field, self.descending = ordering
+        self.display_page_controls = False
+        self.count = self.get_cached_count(queryset)
+
+        position = self.decode_cursor(request)
+        reverse = position is not None and position[2]
+        descending = self.descending != reverse
+        order = ('-' if descending else '') + 'id'
+        if self.field:
+            queryset = queryset.order_by(('-' if descending else '') + self.field, order)
+        else:
+            queryset = queryset.order_by(order)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position[0], position[1], descending))
+
+        # 多取一条判断是否还有下一页
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.results = results
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super(KeysetPageNumberPagination, self).get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super(KeysetPageNumberPagination, self).get_next_link()
+        if not self.has_next or not self.results:
+            return None
+        return self.encode_cursor(self.results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super(KeysetPageNumberPagination, self).get_previous_link()
+        if not self.has_previous or not self.results:
+            return None
+        return self.encode_cursor(self.results[0], reverse=True)
+
+    def get_cursor_ordering(self, queryset, view):
+        """
+        返回 (排序字段, 是否降序)，只按id排序时排序字段为None；排序无法用游标分页时返回None
+        """
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        fields = self.cursor_ordering_fields
+        if fields is None:
+            fields = getattr(view, 'ordering_fields', None) or ()
+        if not ordering:
+            return None, False
+        first = ordering[0]
+        if not isinstance(first, str):
+            return None
+        descending = first.startswith('-')
+        name = first.lstrip('-')
+        if name in ('id', 'pk') and len(ordering) == 1:
+            return None, descending
+        if name not in fields:
+            return None
+        # 其余排序项只允许是同方向的id（游标分页自身会加上id作为第二排序）
+        if ordering[1:] not in ([], ['-id' if descending else 'id']):
+            return None
+        return name, descending
+
+    def keyset_filter(self, value, pk, descending):
+        lookup = 'lt' if descending else 'gt'
+        if not self.field:
+            return Q(**{'id__' + lookup: pk})
+        # 等价于 (field, id) < (value, pk)，外层的 field <= value 让数据库可以直接走field上的索引做范围扫描
+        return Q(**{'%s__%se' % (self.field, lookup): value}) & (
+            Q(**{'%s__%s' % (self.field, lookup): value}) | Q(**{self.field: value, 'id__' + lookup: pk}))
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field) if self.field else None
+        data = json.dumps([value, obj.pk, 1 if reverse else 0], separators=(',', ':'))
+        token = base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        """
+        返回 (排序字段值, id, 是否向前翻页)，第一页返回None
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            value, pk, reverse = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if self.field and not isinstance(value, (int, float)):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, bool(reverse)
+
+    def get_cached_count(self, queryset):
+        """
+        相同过滤条件的总数缓存一段时间，避免每次翻页都执行COUNT(*)
+        """
+        sql = str(queryset.order_by().query)
+        key = 'pagination_count:{}'.format(hashlib.md5(sql.encode('utf-8')).hexdigest())
+        return cache.get_or_set(key, queryset.count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
@@ -0,0 +1,84 @@
+from rest_framework.throttling import SimpleRateThrottle,AnonRateThrottle,UserRateThrottle,ScopedRateThrottle
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    滑动窗口限流
+    每个key只保存当前和上一个固定窗口的请求数（两个整数，用缓存的原子incr累加），
+    按上一个窗口在滑动窗口中所占的比例估算最近duration秒内的请求数
+    SimpleRateThrottle为每个key保存请求时间戳列表并整体读出、写回，内存随速率增长且并发时会互相覆盖，
+    这里内存固定，计数也不会丢失
+    """
+    cache_format = 'throttle:sw:%(scope)s:%(ident)s'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        current_key = '{}:{}'.format(self.key, window)
+        # 先原子地累加当前窗口的计数再判断，并发请求之间不存在读-改-写的竞争
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # 当前窗口的第一个请求，add失败说明其它请求已经创建了计数
+            if self.cache.add(current_key, 1, self.duration * 2):
+                current = 1
+            else:
+                current = self.cache.incr(current_key)
+        if current is None:
+            # 缓存不可用（DJANGO_REDIS_IGNORE_EXCEPTIONS忽略了异常），不限流
+            return True
+        previous = self.cache.get('{}:{}'.format(self.key, window - 1), 0)
+
+        self.window_start = window * self.duration
+        weight = 1 - (self.now - self.window_start) / float(self.duration)
+        if previous * weight + current > self.num_requests:
+            # 被拒绝的请求不计入请求数
+            self.cache.decr(current_key)
+            self.current, self.previous = current - 1, previous
+            return self.throttle_failure()
+        return True
+
+    def wait(self):
+        """
+        估算还需等待多久，下一个请求才不会超限
+        """
+        allowed = self.num_requests - 1
+        window_end = self.window_start + self.duration
+        if self.current <= allowed:
+            # 本窗口内，上一个窗口所占比例下降到足够小即可
+            if not self.previous:
+                return None
+            weight = (allowed - self.current) / float(self.previous)
+            return max(window_end - self.duration * weight - self.now, 0)
+        # 需要等到下一个窗口，此时本窗口的请求数成为“上一个窗口”
+        weight = allowed / float(self.current)
+        return window_end + self.duration * (1 - weight) - self.now
+
+
+class AnonSlidingWindowThrottle(AnonRateThrottle, SlidingWindowRateThrottle):
+    """
+    未登录用户（按ip）限流，速率为THROTTLE_RATES['anon']
+    """
+    pass
+
+
+class UserSlidingWindowThrottle(UserRateThrottle, SlidingWindowRateThrottle):
+    """
+    登录用户（按用户id，未登录按ip）限流，速率为THROTTLE_RATES['user']
+    """
+    pass
+
+
+class ScopedSlidingWindowThrottle(ScopedRateThrottle, SlidingWindowRateThrottle):
+    """
+    按接口分别限流：view中设置throttle_scope（如'goods'、'sms'、'login'），
+    速率为THROTTLE_RATES[throttle_scope]，每个用户（未登录按ip）在各个scope中分别计数
+    """
+    pass
@@ -13,3 +13,6 @@ class XAdminConfig(AppConfig):
     def ready(self):
         self.module.autodiscover()
         setattr(xadmin,'site',xadmin.site)
+
+        from xadmin.filters import connect_registered_filter_choices
+        connect_registered_filter_choices(xadmin.site)
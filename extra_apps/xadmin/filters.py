@@ -1,6 +1,6 @@
 from __future__ import absolute_import
-from django.db import models
-from django.core.exceptions import ImproperlyConfigured
+from django.db import models, transaction
+from django.core.exceptions import ImproperlyConfigured, EmptyResultSet
 from django.utils.encoding import smart_text
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
@@ -11,6 +11,10 @@ from django.utils.safestring import mark_safe
 from django.utils.html import escape,format_html
 from django.utils.text import Truncator
 from django.core.cache import cache, caches
+from django.db.models.signals import post_save, post_delete
+import hashlib
+import logging
+import time
 
 from xadmin.views.list import EMPTY_CHANGELIST_VALUE
 from xadmin.util import is_related_field,is_related_field2
@@ -18,8 +22,13 @@ import datetime
 
 FILTER_PREFIX = '_p_'
 SEARCH_VAR = '_q_'
+# ajax request for the choices of a lazy multiselect filter
+FILTER_CHOICES_VAR = '_filter_choices'
+FILTER_CHOICES_VERSION_KEY = 'xadmin_filter_choices_version:%s'
 
-from .util import (get_model_from_relation,
+logger = logging.getLogger(__name__)
+
+from .util import (get_model_from_relation, get_fields_from_path,
     reverse_field_path, get_limit_choices_to_from_path, prepare_lookup_value)
 
 
@@ -445,65 +454,227 @@ class RelatedFieldListFilter(ListFieldFilter):
                 'display': EMPTY_CHANGELIST_VALUE,
             }
 
+def get_filter_choices_versions(models):
+    """
+    Versions of the cached filter choices of these models, they change
+    whenever an object of the model is saved or deleted.
+    """
+    keys = [FILTER_CHOICES_VERSION_KEY % model._meta.label_lower for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # start from a timestamp so a cleared cache does not reuse old versions
+            cache.add(key, int(time.time() * 1000), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_filter_choices_version(model):
+    try:
+        cache.incr(FILTER_CHOICES_VERSION_KEY % model._meta.label_lower)
+    except ValueError:
+        # no choices of this model have been cached yet
+        pass
+    except Exception:
+        # the cache being down must not break saving the object
+        logger.exception('failed to invalidate the filter choices of %s', model._meta.label_lower)
+
+
+def invalidate_filter_choices(sender, **kwargs):
+    if kwargs.get('raw'):
+        return
+    # after commit, or a concurrent request could cache the old choices under the new version
+    transaction.on_commit(lambda: bump_filter_choices_version(sender))
+
+
+def get_filter_choices_models(model, field_path):
+    return [model] + [f.related_model for f in get_fields_from_path(model, field_path)
+                      if f.is_relation and f.related_model is not None]
+
+
+_filter_choices_senders = set()
+
+
+def connect_filter_choices_signals(model, field_path):
+    """
+    Invalidate the cached choices of a filter when an object of its model,
+    or of a model on the field path, is saved or deleted. Only these
+    models get the receivers, other saves do not touch the cache.
+    """
+    for sender in get_filter_choices_models(model, field_path):
+        if sender in _filter_choices_senders:
+            continue
+        _filter_choices_senders.add(sender)
+        label = sender._meta.label_lower
+        post_save.connect(invalidate_filter_choices, sender=sender,
+                          dispatch_uid='xadmin_filter_choices_save_%s' % label)
+        post_delete.connect(invalidate_filter_choices, sender=sender,
+                            dispatch_uid='xadmin_filter_choices_delete_%s' % label)
+
+
+def get_cached_filter_paths(admin_class):
+    """
+    Field paths of the filters of an admin class whose choices are cached:
+    quick filters with an enabled 'cache' config, and the list_filter
+    fields named by filter_choices_cache (True for all of them).
+    """
+    paths = []
+    for quick_filter in getattr(admin_class, 'list_quick_filter', ()):
+        if type(quick_filter) == dict and (quick_filter.get('cache') or {}).get('enabled') \
+                and isinstance(quick_filter.get('field'), six.string_types):
+            paths.append(quick_filter['field'])
+    cached = getattr(admin_class, 'filter_choices_cache', False)
+    if cached:
+        for list_filter in getattr(admin_class, 'list_filter', ()):
+            if isinstance(list_filter, (tuple, list)):
+                list_filter = list_filter[0]
+            if isinstance(list_filter, six.string_types) and (cached is True or list_filter in cached):
+                paths.append(list_filter)
+    return paths
+
+
+def connect_registered_filter_choices(site):
+    """
+    Connect the invalidation receivers of every registered admin at startup,
+    so a process that never rendered a filter still invalidates its choices.
+    """
+    for model, admin_class in site._registry.items():
+        for field_path in get_cached_filter_paths(admin_class):
+            try:
+                connect_filter_choices_signals(model, field_path)
+            except Exception:
+                # not a field path, the filter itself will report it
+                pass
+
+
 @manager.register
 class MultiSelectFieldListFilter(ListFieldFilter):
     """ Delegates the filter to the default filter and ors the results of each
      
     Lists the distinct values of each field as a checkbox
     Uses the default spec for each 
-     
+
+    When cache_config is enabled the distinct values are cached and dropped
+    as soon as an object of the model (or of a model on the field path) is
+    saved or deleted. At most choices_limit values are listed. Lazy filters
+    only render the selected values, the menu loads its choices with an
+    ajax request when it is opened.
+
+    Admin options: filter_choices_cache (bool, or a list of field paths),
+    filter_choices_limit (int, or {field_path: int}) and
+    filter_choices_lazy (bool, or a list of field paths).
     """
     template = 'xadmin/filters/checklist.html'
     lookup_formats = {'in': '%s__in'}
     cache_config = {'enabled':False,'key':'quickfilter_%s','timeout':3600,'cache':'default'}
+    choices_limit = 200
+    lazy_choices = False
+    # distinguishes the ajax choices requests of filters on the same field
+    choices_param_prefix = ''
  
     @classmethod
     def test(cls, field, request, params, model, admin_view, field_path):
         return True
- 
-    def get_cached_choices(self):
+
+    def get_cache_key(self, queryset):
         if not self.cache_config['enabled']:
             return None
-        c = caches(self.cache_config['cache'])
-        return c.get(self.cache_config['key']%self.field_path)
+        try:
+            sql = '%s|%s' % (queryset.query, self.choices_limit)
+        except EmptyResultSet:
+            return None
+        try:
+            versions = get_filter_choices_versions(get_filter_choices_models(self.model, self.field_path))
+        except Exception:
+            # without the versions the cached choices can not be trusted, load them from the database
+            logger.exception('failed to read the filter choices versions')
+            return None
+        sql = '%s|%s' % (sql, versions)
+        return '%s:%s' % (self.cache_config['key'] % self.field_path, hashlib.md5(sql.encode('utf-8')).hexdigest())
+
+    def get_cached_choices(self, key):
+        if not self.cache_config['enabled'] or key is None:
+            return None
+        c = caches[self.cache_config['cache']]
+        try:
+            return c.get(key)
+        except Exception:
+            logger.exception('failed to read the cached filter choices')
+            return None
     
-    def set_cached_choices(self,choices):
-        if not self.cache_config['enabled']:
+    def set_cached_choices(self, key, choices):
+        if not self.cache_config['enabled'] or key is None:
             return
-        c = caches(self.cache_config['cache'])
-        return c.set(self.cache_config['key']%self.field_path,choices)
+        c = caches[self.cache_config['cache']]
+        try:
+            c.set(key, choices, self.cache_config['timeout'])
+        except Exception:
+            logger.exception('failed to cache the filter choices')
     
-    def __init__(self, field, request, params, model, model_admin, field_path,field_order_by=None,field_limit=None,sort_key=None,cache_config=None):
+    def __init__(self, field, request, params, model, model_admin, field_path,field_order_by=None,field_limit=None,sort_key=None,cache_config=None,lazy=None):
         super(MultiSelectFieldListFilter,self).__init__(field, request, params, model, model_admin, field_path)
         
-        # Check for it in the cachce
+        self.cache_config = dict(self.cache_config)
         if cache_config is not None and type(cache_config)==dict:
             self.cache_config.update(cache_config)
-        
+        elif cache_config is None:
+            cached = getattr(self.admin_view, 'filter_choices_cache', False)
+            if type(cached) in (tuple, list):
+                cached = field_path in cached
+            if cached:
+                self.cache_config['enabled'] = True
         if self.cache_config['enabled']:
-            self.field_path = field_path
-            choices = self.get_cached_choices()
-            if choices:
-                self.lookup_choices = choices
-                return
-            
-        # Else rebuild it
-        queryset = self.admin_view.queryset().exclude(**{"%s__isnull"%field_path:True}).values_list(field_path, flat=True).distinct() 
+            connect_filter_choices_signals(self.model, field_path)
+        self.field_order_by = field_order_by
+        self.sort_key = sort_key
+
+        if field_limit is None:
+            field_limit = getattr(self.admin_view, 'filter_choices_limit', None)
+            if type(field_limit) == dict:
+                field_limit = field_limit.get(field_path)
+        if field_limit is not None and type(field_limit) == int:
+            self.choices_limit = field_limit
+
+        if lazy is None:
+            lazy = getattr(self.admin_view, 'filter_choices_lazy', None)
+            if type(lazy) in (tuple, list):
+                lazy = field_path in lazy
+            elif lazy is None:
+                lazy = self.lazy_choices
+        self.choices_param = self.choices_param_prefix + field_path
+        self.choices_url = self.query_string({FILTER_CHOICES_VAR: self.choices_param})
+        self.lazy = bool(lazy) and getattr(self.admin_view, 'filter_choices_param', None) != self.choices_param
+
+        self.choices_truncated = False
+        self.lookup_choices = None if self.lazy else self.load_choices()
+
+    def load_choices(self):
+        queryset = self.admin_view.queryset().exclude(**{"%s__isnull"%self.field_path:True}).values_list(self.field_path, flat=True).distinct() 
         #queryset = self.admin_view.queryset().distinct(field_path).exclude(**{"%s__isnull"%field_path:True})
         
-        if field_order_by is not None:
+        if self.field_order_by is not None:
             # Do a subquery to order the distinct set
-            queryset = self.admin_view.queryset().filter(id__in=queryset).order_by(field_order_by)
-            
-        if field_limit is not None and type(field_limit)==int and queryset.count()>field_limit:
-            queryset = queryset[:field_limit]
-        
-        self.lookup_choices = [str(it) for it in queryset.values_list(field_path,flat=True) if str(it).strip()!=""]
-        if sort_key is not None:
-            self.lookup_choices = sorted(self.lookup_choices,key=sort_key)
-        
-        if self.cache_config['enabled']:
-            self.set_cached_choices(self.lookup_choices) 
+            queryset = self.admin_view.queryset().filter(id__in=queryset).order_by(self.field_order_by)
+        queryset = queryset.values_list(self.field_path,flat=True)
+
+        key = self.get_cache_key(queryset)
+        cached = self.get_cached_choices(key)
+        if cached is not None:
+            choices, self.choices_truncated = cached
+        else:
+            # one extra value tells whether the list is truncated, instead of a count() over the table
+            if self.choices_limit:
+                values = list(queryset[:self.choices_limit + 1])
+                self.choices_truncated = len(values) > self.choices_limit
+                values = values[:self.choices_limit]
+            else:
+                values = list(queryset)
+            choices = [str(it) for it in values if str(it).strip()!=""]
+            self.set_cached_choices(key, (choices, self.choices_truncated))
+
+        if self.sort_key is not None:
+            choices = sorted(choices,key=self.sort_key)
+        return choices
 
     def choices(self):
         self.lookup_in_val = (type(self.lookup_in_val) in (tuple,list)) and self.lookup_in_val or list(self.lookup_in_val)
@@ -512,7 +683,9 @@ class MultiSelectFieldListFilter(ListFieldFilter):
             'query_string': self.query_string({},[self.lookup_in_name]),
             'display': _('All'),
         }
-        for val in self.lookup_choices:
+        # before the choices are loaded only the selected values are listed
+        lookup_choices = self.lookup_choices if self.lookup_choices is not None else self.lookup_in_val
+        for val in lookup_choices:
             yield {
                 'selected': smart_text(val) in self.lookup_in_val,
                 'query_string': self.query_string({self.lookup_in_name: ",".join([val]+self.lookup_in_val),}),
@@ -1,3 +1,7 @@
+import hashlib
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
 from django.db.models import FieldDoesNotExist, Avg, Max, Min, Count, Sum
 from django.utils.translation import ugettext as _
 
@@ -18,6 +22,9 @@ AGGREGATE_TITLE = {
 class AggregationPlugin(BaseAdminPlugin):
 
     aggregate_fields = {}
+    # seconds the totals are cached for the same filters, so paging does not
+    # aggregate the whole list again; 0 disables the cache
+    aggregate_cache_timeout = 60
 
     def init_request(self, *args, **kwargs):
         return bool(self.aggregate_fields)
@@ -43,10 +50,34 @@ class AggregationPlugin(BaseAdminPlugin):
 
         return item
 
-    def _get_aggregate_row(self):
+    def _get_aggregates(self):
+        """
+        All aggregate columns in one aggregate() query on the filtered list
+        queryset, cached per filter state (the SQL of the list queryset, which
+        does not change with the page).
+        """
+        aggregates = [AGGREGATE_METHODS[method](field_name) for field_name, method in
+                      sorted(self.aggregate_fields.items()) if method in AGGREGATE_METHODS]
+        if not aggregates:
+            return {}
         queryset = self.admin_view.list_queryset._clone()
-        obj = queryset.aggregate(*[AGGREGATE_METHODS[method](field_name) for field_name, method in
-                                   self.aggregate_fields.items() if method in AGGREGATE_METHODS])
+        if not self.aggregate_cache_timeout:
+            return queryset.aggregate(*aggregates)
+        try:
+            sql = str(queryset.order_by().query)
+        except EmptyResultSet:
+            return queryset.aggregate(*aggregates)
+
+        key = 'xadmin_aggregate:%s' % hashlib.md5((u'%s|%r|%s' % (
+            self.opts.label_lower, sorted(self.aggregate_fields.items()), sql)).encode('utf-8')).hexdigest()
+        obj = cache.get(key)
+        if obj is None:
+            obj = queryset.aggregate(*aggregates)
+            cache.set(key, obj, self.aggregate_cache_timeout)
+        return obj
+
+    def _get_aggregate_row(self):
+        obj = self._get_aggregates()
 
         row = ResultRow()
         row['is_display_first'] = False
@@ -55,7 +86,9 @@ class AggregationPlugin(BaseAdminPlugin):
         return row
 
     def results(self, rows):
-        if rows:
+        # exports read the records themselves and return no rows here (see
+        # ExportPlugin.results), so the totals are only queried for the list page
+        if isinstance(rows, list) and rows:
             rows.append(self._get_aggregate_row())
         return rows
 
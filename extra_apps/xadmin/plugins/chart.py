@@ -2,9 +2,14 @@
 import calendar
 import datetime
 import decimal
+import hashlib
+import math
 
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ImproperlyConfigured
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import TruncDay, TruncMonth, TruncYear
 from django.http import HttpResponse, HttpResponseNotFound
 from django.template import loader
 from django.utils.http import urlencode
@@ -15,7 +20,7 @@ from xadmin.plugins.utils import get_context_dict
 from xadmin.sites import site
 from xadmin.views import BaseAdminPlugin, ListAdminView
 from xadmin.views.dashboard import ModelBaseWidget, widget_manager
-from xadmin.util import lookup_field, label_for_field, json
+from xadmin.util import lookup_field, label_for_field, lookup_column_field, json
 
 
 @widget_manager.register
@@ -102,9 +107,59 @@ class ChartsPlugin(BaseAdminPlugin):
                                              context=get_context_dict(context)))
 
 
+CHART_BUCKETS = {
+    'day': TruncDay, 'week': TruncDay, 'month': TruncMonth, 'year': TruncYear
+}
+CHART_AGGREGATES = {
+    'sum': models.Sum, 'count': models.Count, 'min': models.Min, 'max': models.Max
+}
+CHART_AGGREGATE_TITLE = {
+    'sum': _('Sum'), 'count': _('Count'), 'avg': _('Avg'), 'min': _('Min'), 'max': _('Max')
+}
+
+
+def _combine_aggregate(method, a, b):
+    """
+    Merge two partial aggregates of the same method, None means no value.
+    avg partials are (sum, count) pairs.
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if method == 'avg':
+        return _combine_aggregate('sum', a[0], b[0]), a[1] + b[1]
+    if method == 'min':
+        return min(a, b)
+    if method == 'max':
+        return max(a, b)
+    return a + b
+
+
 class ChartsView(ListAdminView):
+    """
+    Chart data of the list.
+
+    By default every object of the current list page is one point. A chart
+    with an ``aggregate`` ('sum', 'count', 'avg', 'min' or 'max', one method
+    or one per y-field) is computed by the database instead: the filtered
+    list is grouped by x-field, or by ``bucket`` ('day', 'week', 'month',
+    'year') for date x-fields, over all pages. ``max-points`` merges
+    neighbouring groups so the chart has at most that many points::
+
+        data_charts = {
+            "order_amount": {'title': u"Sales", "x-field": "add_time",
+                             "y-field": ("order_mount",), "bucket": "day",
+                             "aggregate": "sum", "max-points": 100},
+        }
+
+    Aggregated charts are cached for chart_cache_timeout seconds per filter.
+    """
 
     data_charts = {}
+    chart_fields = None
+    # seconds the aggregated chart data is cached for the same filters, 0 disables the cache
+    chart_cache_timeout = 300
 
     def get_ordering(self):
         if 'order' in self.chart:
@@ -112,6 +167,122 @@ class ChartsView(ListAdminView):
         else:
             return super(ChartsView, self).get_ordering()
 
+    def get_chart_fields(self):
+        """
+        Returns the model fields of x-field and y-field when they are all plain
+        (non relational) columns, so the chart can be read with values_list.
+        Returns None if some of them need the model instance.
+        """
+        fields = [lookup_column_field(self.opts, name) for name in (self.x_field,) + tuple(self.y_fields)]
+        if any(f is None or f.is_relation for f in fields):
+            return None
+        return fields
+
+    def get_list_queryset(self):
+        queryset = super(ChartsView, self).get_list_queryset()
+        if self.chart_fields is not None:
+            # only the chart columns are loaded, no model instances are built
+            queryset = queryset.values_list('pk', *[f.attname for f in self.chart_fields])
+        return queryset
+
+    def get_aggregate_methods(self):
+        methods = self.chart.get('aggregate')
+        if not methods:
+            return None
+        if type(methods) not in (list, tuple):
+            methods = (methods,) * len(self.y_fields)
+        for method in methods:
+            if method != 'avg' and method not in CHART_AGGREGATES:
+                raise ImproperlyConfigured("Unknown chart aggregate '%s'." % method)
+        return methods
+
+    def get_aggregate_rows(self, queryset):
+        """
+        Returns [(x, [partial aggregate of each y-field])] ordered by x, one
+        row per group of the grouped annotate query.
+        """
+        bucket = self.chart.get('bucket')
+        x_field = self.opts.get_field(self.x_field)
+        if bucket:
+            if bucket not in CHART_BUCKETS or not isinstance(x_field, models.DateField):
+                raise ImproperlyConfigured(
+                    "Chart bucket '%s' needs a date x-field." % bucket)
+            queryset = queryset.annotate(chart_x=CHART_BUCKETS[bucket](self.x_field))
+        else:
+            queryset = queryset.annotate(chart_x=models.F(self.x_field))
+
+        annotations = {}
+        for i, (yfname, method) in enumerate(zip(self.y_fields, self.aggregate_methods)):
+            if method == 'avg':
+                # sum and count can still be merged into weeks or larger points
+                annotations['chart_y%d_sum' % i] = models.Sum(yfname)
+                annotations['chart_y%d_count' % i] = models.Count(yfname)
+            else:
+                annotations['chart_y%d' % i] = CHART_AGGREGATES[method](yfname)
+        queryset = queryset.order_by().values('chart_x').annotate(**annotations).order_by('chart_x')
+
+        rows = []
+        for values in queryset:
+            x = values['chart_x']
+            ys = [(values['chart_y%d_sum' % i], values['chart_y%d_count' % i]) if method == 'avg'
+                  else values['chart_y%d' % i] for i, method in enumerate(self.aggregate_methods)]
+            if bucket == 'week' and x is not None:
+                x = x - datetime.timedelta(days=x.weekday())
+                if rows and rows[-1][0] == x:
+                    ys = [_combine_aggregate(method, a, b) for method, a, b in
+                          zip(self.aggregate_methods, rows[-1][1], ys)]
+                    rows[-1] = (x, ys)
+                    continue
+            rows.append((x, ys))
+        return rows
+
+    def downsample_rows(self, rows, max_points):
+        size = int(math.ceil(len(rows) / float(max_points)))
+        if size <= 1:
+            return rows
+        result = []
+        for start in range(0, len(rows), size):
+            group = rows[start:start + size]
+            ys = group[0][1]
+            for x, values in group[1:]:
+                ys = [_combine_aggregate(method, a, b) for method, a, b in
+                      zip(self.aggregate_methods, ys, values)]
+            result.append((group[0][0], ys))
+        return result
+
+    def get_aggregate_points(self, name):
+        """
+        Returns [(x, [y value of each y-field])] of an aggregated chart, cached
+        per chart and filtered list queryset.
+        """
+        queryset = self.list_queryset
+        if queryset.query.distinct:
+            # joins of the filters would count the same object more than once
+            queryset = self.model._default_manager.filter(pk__in=queryset.values('pk'))
+        try:
+            sql = str(queryset.order_by().query)
+        except EmptyResultSet:
+            return []
+
+        key = 'xadmin_chart:%s' % hashlib.md5((u'%s|%s|%r|%s' % (
+            self.opts.label_lower, name, sorted(self.chart.items()), sql)).encode('utf-8')).hexdigest()
+        points = cache.get(key) if self.chart_cache_timeout else None
+        if points is None:
+            rows = self.get_aggregate_rows(queryset)
+            if self.chart.get('max-points'):
+                rows = self.downsample_rows(rows, self.chart['max-points'])
+            points = []
+            for x, ys in rows:
+                values = []
+                for method, y in zip(self.aggregate_methods, ys):
+                    if method == 'avg':
+                        y = float(y[0]) / y[1] if y[1] else None
+                    values.append(y)
+                points.append((x, values))
+            if self.chart_cache_timeout:
+                cache.set(key, points, self.chart_cache_timeout)
+        return points
+
     def get(self, request, name):
         if name not in self.data_charts:
             return HttpResponseNotFound()
@@ -122,17 +293,34 @@ class ChartsView(ListAdminView):
         y_fields = self.chart['y-field']
         self.y_fields = (
             y_fields,) if type(y_fields) not in (list, tuple) else y_fields
+        self.aggregate_methods = self.get_aggregate_methods()
 
         datas = [{"data":[], "label": force_text(label_for_field(
             i, self.model, model_admin=self))} for i in self.y_fields]
 
-        self.make_result_list()
-
-        for obj in self.result_list:
-            xf, attrs, value = lookup_field(self.x_field, obj, self)
-            for i, yfname in enumerate(self.y_fields):
-                yf, yattrs, yv = lookup_field(yfname, obj, self)
-                datas[i]["data"].append((value, yv))
+        if self.aggregate_methods:
+            for i, method in enumerate(self.aggregate_methods):
+                datas[i]["label"] = u"%s (%s)" % (datas[i]["label"], CHART_AGGREGATE_TITLE[method])
+            # grouped over the whole filtered list, the list page is not loaded
+            self.base_queryset = self.queryset()
+            self.list_queryset = self.get_list_queryset()
+            for x, ys in self.get_aggregate_points(name):
+                for i, y in enumerate(ys):
+                    datas[i]["data"].append((x, y))
+        else:
+            self.chart_fields = self.get_chart_fields()
+            self.make_result_list()
+
+        if self.chart_fields is not None:
+            for row in self.result_list:
+                for i, yv in enumerate(row[2:]):
+                    datas[i]["data"].append((row[1], yv))
+        elif not self.aggregate_methods:
+            for obj in self.result_list:
+                xf, attrs, value = lookup_field(self.x_field, obj, self)
+                for i, yfname in enumerate(self.y_fields):
+                    yf, yattrs, yv = lookup_field(yfname, obj, self)
+                    datas[i]["data"].append((value, yv))
 
         option = {'series': {'lines': {'show': True}, 'points': {'show': False}},
                   'grid': {'hoverable': True, 'clickable': True}}
@@ -146,6 +334,9 @@ class ChartsView(ListAdminView):
                     option['xaxis']['timeformat'] = "%H:%M:%S"
                 else:
                     option['xaxis']['timeformat'] = "%y/%m/%d %H:%M:%S"
+                if self.aggregate_methods and self.chart.get('bucket'):
+                    option['xaxis']['timeformat'] = {
+                        'day': "%y/%m/%d", 'week': "%y/%m/%d", 'month': "%y/%m", 'year': "%Y"}[self.chart['bucket']]
         except Exception:
             pass
 
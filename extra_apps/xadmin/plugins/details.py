@@ -17,7 +17,7 @@ class DetailsPlugin(BaseAdminPlugin):
         if (self.show_all_rel_details or (field_name in self.show_detail_fields)):
             rel_obj = None
             if hasattr(item.field, 'rel') and isinstance(item.field.rel, models.ManyToOneRel):
-                rel_obj = getattr(obj, field_name)
+                rel_obj = getattr(obj, item.field.name)
             elif field_name in self.show_detail_fields:
                 rel_obj = obj
 
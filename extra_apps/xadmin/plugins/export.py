@@ -1,22 +1,26 @@
 import io
 import datetime
-import sys
+import itertools
+import tempfile
+from wsgiref.util import FileWrapper
 from future.utils import iteritems
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template import loader
 from django.utils import six
 from django.utils.encoding import force_text, smart_text
 from django.utils.html import escape
 from django.utils.translation import ugettext as _
 from django.utils.xmlutils import SimplerXMLGenerator
-from django.db.models import BooleanField, NullBooleanField
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import BooleanField, NullBooleanField, Q
+from django.db.models.constants import LOOKUP_SEP
 
 from xadmin.plugins.utils import get_context_dict
 from xadmin.sites import site
 from xadmin.views import BaseAdminPlugin, ListAdminView
-from xadmin.util import json
-from xadmin.views.list import ALL_VAR
+from xadmin.util import json, lookup_column_field, display_for_field
+from xadmin.views.list import ALL_VAR, ResultRow, EMPTY_CHANGELIST_VALUE
 
 try:
     import xlwt
@@ -58,10 +62,201 @@ class ExportPlugin(BaseAdminPlugin):
     export_mimes = {'xlsx': 'application/vnd.ms-excel',
                     'xls': 'application/vnd.ms-excel', 'csv': 'text/csv',
                     'xml': 'application/xhtml+xml', 'json': 'application/json'}
+    # export types returned through a StreamingHttpResponse: csv and json are
+    # written row by row, xlsx is built in a temporary file first (see
+    # get_xlsx_export_stream)
+    stream_export_types = ('csv', 'json', 'xlsx')
+    # number of objects loaded per query when exporting all records
+    export_chunk_size = 1000
 
     def init_request(self, *args, **kwargs):
         return self.request.GET.get('_do_') == 'export'
 
+    def _is_stream_export(self):
+        return self.request.GET.get('export_type', 'csv') in self.stream_export_types
+
+    def _iter_result_objects(self):
+        if self.request.GET.get('all', 'off') != 'on':
+            for obj in self.admin_view.result_list:
+                yield obj
+            return
+
+        # Fetch the objects chunk by chunk so only export_chunk_size instances
+        # are alive at a time. Each chunk starts after the ordering key of the
+        # previous one (keyset paging), so neither the primary keys of the whole
+        # result nor a growing OFFSET are needed.
+        queryset = self.admin_view.list_queryset
+        ordering = self._get_keyset_ordering(queryset)
+        if ordering is None:
+            for obj in self._iter_result_objects_by_pks(queryset):
+                yield obj
+            return
+
+        lookups = [lookup for lookup, descending in ordering]
+        page = queryset
+        while True:
+            keys = list(page.values_list('pk', *lookups)[:self.export_chunk_size])
+            objects = queryset.order_by().in_bulk([key[0] for key in keys])
+            for key in keys:
+                if key[0] in objects:
+                    yield objects[key[0]]
+            if len(keys) < self.export_chunk_size:
+                break
+            page = queryset.filter(self._keyset_filter(ordering, keys[-1][1:]))
+
+    def _iter_result_objects_by_pks(self, queryset):
+        # Used when the ordering can't be paged by keyset: load the ordered
+        # primary keys once, then the objects chunk by chunk.
+        pks = list(queryset.values_list('pk', flat=True))
+        for i in range(0, len(pks), self.export_chunk_size):
+            chunk = pks[i:i + self.export_chunk_size]
+            objects = queryset.order_by().in_bulk(chunk)
+            for pk in chunk:
+                if pk in objects:
+                    yield objects[pk]
+
+    def _get_keyset_ordering(self, queryset):
+        """
+        Returns [(lookup, descending)] for the ordering of queryset up to the
+        primary key, or None when it can't be used as a keyset: expressions,
+        random order, nullable or multi-valued columns, ordering by a relation
+        that has its own default ordering, or no primary key in the ordering.
+        """
+        ordering = []
+        for item in queryset.query.order_by:
+            if not isinstance(item, six.string_types) or item == '?':
+                return None
+            descending = item.startswith('-')
+            lookup = item.lstrip('-')
+            names = lookup.split(LOOKUP_SEP)
+            opts, field = self.opts, None
+            for i, name in enumerate(names):
+                if opts is None:
+                    return None
+                try:
+                    field = opts.pk if name == 'pk' else opts.get_field(name)
+                except FieldDoesNotExist:
+                    return None
+                if not field.concrete or field.many_to_many or field.null:
+                    return None
+                if field.is_relation and name != field.attname:
+                    if i == len(names) - 1:
+                        # ordering by a foreign key uses the related default ordering
+                        if field.related_model._meta.ordering:
+                            return None
+                        names[i] = field.attname
+                    opts = field.related_model._meta
+                else:
+                    opts = None
+            ordering.append((LOOKUP_SEP.join(names), descending))
+            if len(names) == 1 and (names[0] == 'pk' or field == self.opts.pk):
+                return ordering
+        return None
+
+    def _keyset_filter(self, ordering, key):
+        # (a, b, pk) after (ka, kb, kpk):
+        # a > ka OR (a = ka AND b > kb) OR (a = ka AND b = kb AND pk > kpk)
+        condition = Q()
+        for i, (lookup, descending) in enumerate(ordering):
+            after = Q(**{'%s__%s' % (lookup, 'lt' if descending else 'gt'): key[i]})
+            for j in range(i):
+                after &= Q(**{ordering[j][0]: key[j]})
+            condition |= after
+        return condition
+
+    def _get_export_columns(self):
+        """
+        Returns (field_name, field) for every exported column of list_display.
+        field is the concrete model field when the column can be read with
+        values_list, and None when it needs the model instance (methods,
+        properties, relation lookups, many-to-many fields).
+        """
+        columns = []
+        for field_name in self.admin_view.list_display:
+            field = lookup_column_field(self.opts, field_name)
+            if field is None:
+                if callable(field_name):
+                    attr = field_name
+                else:
+                    attr = getattr(self.admin_view, field_name, None)
+                # same rule as result_item below, e.g. action_checkbox is never exported
+                if attr is not None and field_name != '__str__' and \
+                        not getattr(attr, 'allow_export', True):
+                    continue
+            columns.append((field_name, field))
+        return columns
+
+    def _iter_result_values(self, columns):
+        """
+        Yields the raw values of the field columns for every exported record,
+        together with the model instance when some column needs it.
+        """
+        fields = [f for name, f in columns if f is not None]
+        if all(f is not None for name, f in columns) and \
+                self.request.GET.get('all', 'off') == 'on':
+            # Only plain fields: one values_list query on the filtered, ordered
+            # list queryset, no model instances at all.
+            rows = self.admin_view.list_queryset.values_list(
+                'pk', *[f.attname for f in fields]).iterator()
+            for row in rows:
+                yield None, row[1:]
+        else:
+            for obj in self._iter_result_objects():
+                yield obj, [getattr(obj, f.attname) for f in fields]
+
+    def _get_related_texts(self, field, values, cache):
+        missing = set(v for v in values if v is not None and v not in cache)
+        if missing:
+            target = field.target_field.attname
+            for rel_obj in field.related_model._base_manager.filter(
+                    **{'%s__in' % target: missing}):
+                cache[getattr(rel_obj, target)] = escape(str(rel_obj))
+        return cache
+
+    def _iter_values(self):
+        """
+        Yields the formatted, exported values of every row. Field columns are
+        formatted from the raw values like result_item does; only the other
+        columns go through result_item and _format_value.
+        """
+        columns = self._get_export_columns()
+        field_columns = [(name, f) for name, f in columns if f is not None]
+        related = dict((name, {}) for name, f in field_columns if f.is_relation)
+        empty = escape(str(EMPTY_CHANGELIST_VALUE))
+        rows = self._iter_result_values(columns)
+        while True:
+            chunk = list(itertools.islice(rows, self.export_chunk_size))
+            if not chunk:
+                break
+            # the text of foreign keys is loaded once per chunk; the texts are
+            # keyed by column name, which may be the attname (e.g. 'category_id')
+            for i, (field_name, f) in enumerate(field_columns):
+                if f.is_relation:
+                    self._get_related_texts(f, [values[i] for obj, values in chunk], related[field_name])
+
+            for obj, values in chunk:
+                row = None
+                result = []
+                values = iter(values)
+                for field_name, f in columns:
+                    if f is None:
+                        if row is None:
+                            row = ResultRow()
+                            row['is_display_first'] = False
+                            row['object'] = obj
+                        item = self.admin_view.result_item(obj, field_name, row)
+                        if getattr(item, 'export', False):
+                            result.append(self._format_value(item))
+                        continue
+                    value = next(values)
+                    if f.is_relation:
+                        result.append(related[field_name].get(value, empty))
+                    elif isinstance(f, (BooleanField, NullBooleanField)):
+                        result.append(value)
+                    else:
+                        result.append(escape(str(display_for_field(value, f))))
+                yield result
+
     def _format_value(self, o):
         if (o.field is None and getattr(o.attr, 'boolean', False)) or \
            (o.field and isinstance(o.field, (BooleanField, NullBooleanField))):
@@ -72,30 +267,40 @@ class ExportPlugin(BaseAdminPlugin):
             value = escape(str(o.text))
         return value
 
-    def _get_objects(self, context):
+    def _iter_objects(self, context):
         headers = [c for c in context['result_headers'].cells if c.export]
-        rows = context['results']
-
-        return [dict([
-            (force_text(headers[i].text), self._format_value(o)) for i, o in
-            enumerate(filter(lambda c:getattr(c, 'export', False), r.cells))]) for r in rows]
+        for values in self._iter_values():
+            yield dict([
+                (force_text(headers[i].text), value) for i, value in enumerate(values)])
 
-    def _get_datas(self, context):
-        rows = context['results']
+    def _get_objects(self, context):
+        return list(self._iter_objects(context))
 
-        new_rows = [[self._format_value(o) for o in
-            filter(lambda c:getattr(c, 'export', False), r.cells)] for r in rows]
-        new_rows.insert(0, [force_text(c.text) for c in context['result_headers'].cells if c.export])
-        return new_rows
+    def _iter_datas(self, context):
+        yield [force_text(c.text) for c in context['result_headers'].cells if c.export]
+        for values in self._iter_values():
+            yield values
 
-    def get_xlsx_export(self, context):
-        datas = self._get_datas(context)
-        output = io.BytesIO()
+    def _get_datas(self, context):
+        return list(self._iter_datas(context))
+
+    def get_xlsx_export_stream(self, context):
+        """
+        Writes the whole workbook to a temporary file and returns it as a file
+        iterator. An xlsx file is a zip archive that xlsxwriter only assembles
+        in Workbook.close(), so nothing can be sent before every row has been
+        written: this keeps the memory bounded, but the first byte is only sent
+        once the export is complete.
+        """
+        datas = self._iter_datas(context)
+        # constant_memory flushes every finished row to disk, and the
+        # workbook itself is spooled to a temporary file instead of BytesIO.
+        output = tempfile.TemporaryFile()
         export_header = (
             self.request.GET.get('export_xlsx_header', 'off') == 'on')
 
         model_name = self.opts.verbose_name
-        book = xlsxwriter.Workbook(output)
+        book = xlsxwriter.Workbook(output, {'constant_memory': True})
         sheet = book.add_worksheet(
             u"%s %s" % (_(u'Sheet'), force_text(model_name)))
         styles = {'datetime': book.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'}),
@@ -105,7 +310,7 @@ class ExportPlugin(BaseAdminPlugin):
                   'default': book.add_format()}
 
         if not export_header:
-            datas = datas[1:]
+            next(datas)
         for rowx, row in enumerate(datas):
             for colx, value in enumerate(row):
                 if export_header and rowx == 0:
@@ -123,7 +328,10 @@ class ExportPlugin(BaseAdminPlugin):
         book.close()
 
         output.seek(0)
-        return output.getvalue()
+        return FileWrapper(output)
+
+    def get_xlsx_export(self, context):
+        return b''.join(self.get_xlsx_export_stream(context))
 
     def get_xls_export(self, context):
         datas = self._get_datas(context)
@@ -171,17 +379,17 @@ class ExportPlugin(BaseAdminPlugin):
             t = '"%s"' % t
         return t
 
-    def get_csv_export(self, context):
-        datas = self._get_datas(context)
-        stream = []
+    def get_csv_export_stream(self, context):
+        datas = self._iter_datas(context)
 
         if self.request.GET.get('export_csv_header', 'off') != 'on':
-            datas = datas[1:]
+            next(datas)
 
-        for row in datas:
-            stream.append(','.join(map(self._format_csv_text, row)))
+        for i, row in enumerate(datas):
+            yield (i and '\r\n' or '') + ','.join(map(self._format_csv_text, row))
 
-        return '\r\n'.join(stream)
+    def get_csv_export(self, context):
+        return ''.join(self.get_csv_export_stream(context))
 
     def _to_xml(self, xml, data):
         if isinstance(data, (list, tuple)):
@@ -213,28 +421,48 @@ class ExportPlugin(BaseAdminPlugin):
 
         return stream.getvalue().split('\n')[1]
 
+    def get_json_export_stream(self, context):
+        # Produces the same text as json.dumps({'objects': [...]}) one object at a time.
+        indent = (self.request.GET.get('export_json_format', 'off') == 'on') and 4 or None
+        if indent:
+            head, sep, tail = '{\n    "objects": [\n', ',\n', '\n    ]\n}'
+        else:
+            head, sep, tail = '{"objects": [', ', ', ']}'
+        empty = True
+        for i, obj in enumerate(self._iter_objects(context)):
+            text = json.dumps(obj, ensure_ascii=False, indent=indent)
+            if indent:
+                text = '        ' + text.replace('\n', '\n        ')
+            yield (i and sep or head) + text
+            empty = False
+        if empty:
+            yield json.dumps({'objects': []}, ensure_ascii=False, indent=indent)
+        else:
+            yield tail
+
     def get_json_export(self, context):
-        results = self._get_objects(context)
-        return json.dumps({'objects': results}, ensure_ascii=False,
-                          indent=(self.request.GET.get('export_json_format', 'off') == 'on') and 4 or None)
+        return ''.join(self.get_json_export_stream(context))
 
     def get_response(self, response, context, *args, **kwargs):
         file_type = self.request.GET.get('export_type', 'csv')
-        response = HttpResponse(
-            content_type="%s; charset=UTF-8" % self.export_mimes[file_type])
+        if self._is_stream_export():
+            response = StreamingHttpResponse(
+                getattr(self, 'get_%s_export_stream' % file_type)(context),
+                content_type="%s; charset=UTF-8" % self.export_mimes[file_type])
+        else:
+            response = HttpResponse(
+                content_type="%s; charset=UTF-8" % self.export_mimes[file_type])
+            response.write(getattr(self, 'get_%s_export' % file_type)(context))
 
         file_name = self.opts.verbose_name.replace(' ', '_')
         response['Content-Disposition'] = ('attachment; filename=%s.%s' % (
             file_name, file_type)).encode('utf-8')
-
-        response.write(getattr(self, 'get_%s_export' % file_type)(context))
         return response
 
     # View Methods
-    def get_result_list(self, __):
-        if self.request.GET.get('all', 'off') == 'on':
-            self.admin_view.list_per_page = sys.maxsize
-        return __()
+    def results(self, __):
+        # rows are read by _iter_values, the ResultRow list of the page is not needed
+        return []
 
     def result_header(self, item, field_name, row):
         item.export = not item.attr or field_name == '__str__' or getattr(item.attr, 'allow_export', True)
@@ -8,13 +8,14 @@ from django.core.exceptions import SuspiciousOperation, ImproperlyConfigured, Va
 from django.db import models
 from django.db.models.fields import FieldDoesNotExist
 from django.db.models.sql.query import LOOKUP_SEP, QUERY_TERMS
+from django.http import HttpResponse, HttpResponseNotFound
 from django.template import loader
 from django.utils import six
 from django.utils.encoding import smart_str
 from django.utils.translation import ugettext as _
 
 from xadmin.filters import manager as filter_manager, FILTER_PREFIX, SEARCH_VAR, DateFieldListFilter, \
-    RelatedFieldSearchFilter
+    RelatedFieldSearchFilter, MultiSelectFieldListFilter, FILTER_CHOICES_VAR
 from xadmin.sites import site
 from xadmin.views import BaseAdminPlugin, ListAdminView
 from xadmin.util import is_related_field
@@ -205,6 +206,25 @@ class FilterPlugin(BaseAdminPlugin):
         else:
             return queryset
 
+    def get_result_list(self, __):
+        choices_param = self.request.GET.get(FILTER_CHOICES_VAR)
+        if choices_param is None:
+            return __()
+        # ajax request of a lazy multiselect filter: render only that filter with its choices,
+        # the list itself is not queried
+        query = self.request.GET.copy()
+        del query[FILTER_CHOICES_VAR]
+        self.request.GET = query
+        self.admin_view.params.pop(FILTER_CHOICES_VAR, None)
+        self.admin_view.filter_choices_param = choices_param
+        self.admin_view.get_list_queryset()
+        specs = list(self.filter_specs) + list(
+            getattr(self.admin_view, 'quickfilter', {}).get('filter_specs', []))
+        for spec in specs:
+            if isinstance(spec, MultiSelectFieldListFilter) and spec.choices_param == choices_param:
+                return HttpResponse(str(spec))
+        return HttpResponseNotFound()
+
     # Media
     def get_media(self, media):
         arr = filter(lambda s: isinstance(s, DateFieldListFilter), self.filter_specs)
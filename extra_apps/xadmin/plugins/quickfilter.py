@@ -19,6 +19,7 @@ class QuickFilterMultiSelectFieldListFilter(MultiSelectFieldListFilter):
      
     """
     template = 'xadmin/filters/quickfilter.html'
+    choices_param_prefix = 'quick:'
 
 class QuickFilterPlugin(BaseAdminPlugin):
     """ Add a filter menu to the left column of the page """
@@ -109,6 +110,7 @@ class QuickFilterPlugin(BaseAdminPlugin):
                 field_parts = []
                 sort_key = None 
                 cache_config = None
+                lazy = None
                 
                 if type(list_quick_filter)==dict and 'field' in list_quick_filter:
                     field = list_quick_filter['field']
@@ -120,6 +122,8 @@ class QuickFilterPlugin(BaseAdminPlugin):
                         sort_key = list_quick_filter['sort']
                     if 'cache' in list_quick_filter and type(list_quick_filter)==dict:
                         cache_config = list_quick_filter['cache']
+                    if 'lazy' in list_quick_filter:
+                        lazy = list_quick_filter['lazy']
                         
                 else:        
                     field = list_quick_filter # This plugin only uses MultiselectFieldListFilter
@@ -128,7 +132,7 @@ class QuickFilterPlugin(BaseAdminPlugin):
                     field_path = field
                     field_parts = get_fields_from_path(self.model, field_path)
                     field = field_parts[-1]
-                spec = QuickFilterMultiSelectFieldListFilter(field, self.request, lookup_params,self.model, self.admin_view, field_path=field_path,field_order_by=field_order_by,field_limit=field_limit,sort_key=sort_key,cache_config=cache_config)
+                spec = QuickFilterMultiSelectFieldListFilter(field, self.request, lookup_params,self.model, self.admin_view, field_path=field_path,field_order_by=field_order_by,field_limit=field_limit,sort_key=sort_key,cache_config=cache_config,lazy=lazy)
                  
                 if len(field_parts)>1:
                     spec.title = "%s %s"%(field_parts[-2].name,spec.title) 
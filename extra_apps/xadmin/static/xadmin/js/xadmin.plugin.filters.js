@@ -3,9 +3,19 @@
   $(function(){
     
 	// filter
-    $('.filter-multiselect input[type=checkbox]').click(function(e){
+    $(document).on('click', '.filter-multiselect input[type=checkbox]', function(e){
     	window.location.href = $(this).parent().attr('href');
     });
+
+    // lazy multiselect filter, load the choices when the menu is opened
+    $(document).on('mouseenter click', '.dropdown-submenu.filter-multiselect[data-choices-url]', function(e){
+      var el = $(this);
+      var url = el.attr('data-choices-url');
+      el.removeAttr('data-choices-url');
+      $.get(url, function(html){
+        el.find('> .dropdown-menu').replaceWith($(html).find('> .dropdown-menu'));
+      });
+    });
     
     // menber filter
     $('.filter-number .remove').click(function(e){
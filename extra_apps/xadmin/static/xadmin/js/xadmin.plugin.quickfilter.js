@@ -29,14 +29,26 @@
 	$(v).nextUntil('li.nav-header').last().show();
   }
   
-  $.each($('.nav-quickfilter li.nav-header'),function(i,v){
+  function initShowMore(i,v){
 	  if ($(v).nextUntil('li.nav-header').size()>max) {
 		$(v).nextUntil('li.nav-header').filter(function(i){return !$(this).find('input').is(':checked');}).slice(max).hide();
   		addShowMore($,v);
 	  }
+  }
+  $.each($('.nav-quickfilter li.nav-header'),initShowMore);
+
+  // lazy filters, replace the header and the selected values with the loaded filter
+  $.each($('.nav-quickfilter li.nav-header[data-choices-url]'),function(i,v){
+	$.get($(v).attr('data-choices-url'),function(html){
+		var items = $(html).filter('li');
+		$(v).nextUntil('li.nav-header').remove();
+		$(v).replaceWith(items);
+		items.find('[data-toggle=tooltip]').tooltip();
+		initShowMore(0,items.filter('li.nav-header')[0]);
+	});
   });
   
-  $('.nav-quickfilter li.nav-header').on('click',function(e) {
+  $('.nav-quickfilter').on('click','li.nav-header',function(e) {
 	  e.preventDefault();
 	  e.stopPropagation();
 	  $('.nav-quickfilter li.nav-header i').toggleClass('icon-chevron-right');
@@ -315,6 +315,23 @@ def lookup_field(name, obj, model_admin=None):
     return f, attr, value
 
 
+def lookup_column_field(opts, name):
+    """
+    Return the concrete model field a list_display ``name`` refers to, or
+    None when the column is a method, property, relation lookup or
+    many-to-many field and can only be read from a model instance.
+    """
+    if callable(name) or name in ('__str__', '__unicode__'):
+        return None
+    try:
+        f = opts.get_field(name)
+    except models.FieldDoesNotExist:
+        return None
+    if not f.concrete or f.many_to_many:
+        return None
+    return f
+
+
 def admin_urlname(value, arg):
     return 'xadmin:%s_%s_%s' % (value.app_label, value.model_name, arg)
 
@@ -1,9 +1,12 @@
 from __future__ import absolute_import
+import hashlib
 from collections import OrderedDict
-from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
-from django.core.paginator import InvalidPage, Paginator
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ObjectDoesNotExist, EmptyResultSet
+from django.core.paginator import InvalidPage, EmptyPage, PageNotAnInteger, Paginator, Page
 from django.core.urlresolvers import NoReverseMatch
-from django.db import models
+from django.db import models, connections
+from django.utils.functional import cached_property
 from django.http import HttpResponseRedirect
 from django.template.response import SimpleTemplateResponse, TemplateResponse
 from django.utils import six
@@ -97,6 +100,150 @@ class ResultHeader(ResultItem):
         self.url_toggle = None
 
 
+class LimitedCountPage(Page):
+
+    def has_next(self):
+        if self.paginator.count_exact:
+            return super(LimitedCountPage, self).has_next()
+        return self.paginator.has_next_page
+
+
+class LimitedCountPaginator(Paginator):
+    """
+    Paginator that does not run an exact COUNT(*) over large tables.
+
+    Rows are counted up to count_limit only. When there are more rows, or
+    when the list is unfiltered and the table statistics report more than
+    count_limit rows, count_exact is False: count is a lower bound (or the
+    statistics estimate when count_estimated is True) and pages are only
+    reachable with next/previous links. Counts of unfiltered lists are cached
+    for cache_timeout seconds.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True,
+                 count_limit=10000, cache_timeout=300):
+        super(LimitedCountPaginator, self).__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.count_limit = count_limit
+        self.cache_timeout = cache_timeout
+        self.has_next_page = False
+
+    def _get_page(self, *args, **kwargs):
+        return LimitedCountPage(*args, **kwargs)
+
+    @cached_property
+    def _count_info(self):
+        """
+        Returns (count, count_exact, count_estimated).
+        """
+        queryset = self.object_list
+        unfiltered = isinstance(queryset, models.QuerySet) and not queryset.query.where
+        key = None
+        if unfiltered and self.cache_timeout:
+            try:
+                sql = str(queryset.order_by().query)
+            except EmptyResultSet:
+                sql = None
+            if sql is not None:
+                key = 'xadmin_count:%s' % hashlib.md5((u'%s|%s|%s' % (
+                    queryset.db, self.count_limit, sql)).encode('utf-8')).hexdigest()
+                info = cache.get(key)
+                if info is not None:
+                    return info
+
+        estimate = self.estimate_table_rows() if unfiltered else None
+        if estimate is not None and estimate > self.count_limit:
+            info = (estimate, False, True)
+        else:
+            # at most count_limit + 1 rows are counted, more rows only mean "more than count_limit"
+            if isinstance(queryset, models.QuerySet):
+                count = queryset[:self.count_limit + 1].count()
+            else:
+                count = len(queryset[:self.count_limit + 1])
+            if count > self.count_limit:
+                info = (self.count_limit, False, False)
+            else:
+                info = (count, True, False)
+        if key is not None:
+            cache.set(key, info, self.cache_timeout)
+        return info
+
+    def estimate_table_rows(self):
+        """
+        Row count of the table from the database statistics (MySQL, PostgreSQL),
+        None when the backend has none.
+        """
+        connection = connections[self.object_list.db]
+        table = self.object_list.model._meta.db_table
+        if connection.vendor == 'mysql':
+            sql = ('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                   'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s')
+        elif connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)'
+        else:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [connection.ops.quote_name(table) if connection.vendor == 'postgresql' else table])
+            row = cursor.fetchone()
+        if not row or row[0] is None or row[0] <= 0:
+            return None
+        return int(row[0])
+
+    @property
+    def count_exact(self):
+        return self._count_info[1]
+
+    @property
+    def count_estimated(self):
+        return self._count_info[2]
+
+    @cached_property
+    def count(self):
+        return self._count_info[0]
+
+    def validate_number(self, number):
+        if self.count_exact:
+            return super(LimitedCountPaginator, self).validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number):
+        if self.count_exact:
+            return super(LimitedCountPaginator, self).page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        # one more row tells whether there is a next page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        self.has_next_page = len(object_list) > self.per_page
+        return self._get_page(object_list[:self.per_page], number, self)
+
+
+_limited_count_paginators = {}
+
+
+def limited_count_paginator(paginator_class):
+    """
+    Returns a subclass of paginator_class that counts and pages like
+    LimitedCountPaginator, so a custom paginator_class is kept when
+    list_count_limit is set.
+    """
+    if issubclass(paginator_class, LimitedCountPaginator):
+        return paginator_class
+    if issubclass(LimitedCountPaginator, paginator_class):
+        # the default Paginator
+        return LimitedCountPaginator
+    if paginator_class not in _limited_count_paginators:
+        _limited_count_paginators[paginator_class] = type(
+            str('LimitedCount%s' % paginator_class.__name__), (LimitedCountPaginator, paginator_class), {})
+    return _limited_count_paginators[paginator_class]
+
+
 class ListAdminView(ModelAdminView):
     """
     Display models objects view. this class has ordering and simple filter features.
@@ -110,6 +257,11 @@ class ListAdminView(ModelAdminView):
     list_exclude = ()
     search_fields = ()
     paginator_class = Paginator
+    # Count at most this many rows (LimitedCountPaginator) instead of an exact COUNT(*),
+    # larger lists are browsed with next/previous links. None always counts exactly.
+    list_count_limit = None
+    # Seconds the count of an unfiltered list is cached when list_count_limit is set
+    list_count_cache_timeout = 300
     ordering = None
 
     # Change list templates
@@ -175,8 +327,11 @@ class ListAdminView(ModelAdminView):
 
         # Get the number of objects, with admin filters applied.
         self.result_count = self.paginator.count
+        # False when result_count is only a lower bound or an estimate (see LimitedCountPaginator)
+        self.result_count_exact = getattr(self.paginator, 'count_exact', True)
+        self.result_count_estimated = getattr(self.paginator, 'count_estimated', False)
 
-        self.can_show_all = self.result_count <= self.list_max_show_all
+        self.can_show_all = self.result_count_exact and self.result_count <= self.list_max_show_all
         self.multi_page = self.result_count > self.list_per_page
 
         # Get the list of objects to display on this page.
@@ -192,8 +347,11 @@ class ListAdminView(ModelAdminView):
                         'title': _('Database error'),
                     })
                 return HttpResponseRedirect(self.request.path + '?' + ERROR_FLAG + '=1')
-        self.has_more = self.result_count > (
-            self.list_per_page * self.page_num + len(self.result_list))
+        if self.result_count_exact:
+            self.has_more = self.result_count > (
+                self.list_per_page * self.page_num + len(self.result_list))
+        else:
+            self.has_more = self.paginator.has_next_page
 
     @filter_hook
     def get_result_list(self):
@@ -226,7 +384,8 @@ class ListAdminView(ModelAdminView):
                         pass
                     else:
                         if isinstance(field.rel, models.ManyToOneRel):
-                            related_fields.append(field_name)
+                            # field_name may be the attname, e.g. 'category_id'
+                            related_fields.append(field.name)
                 if related_fields:
                     queryset = queryset.select_related(*related_fields)
             else:
@@ -420,6 +579,11 @@ class ListAdminView(ModelAdminView):
 
     @filter_hook
     def get_paginator(self):
+        if self.list_count_limit:
+            paginator_class = limited_count_paginator(self.paginator_class)
+            return paginator_class(self.list_queryset, self.list_per_page, 0, True,
+                                   count_limit=self.list_count_limit,
+                                   cache_timeout=self.list_count_cache_timeout)
         return self.paginator_class(self.list_queryset, self.list_per_page, 0, True)
 
     @filter_hook
@@ -619,8 +783,16 @@ class ListAdminView(ModelAdminView):
 
         pagination_required = (
             not self.show_all or not self.can_show_all) and self.multi_page
+        previous_url = next_url = None
         if not pagination_required:
             page_range = []
+        elif not self.result_count_exact:
+            # the number of pages is unknown, only link the neighbouring pages
+            page_range = [page_num]
+            if page_num > 0:
+                previous_url = self.get_query_string({PAGE_VAR: page_num - 1})
+            if self.has_more:
+                next_url = self.get_query_string({PAGE_VAR: page_num + 1})
         else:
             ON_EACH_SIDE = {'normal': 5, 'small': 3}.get(page_type, 3)
             ON_ENDS = 2
@@ -655,6 +827,8 @@ class ListAdminView(ModelAdminView):
             'cl': self,
             'pagination_required': pagination_required,
             'show_all_url': need_show_all_link and self.get_query_string({ALL_VAR: ''}),
+            'previous_url': previous_url,
+            'next_url': next_url,
             'page_range': map(self.get_page_number, page_range),
             'ALL_VAR': ALL_VAR,
             '1': 1,